@@ -2,17 +2,21 @@
 import re
 import time
 import asyncio
+import inspect
 from functools import partial
 from datetime import datetime, timedelta
 import configparser
-from telegram import Update, Bot
-from telegram.ext import Application, CommandHandler, MessageHandler, ContextTypes, filters, ApplicationBuilder
+from telegram import Update
+from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, ContextTypes, filters, ApplicationBuilder
 from telegram.error import BadRequest
 from telegram.error import NetworkError
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 import logging
 
-from config import read_config, write_backup_path, write_chat_id, get_config_values, reload_config
+from config import read_config, write_backup_path, write_chat_id, get_config_values, reload_config, config_store, get_watch_settings, get_bot_settings, get_metrics_settings, get_backup_roots, get_schedules, get_missed_run_window
+from notification_scheduler import NotificationScheduler
+from update_pipeline import UpdatePipeline, poll_updates, start_webhook
+from metrics import instrument_command, start_metrics_server
 from logging_config import logger
 from backup_manager import (
     read_backup_path,
@@ -27,17 +31,25 @@ from backup_manager import (
     mtoday_backup_status,
     mbackup_status,
     backup_history,
+    backup_history_page,
+    stats_command,
+    disk_usage_command,
+    retention_command,
     today_backup_status,
-    backup_status
+    backup_status,
+    start_backup_watcher,
+    stop_backup_watchers,
+    invalidate_snapshot_cache,
+    take_backups_snapshot_async,
+    get_catalog
 )
 
-config = read_config()
-BACKUP_PATH_FILE, SERVER_LIST_ALLOWED, SERVER_LIST_DISALLOWED, CHAT_ID, TIME_NOTIFICATION = get_config_values()
-
 TIMEZONE = "МСК"
 
+# Интервал проверки изменений config.ini (в секундах)
+CONFIG_CHECK_INTERVAL = 30
+
 TOKEN = ""
-bot = Bot(TOKEN)
 
 # Функция, которая будет выполняться при команде /start
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -48,18 +60,21 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         "       Мониторинг резевных копий\n"
         "/backupstatus - Статус всех резервных копий\n"
         "/todaybackupstatus - Резервные копии за сегодня\n"
-        "/history <сервер> - История резервных копий сервера\n"
+        "/history <сервер> [база] [с дд.мм.гггг] [по дд.мм.гггг] - История резервных копий сервера\n"
+        "/diskusage [сервер] - Объём бэкапов, рост и аномалии размера\n"
+        "/retention [сервер] - Копии старше срока хранения\n"
         "       Мониторинг резевных копий (формат для android)\n"
         "/mbackupstatus - Статус резервных копий (моб. версия)\n"
         "/mtodaybackupstatus - Резервные копии за сегодня (моб. версия)\n"
         "       Системные команды\n"
         "/config - Показать настройки конфигурации\n"
         "/getgroupid - Получить и сохранить ID группы\n"
-        "/reloadconfig - Обновить информацию из файла config.ini\n\n"
+        "/reloadconfig - Обновить информацию из файла config.ini\n"
+        "/stats - Статистика сканирования и времени ответа на команды\n\n"
         
         "    Ежедневное оповещение ✅\n"
         "/notify - Отправить уведомление о статусе резервных копий\n\n"
-        "Бот ежедневно отправляет уведомления о статусе резервных копий, приоритет мониторинга в наличии бэкапов на конец предыдущего рабочего дня клиента. Соответственно, бэкапы проверяются начиная с 15:00 предыдущего дня."
+        "Бот ежедневно отправляет уведомления о статусе резервных копий, приоритет мониторинга в наличии бэкапов на конец предыдущего рабочего дня клиента. Соответственно, бэкапы проверяются начиная с 15:00 предыдущего дня (отдельные правила для серверов и баз задаются в секции [Freshness] файла config.ini)."
     )
     if update.message:
         await update.message.reply_text(message)
@@ -68,8 +83,33 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     
 # Асинхронная функция для обработки команды /reloadconfig
 async def reload_config_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    reload_config()
-    await update.message.reply_text("Конфигурация перезагружена. Чтобы изменить время ежедневного задания, необходимо внести изменения в файл config.ini и перезапустить бота.")
+    settings = reload_config()
+    invalidate_snapshot_cache()
+    if config_store.error:
+        await update.message.reply_text(f"Ошибка в config.ini: {config_store.error}. Используются прежние значения.")
+        return
+    await update.message.reply_text(f"Конфигурация перезагружена. Время ежедневного уведомления: {settings.time_notification}.")
+
+# Функция для разбора времени уведомления (HH:MM:SS), None - если значение отсутствует или некорректно
+def parse_notification_time(value):
+    if value is None:
+        logger.error("Ключ 'TIME_NOTIFICATION' не найден в секции 'Notification' конфигурационного файла.")
+        return None
+    try:
+        return datetime.strptime(value, '%H:%M:%S').time()
+    except ValueError:
+        logger.error("Неправильный формат времени в 'TIME_NOTIFICATION'. Ожидается формат HH:MM:SS.")
+        return None
+
+# Функция-обёртка для обработчика команды: значения из config.ini подставляются в момент вызова,
+# поэтому изменения файла применяются без перезапуска бота
+def with_current_config(handler, **kwargs):
+    parameters = inspect.signature(handler).parameters
+
+    async def call(update, context):
+        values = {name: value for name, value in config_store.current().handler_values().items() if name in parameters}
+        return await handler(update, context, **values, **kwargs)
+    return call
 
 # Асинхронная функция для обработки команды /config
 async def config_status(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -78,8 +118,9 @@ async def config_status(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     message = (
         f"Файл config.ini\n\n"
         f"[Paths]\n"
-        f"backup_path_file = {backup_path_file}\n\n"
-        f"[Servers]\n"
+        f"backup_path_file = {backup_path_file}\n"
+        + ''.join(f"root.{root['name']} = {root['path']}\n" for root in get_backup_roots(backup_path_file) if root['name'] != 'main')
+        + f"\n[Servers]\n"
         f"server_list_allowed = {', '.join(server_list_allowed)}\n"
         f"server_list_disallowed = {', '.join(server_list_disallowed)}\n\n"
         f"[Notification]\n"
@@ -106,95 +147,149 @@ async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
 #async def echo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     #await update.message.reply_text(update.message.text)
 
-async def main() -> None:
-    application = ApplicationBuilder().token(TOKEN).build() # telegram\ext_applicationbuilder.py:327: PTBUserWarning: Application instances should be built via the ApplicationBuilder.
+# base_url - другой адрес Bot API (локальный сервер Bot API или заглушка для нагрузочного теста)
+# stop_event - остановить приём update и завершить работу бота, когда событие установлено (по умолчанию бот работает до остановки процесса)
+async def main(token=TOKEN, base_url=None, stop_event=None) -> None:
+    builder = ApplicationBuilder().token(token)
+    if base_url:
+        builder = builder.base_url(base_url)
+    application = builder.build() # telegram\ext_applicationbuilder.py:327: PTBUserWarning: Application instances should be built via the ApplicationBuilder.
 
     # Настройка планировщика задач
     scheduler = AsyncIOScheduler()
 
+    # Текущие значения config.ini: обработчики и задача уведомления читают их в момент вызова
+    settings = config_store.current()
+
     # Чтение времени уведомления из конфигурационного файла
-    try:
-        notification_time_str = config['Notification']['TIME_NOTIFICATION']
-        notification_time = datetime.strptime(notification_time_str, '%H:%M:%S').time()
-    except KeyError:
-        logger.error("Ключ 'TIME_NOTIFICATION' не найден в секции 'Notification' конфигурационного файла.")
-        return
-    except ValueError:
-        logger.error("Неправильный формат времени в 'TIME_NOTIFICATION'. Ожидается формат HH:MM:SS.")
+    notification_time = parse_notification_time(settings.time_notification)
+    if notification_time is None:
         return
 
     # Чтение chat_id из конфигурационного файла
-    try:
-        chat_id = config['Notification']['CHAT_ID']
-    except KeyError:
+    if settings.chat_id is None:
         logger.error("Ключ 'CHAT_ID' не найден в секции 'Notification' конфигурационного файла.")
         return
 
-    # Функция для вызова уведомления через планировщик
-    async def scheduled_notify_backup_status(context: ContextTypes.DEFAULT_TYPE) -> None:
-        await notify_backup_status(context, BACKUP_PATH_FILE, SERVER_LIST_ALLOWED, SERVER_LIST_DISALLOWED, CHAT_ID, logger)
-
-    scheduled_notify_backup_status = partial(
-        notify_backup_status,
-        BACKUP_PATH_FILE=BACKUP_PATH_FILE,
-        SERVER_LIST_ALLOWED=SERVER_LIST_ALLOWED,
-        SERVER_LIST_DISALLOWED=SERVER_LIST_DISALLOWED,
-        CHAT_ID=CHAT_ID,
-        logger=logger
-    )
+    # Подготовка отчёта по расписанию: сканирование запускается заранее, за LEAD_TIME секунд до отправки
+    async def prepare_scheduled_report(schedule):
+        values = config_store.current().handler_values()
+        return await take_backups_snapshot_async(
+            values['BACKUP_PATH_FILE'], values['SERVER_LIST_ALLOWED'], values['SERVER_LIST_DISALLOWED'], logger
+        )
 
-    # Запуск уведомления в указанное время каждый день
-    scheduler.add_job(
-        scheduled_notify_backup_status,
-        trigger='cron',
-        hour=notification_time.hour,
-        minute=notification_time.minute,
-        second=notification_time.second,
-        kwargs={"context": {"application": application}}
+    # Отправка отчёта по расписанию: основное расписание рассылается по CHAT_ID и [Routing],
+    # расписание с CHAT_ID или SERVERS - в свой чат и только по своим серверам
+    async def send_scheduled_report(schedule, snapshot, missed):
+        values = config_store.current().handler_values()
+        routes = None
+        if schedule['chat_id'] is not None or schedule['servers'] is not None:
+            chat_id = schedule['chat_id'] or values['CHAT_ID']
+            routes = {chat_id: schedule['servers']} if chat_id else {}
+        await notify_backup_status({"application": application}, logger=logger, snapshot=snapshot, routes=routes, missed=missed, scope=schedule['name'], **values)
+
+    notifications = NotificationScheduler(
+        scheduler, prepare_scheduled_report, send_scheduled_report, get_catalog(), logger, get_missed_run_window()
     )
+    notifications.configure(get_schedules())
+
+    # При изменении config.ini кэш сбрасывается, а изменившиеся расписания переставляются без перезапуска бота
+    # Изменение может заметить любой поток (сканирование, отслеживание папок), обработчик вызывается в цикле событий бота
+    def on_config_changed(old, new):
+        invalidate_snapshot_cache()
+        notifications.missed_run_window = get_missed_run_window()
+        notifications.configure(get_schedules())
+
+    # Подписка снимается при остановке: main() может запускаться в одном процессе несколько раз (нагрузочный тест)
+    config_store.subscribe(on_config_changed, asyncio.get_running_loop())
+    try:
+        # Проверка изменений config.ini, даже если команды боту не приходят
+        async def check_config():
+            config_store.current()
+
+        scheduler.add_job(check_config, trigger='interval', seconds=CONFIG_CHECK_INTERVAL)
+
+        scheduler.start()
+
+        # Отчёты, пропущенные пока бот был выключен, отправляются одним сообщением на расписание
+        await notifications.catch_up()
+
+        # Отслеживание папок бэкапов в памяти: /backupstatus, /todaybackupstatus и уведомления не обращаются к диску
+        # Папки запускаются параллельно; папка, не ответившая за свой таймаут, не задерживает запуск бота
+        watch_enabled, watch_mode, watch_poll_interval = get_watch_settings()
+        if watch_enabled:
+            async def start_root_watcher(root):
+                if not read_backup_path(root['path'], logger):
+                    return
+                try:
+                    await asyncio.wait_for(
+                        asyncio.to_thread(start_backup_watcher, root['path'], watch_mode, watch_poll_interval, logger), root['timeout']
+                    )
+                except asyncio.TimeoutError:
+                    logger.warning(f"Папка бэкапов {root['name']} ({root['path']}): нет ответа за {root['timeout']:g} с, отслеживание не запущено")
+                except OSError as e:
+                    logger.warning(f"Отслеживание папки бэкапов {root['name']} ({root['path']}) не запущено: {e}")
+
+            await asyncio.gather(*(start_root_watcher(root) for root in get_backup_roots(settings.backup_path_file)))
+
+        # обработчики команд и сообщений
+        application.add_handler(CommandHandler("start", start))
+        application.add_handler(CommandHandler("backupstatus", with_current_config(backup_status, TIMEZONE=TIMEZONE, logger=logger)))
+        application.add_handler(CommandHandler("todaybackupstatus", with_current_config(today_backup_status, TIMEZONE=TIMEZONE, logger=logger)))
+        application.add_handler(CommandHandler("history", with_current_config(backup_history, logger=logger)))
+        application.add_handler(CallbackQueryHandler(partial(backup_history_page, logger=logger), pattern=r'^history:\d+$'))
+        application.add_handler(CommandHandler("diskusage", with_current_config(disk_usage_command, logger=logger)))
+        application.add_handler(CommandHandler("retention", with_current_config(retention_command, logger=logger)))
+        application.add_handler(CommandHandler("mbackupstatus", with_current_config(mbackup_status, logger=logger)))
+        application.add_handler(CommandHandler("mtodaybackupstatus", with_current_config(mtoday_backup_status, logger=logger)))
+
+        # application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, echo))
+        application.add_handler(CommandHandler("config", config_status))
+        application.add_handler(CommandHandler("getgroupid", get_group_chat_id))
+        application.add_handler(CommandHandler("reloadconfig", reload_config_command))
+
+        # Вывод оповещения вручную (вызов кода, который дублирует команду на оповещение через scheduler)
+        application.add_handler(CommandHandler("notify", with_current_config(notify_backup_command, logger=logger)))
+        application.add_handler(CommandHandler("stats", partial(stats_command, logger=logger)))
+        application.add_error_handler(error_handler)
+
+        # Замер времени обработки каждой команды (гистограммы для /metrics и /stats)
+        for handlers in application.handlers.values():
+            for handler in handlers:
+                if isinstance(handler, CommandHandler):
+                    handler.callback = instrument_command('/'.join(sorted(handler.commands)), handler.callback)
+
+        metrics_enabled, metrics_listen, metrics_port = get_metrics_settings()
+        if metrics_enabled:
+            await start_metrics_server(metrics_listen, metrics_port, logger)
+
+        # Инициализация приложения
+        await application.initialize()
+
+        # Update обрабатываются параллельно по разным чатам и по порядку внутри одного чата
+        bot_settings = get_bot_settings()
+        pipeline = UpdatePipeline(application, max_concurrency=bot_settings['max_concurrency'], logger=logger)
+        allowed_updates = ["message", "edited_channel_post", "callback_query"]
+
+        if bot_settings['mode'] == 'webhook':
+            server = await start_webhook(
+                application, pipeline, logger, allowed_updates,
+                bot_settings['webhook_url'], bot_settings['webhook_listen'], bot_settings['webhook_port'],
+                bot_settings['webhook_path'], bot_settings['secret_token'],
+            )
+            await (stop_event or asyncio.Event()).wait()
+            server.close()
+        else:
+            await application.bot.delete_webhook()
+            await poll_updates(application, pipeline, logger, allowed_updates, stop_event)
 
-    scheduler.start()
-
-    # обработчики команд и сообщений
-    application.add_handler(CommandHandler("start", start))
-    application.add_handler(CommandHandler("backupstatus", partial(backup_status, BACKUP_PATH_FILE=BACKUP_PATH_FILE, SERVER_LIST_ALLOWED=SERVER_LIST_ALLOWED, SERVER_LIST_DISALLOWED=SERVER_LIST_DISALLOWED, TIMEZONE=TIMEZONE, logger=logger)))
-    application.add_handler(CommandHandler("todaybackupstatus", partial(today_backup_status, BACKUP_PATH_FILE=BACKUP_PATH_FILE, SERVER_LIST_ALLOWED=SERVER_LIST_ALLOWED, SERVER_LIST_DISALLOWED=SERVER_LIST_DISALLOWED, TIMEZONE=TIMEZONE, logger=logger)))
-    application.add_handler(CommandHandler("history", partial(backup_history, BACKUP_PATH_FILE=BACKUP_PATH_FILE, logger=logger)))
-    application.add_handler(CommandHandler("mbackupstatus", partial(mbackup_status, BACKUP_PATH_FILE=BACKUP_PATH_FILE, SERVER_LIST_ALLOWED=SERVER_LIST_ALLOWED, SERVER_LIST_DISALLOWED=SERVER_LIST_DISALLOWED, logger=logger)))
-    application.add_handler(CommandHandler("mtodaybackupstatus", partial(mtoday_backup_status, BACKUP_PATH_FILE=BACKUP_PATH_FILE, SERVER_LIST_ALLOWED=SERVER_LIST_ALLOWED, SERVER_LIST_DISALLOWED=SERVER_LIST_DISALLOWED, logger=logger)))
-
-    # application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, echo))
-    application.add_handler(CommandHandler("config", config_status))
-    application.add_handler(CommandHandler("getgroupid", get_group_chat_id))
-    application.add_handler(CommandHandler("reloadconfig", reload_config_command))
-
-    # Вывод оповещения вручную (вызов кода, который дублирует команду на оповещение через scheduler)
-    application.add_handler(CommandHandler("notify", partial(notify_backup_command, BACKUP_PATH_FILE=BACKUP_PATH_FILE, SERVER_LIST_ALLOWED=SERVER_LIST_ALLOWED, SERVER_LIST_DISALLOWED=SERVER_LIST_DISALLOWED, logger=logger)))
-    application.add_error_handler(error_handler)
-
-    # Инициализация приложения
-    await application.initialize()
-
-    # Хранение смещения для регулярных update от Telegram API
-    offset = 0
-
-    async def get_updates():
-        nonlocal offset
-        while True:
-            try:
-                updates = await application.bot.get_updates(offset=offset, timeout=20, limit=100, allowed_updates=["message", "edited_channel_post", "callback_query"])
-                if updates:
-                    for update in updates:
-                        offset = update.update_id + 1
-                        await application.process_update(update)
-            except NetworkError as e:
-                logger.error(f"Произошла ошибка сети: {e}")
-                time.sleep(5)
-            except Exception as e:
-                logger.exception(f"Unexpected error: {e}")
-                time.sleep(5)
-
-    await get_updates()
+        # Остановка по stop_event: принятые update дообрабатываются, затем останавливаются планировщик и отслеживание папок
+        await pipeline.join()
+        scheduler.shutdown(wait=False)
+        stop_backup_watchers()
+        await application.shutdown()
+    finally:
+        config_store.unsubscribe(on_config_changed)
 
 if __name__ == '__main__':
     asyncio.run(main())
\ No newline at end of file
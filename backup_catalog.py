@@ -0,0 +1,447 @@
+import os
+import sqlite3
+import time
+import threading
+from concurrent.futures import as_completed
+from functools import partial
+
+from backup_records import BackupRecords
+
+# Каталог резервных копий в SQLite. Хранит разобранные имена файлов бэкапов
+# и mtime каждой просмотренной директории: при повторном сканировании
+# перечитываются только директории, у которых изменился mtime.
+# Вместе с mtime хранится время чтения директории: если директория читалась в пределах MTIME_GRANULARITY
+# секунд от своего mtime, файл мог появиться позже с тем же mtime (грубые mtime SMB/FAT, тот же тик часов),
+# поэтому такая директория перечитывается, пока её mtime не станет старше времени чтения на это окно.
+CATALOG_FILE = 'backup_catalog.db'
+
+# Точность mtime директорий в секундах (FAT и некоторые SMB-ресурсы хранят время с шагом 2 с)
+MTIME_GRANULARITY = 2
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS roots (
+    root TEXT PRIMARY KEY,
+    timestamp_source TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS directories (
+    path TEXT PRIMARY KEY,
+    parent TEXT,
+    root TEXT NOT NULL,
+    servername TEXT NOT NULL,
+    mtime REAL NOT NULL,
+    scanned_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_directories_parent ON directories(parent);
+CREATE INDEX IF NOT EXISTS idx_directories_root ON directories(root, servername);
+
+CREATE TABLE IF NOT EXISTS backups (
+    path TEXT PRIMARY KEY,
+    directory TEXT NOT NULL,
+    root TEXT NOT NULL,
+    servername TEXT NOT NULL,
+    dbname TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    date TEXT NOT NULL,
+    mtime REAL NOT NULL,
+    size INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_backups_directory ON backups(directory);
+CREATE INDEX IF NOT EXISTS idx_backups_latest ON backups(root, servername, dbname, mtime);
+CREATE INDEX IF NOT EXISTS idx_backups_history ON backups(root, servername, mtime);
+
+-- Агрегаты по директориям: число и размер бэкапов каждой БД в директории, пересчитываются только для изменившихся директорий
+CREATE TABLE IF NOT EXISTS directory_usage (
+    directory TEXT NOT NULL,
+    root TEXT NOT NULL,
+    servername TEXT NOT NULL,
+    dbname TEXT NOT NULL,
+    files INTEGER NOT NULL,
+    bytes INTEGER NOT NULL,
+    unknown INTEGER NOT NULL,
+    oldest REAL NOT NULL,
+    newest REAL NOT NULL,
+    PRIMARY KEY (directory, dbname)
+);
+CREATE INDEX IF NOT EXISTS idx_directory_usage_root ON directory_usage(root, servername);
+
+CREATE TABLE IF NOT EXISTS verifications (
+    path TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime REAL,
+    status TEXT NOT NULL,
+    error TEXT,
+    verified_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS notification_state (
+    scope TEXT NOT NULL,
+    servername TEXT NOT NULL,
+    dbname TEXT NOT NULL,
+    failing INTEGER NOT NULL,
+    since REAL NOT NULL,
+    reminded_at REAL,
+    PRIMARY KEY (scope, servername, dbname)
+);
+
+CREATE TABLE IF NOT EXISTS schedule_runs (
+    name TEXT PRIMARY KEY,
+    run_at REAL NOT NULL
+);
+'''
+
+
+# Функция для условия по одной или нескольким корневым папкам: ("root IN (?, ...)", [папки])
+def _roots_condition(backup_root_path):
+    roots = [backup_root_path] if isinstance(backup_root_path, str) else list(backup_root_path)
+    return f"root IN ({', '.join('?' * len(roots))})", [os.path.normpath(root) for root in roots]
+
+
+# Функция для подсчёта агрегатов директории по строкам бэкапов: {dbname: (files, bytes, unknown, oldest, newest)}
+def _aggregate_usage(rows):
+    usage = {}
+    for path, dir_path, root, servername, dbname, filename, date, mtime, size in rows:
+        files, total, unknown, oldest, newest = usage.get(dbname, (0, 0, 0, mtime, mtime))
+        if size is None:
+            unknown += 1
+        else:
+            total += size
+        usage[dbname] = (files + 1, total, unknown, min(oldest, mtime), max(newest, mtime))
+    return usage
+
+
+class BackupCatalog:
+    def __init__(self, db_path=CATALOG_FILE):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock:
+            self._conn.executescript(SCHEMA)
+            # Каталог, созданный до появления времени чтения директорий: такие директории перечитываются один раз
+            if 'scanned_at' not in [column[1] for column in self._conn.execute('PRAGMA table_info(directories)')]:
+                self._conn.execute('ALTER TABLE directories ADD COLUMN scanned_at REAL')
+            # Каталог, созданный до появления агрегатов: заполняем их один раз по уже сохранённым бэкапам
+            if self._conn.execute('SELECT 1 FROM directory_usage LIMIT 1').fetchone() is None:
+                with self._conn:
+                    self._conn.execute(
+                        'INSERT INTO directory_usage '
+                        'SELECT directory, root, servername, dbname, COUNT(*), COALESCE(SUM(size), 0), '
+                        'SUM(size IS NULL), MIN(mtime), MAX(mtime) FROM backups GROUP BY directory, dbname'
+                    )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # Функция для инкрементального пересканирования корневой папки бэкапов
+    # server_filter - функция servername -> bool, отбирающая сервера для сканирования
+    # executor - пул потоков: каждый сервер сканируется отдельной задачей, результаты записываются по мере готовности
+    # filename_timestamp - функция info -> epoch; если задана, время бэкапа берётся из имени файла без вызова stat
+    # stats - словарь, в который записываются счётчики сканирования по серверам (см. _scan_server)
+    def refresh(self, backup_root_path, parse_filename, server_filter=None, executor=None, filename_timestamp=None, stats=None):
+        backup_root_path = os.path.normpath(backup_root_path)
+        timestamp_source = 'mtime' if filename_timestamp is None else 'filename'
+
+        with self._lock, self._conn:
+            # При смене источника времени сохранённые строки не годятся - сканируем корень заново
+            row = self._conn.execute('SELECT timestamp_source FROM roots WHERE root = ?', (backup_root_path,)).fetchone()
+            if row is None or row[0] != timestamp_source:
+                self._conn.execute('DELETE FROM directories WHERE root = ?', (backup_root_path,))
+                self._conn.execute('DELETE FROM backups WHERE root = ?', (backup_root_path,))
+                self._conn.execute('DELETE FROM directory_usage WHERE root = ?', (backup_root_path,))
+                self._conn.execute('INSERT OR REPLACE INTO roots VALUES (?, ?)', (backup_root_path, timestamp_source))
+
+            known = {
+                path: (parent, servername, mtime, scanned_at)
+                for path, parent, servername, mtime, scanned_at in self._conn.execute(
+                    'SELECT path, parent, servername, mtime, scanned_at FROM directories WHERE root = ?',
+                    (backup_root_path,)
+                )
+            }
+
+        children = {}
+        for path, (parent, servername, mtime, scanned_at) in known.items():
+            children.setdefault(parent, []).append(path)
+
+        # Список серверов читаем всегда: это одна директория верхнего уровня
+        servers = []
+        with os.scandir(backup_root_path) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    servers.append(entry.name)
+        present = set(servers)
+        scanned = [servername for servername in servers if server_filter is None or server_filter(servername)]
+
+        scan = partial(self._scan_server, backup_root_path, known, children, parse_filename, filename_timestamp)
+        seen = set()
+        if executor is None:
+            for servername, (server_seen, changed, counters) in zip(scanned, map(scan, scanned)):
+                seen |= server_seen
+                self._store(backup_root_path, changed)
+                if stats is not None:
+                    stats[servername] = counters
+        else:
+            futures = {executor.submit(scan, servername): servername for servername in scanned}
+            for future in as_completed(futures):
+                server_seen, changed, counters = future.result()
+                seen |= server_seen
+                self._store(backup_root_path, changed)
+                if stats is not None:
+                    stats[futures[future]] = counters
+
+        # Удаляем директории исчезнувших серверов и пропавшие директории просканированных серверов
+        scanned = set(scanned)
+        removed = [
+            path for path, (parent, servername, mtime, scanned_at) in known.items()
+            if servername not in present or (servername in scanned and path not in seen)
+        ]
+        if removed:
+            with self._lock, self._conn:
+                for path in removed:
+                    self._conn.execute('DELETE FROM directories WHERE path = ?', (path,))
+                    self._conn.execute('DELETE FROM backups WHERE directory = ?', (path,))
+                    self._conn.execute('DELETE FROM directory_usage WHERE directory = ?', (path,))
+
+        return servers
+
+    # Функция для сканирования папки одного сервера
+    # Возвращает множество просмотренных директорий, список изменившихся директорий с найденными бэкапами
+    # и счётчики сканирования (считаются в локальных переменных, чтобы не замедлять цикл по файлам)
+    def _scan_server(self, backup_root_path, known, children, parse_filename, filename_timestamp, servername):
+        started = time.perf_counter()
+        directories = directories_read = files = matches = stat_calls = 0
+        seen = set()
+        changed = []  # (path, parent, servername, mtime, время чтения, rows)
+        stack = [(os.path.join(backup_root_path, servername), None)]
+        while stack:
+            dir_path, parent = stack.pop()
+            seen.add(dir_path)
+            directories += 1
+            stat_calls += 1
+            # Время чтения берётся до stat и scandir: всё, что изменится позже, попадёт в следующее сканирование
+            scanned_at = time.time()
+            try:
+                dir_mtime = os.stat(dir_path).st_mtime
+            except OSError:
+                dir_mtime = None
+
+            # Директория не менялась (или временно недоступна) - её файлы в каталоге актуальны,
+            # спускаемся в известные поддиректории.
+            # mtime совпадает, но прошлое чтение было в пределах MTIME_GRANULARITY от него - файл мог появиться
+            # после чтения с тем же mtime, директория перечитывается
+            previous = known.get(dir_path)
+            if previous is not None and (dir_mtime is None or (
+                previous[2] == dir_mtime and previous[3] is not None and previous[3] - dir_mtime > MTIME_GRANULARITY
+            )):
+                for child in children.get(dir_path, ()):
+                    stack.append((child, dir_path))
+                continue
+            if dir_mtime is None:
+                seen.discard(dir_path)
+                continue
+
+            rows = []
+            directories_read += 1
+            try:
+                with os.scandir(dir_path) as entries:
+                    for entry in entries:
+                        if entry.is_dir():
+                            stack.append((entry.path, dir_path))
+                            continue
+                        files += 1
+                        info = parse_filename(entry.name)
+                        if not info:
+                            continue
+                        matches += 1
+                        timestamp = filename_timestamp(info) if filename_timestamp is not None else None
+                        if timestamp is None:
+                            stat_calls += 1
+                            stat = entry.stat()
+                            timestamp, size = stat.st_mtime, stat.st_size
+                        else:
+                            size = None
+                        rows.append((
+                            entry.path, dir_path, backup_root_path, servername, info['dbname'],
+                            entry.name, info['date'], timestamp, size,
+                        ))
+            except OSError:
+                seen.discard(dir_path)
+                continue
+            changed.append((dir_path, parent, servername, dir_mtime, scanned_at, rows))
+
+        counters = {
+            'directories': directories, 'directories_read': directories_read, 'files': files,
+            'matches': matches, 'stat_calls': stat_calls, 'seconds': time.perf_counter() - started,
+        }
+        return seen, changed, counters
+
+    # Функция для записи изменившихся директорий в каталог
+    def _store(self, backup_root_path, changed):
+        if not changed:
+            return
+        with self._lock, self._conn:
+            for dir_path, parent, servername, dir_mtime, scanned_at, rows in changed:
+                self._conn.execute('DELETE FROM backups WHERE directory = ?', (dir_path,))
+                self._conn.executemany('INSERT OR REPLACE INTO backups VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+                self._conn.execute('DELETE FROM directory_usage WHERE directory = ?', (dir_path,))
+                self._conn.executemany(
+                    'INSERT INTO directory_usage VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    [(dir_path, backup_root_path, servername, dbname, *usage) for dbname, usage in _aggregate_usage(rows).items()]
+                )
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO directories VALUES (?, ?, ?, ?, ?, ?)',
+                    (dir_path, parent, backup_root_path, servername, dir_mtime, scanned_at)
+                )
+
+    # Функция для получения бэкапов корневой папки в виде столбцов BackupRecords
+    # Строки читаются курсором и сразу раскладываются по столбцам, без промежуточного списка кортежей
+    def records(self, backup_root_path, servername=None):
+        backup_root_path = os.path.normpath(backup_root_path)
+        query = 'SELECT servername, dbname, filename, date, mtime, size, directory FROM backups WHERE root = ?'
+        params = [backup_root_path]
+        if servername is not None:
+            query += ' AND servername = ?'
+            params.append(servername)
+        query += ' ORDER BY servername, mtime DESC'
+        records = BackupRecords()
+        with self._lock:
+            for row in self._conn.execute(query, params):
+                records.append(*row)
+        return records
+
+    # Функция для получения последнего бэкапа по каждой паре (сервер, БД),
+    # а также последнего бэкапа за указанную дату (по дате в имени файла)
+    def latest(self, backup_root_path, date):
+        backup_root_path = os.path.normpath(backup_root_path)
+        with self._lock:
+            return self._conn.execute(
+                'SELECT servername, dbname, filename, date, MAX(mtime), size, path FROM backups WHERE root = ? '
+                'GROUP BY servername, dbname '
+                'UNION ALL '
+                'SELECT servername, dbname, filename, date, MAX(mtime), size, path FROM backups WHERE root = ? AND date = ? '
+                'GROUP BY servername, dbname',
+                (backup_root_path, backup_root_path, date)
+            ).fetchall()
+
+    # Функция для получения страницы истории бэкапов сервера (от новых к старым)
+    # Фильтр по БД и диапазону времени [start, end) выполняется по индексу, в память попадает только одна страница
+    # backup_root_path - корневая папка или список папок (история сервера из всех папок)
+    def history_page(self, backup_root_path, servername, dbname=None, start=None, end=None, limit=20, offset=0):
+        where, params = _roots_condition(backup_root_path)
+        where += ' AND servername = ?'
+        params.append(servername)
+        if dbname is not None:
+            where += ' AND dbname = ?'
+            params.append(dbname)
+        if start is not None:
+            where += ' AND mtime >= ?'
+            params.append(start)
+        if end is not None:
+            where += ' AND mtime < ?'
+            params.append(end)
+        with self._lock:
+            total = self._conn.execute(f'SELECT COUNT(*) FROM backups WHERE {where}', params).fetchone()[0]
+            rows = self._conn.execute(
+                f'SELECT filename, dbname, mtime, size FROM backups WHERE {where} ORDER BY mtime DESC LIMIT ? OFFSET ?',
+                params + [limit, offset]
+            ).fetchall()
+        return total, rows
+
+    # Функция для получения сохранённых результатов проверки архивов: {path: (size, mtime, status, error)}
+    # Результаты для файлов, которых больше нет в каталоге, удаляются
+    def verifications(self):
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM verifications WHERE path NOT IN (SELECT path FROM backups)')
+            return {
+                path: (size, mtime, status, error)
+                for path, size, mtime, status, error in self._conn.execute(
+                    'SELECT path, size, mtime, status, error FROM verifications'
+                )
+            }
+
+    # Функция для сохранения результата проверки архива
+    def store_verification(self, path, size, mtime, status, error=None):
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO verifications VALUES (?, ?, ?, ?, ?, ?)',
+                (path, size, mtime, status, error, time.time())
+            )
+
+    # Функция для получения времени последней отправки по каждому расписанию уведомлений: {name: epoch}
+    def schedule_runs(self):
+        with self._lock:
+            return dict(self._conn.execute('SELECT name, run_at FROM schedule_runs'))
+
+    # Функция для сохранения времени отправки по расписанию
+    def store_schedule_run(self, name, run_at):
+        with self._lock, self._conn:
+            self._conn.execute('INSERT OR REPLACE INTO schedule_runs VALUES (?, ?)', (name, run_at))
+
+    # Функция для получения сохранённого состояния уведомлений: {(servername, dbname): (failing, since, reminded_at)}
+    # Пара без бэкапов (dbname = None) хранится с пустым именем БД
+    def notification_state(self, scope):
+        with self._lock:
+            return {
+                (servername, dbname or None): (bool(failing), since, reminded_at)
+                for servername, dbname, failing, since, reminded_at in self._conn.execute(
+                    'SELECT servername, dbname, failing, since, reminded_at FROM notification_state WHERE scope = ?', (scope,)
+                )
+            }
+
+    # Функция для сохранения изменившихся пар и удаления пропавших
+    def store_notification_state(self, scope, changed, removed=()):
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO notification_state VALUES (?, ?, ?, ?, ?, ?)',
+                [
+                    (scope, servername, dbname or '', int(failing), since, reminded_at)
+                    for (servername, dbname), (failing, since, reminded_at) in changed.items()
+                ]
+            )
+            self._conn.executemany(
+                'DELETE FROM notification_state WHERE scope = ? AND servername = ? AND dbname = ?',
+                [(scope, servername, dbname or '') for servername, dbname in removed]
+            )
+
+    # Функция для получения размеров бэкапов по парам (сервер, БД) из агрегатов директорий, без обращения к файлам
+    # Возвращает {(servername, dbname): (files, bytes, unknown, oldest, newest)}; unknown - файлы без известного размера
+    def usage(self, backup_root_path, servername=None):
+        where, params = _roots_condition(backup_root_path)
+        if servername is not None:
+            where += ' AND servername = ?'
+            params.append(servername)
+        with self._lock:
+            return {
+                (servername, dbname): usage
+                for servername, dbname, *usage in self._conn.execute(
+                    'SELECT servername, dbname, SUM(files), SUM(bytes), SUM(unknown), MIN(oldest), MAX(newest) '
+                    f'FROM directory_usage WHERE {where} GROUP BY servername, dbname',
+                    params
+                )
+            }
+
+    # Функция для получения размеров бэкапов не старше since: {(servername, dbname): [(mtime, size)]} по возрастанию mtime
+    def recent_sizes(self, backup_root_path, since, servername=None):
+        where, params = _roots_condition(backup_root_path)
+        where += ' AND mtime >= ? AND size IS NOT NULL'
+        params.append(since)
+        if servername is not None:
+            where += ' AND servername = ?'
+            params.append(servername)
+        sizes = {}
+        with self._lock:
+            for servername, dbname, mtime, size in self._conn.execute(
+                f'SELECT servername, dbname, mtime, size FROM backups WHERE {where} ORDER BY mtime', params
+            ):
+                sizes.setdefault((servername, dbname), []).append((mtime, size))
+        return sizes
+
+    # Функция для подсчёта бэкапов пары (сервер, БД) старше cutoff: (число, размер)
+    def stale(self, backup_root_path, servername, dbname, cutoff):
+        where, params = _roots_condition(backup_root_path)
+        with self._lock:
+            count, size = self._conn.execute(
+                f'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM backups WHERE {where} AND servername = ? AND dbname = ? AND mtime < ?',
+                params + [servername, dbname, cutoff]
+            ).fetchone()
+        return count, size
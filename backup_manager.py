@@ -1,8 +1,38 @@
 ﻿import os
 import re
+import time
+import logging
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from datetime import datetime, timedelta
 
+from backup_catalog import BackupCatalog
+from backup_snapshot import build_backup_snapshot, merge_snapshots
+from backup_watcher import BackupWatcher
+from result_cache import ResultCache
+from message_renderer import format_backup_status, format_backup_status_mobile, format_transition, format_size, render_status_rows, render_report, escape_markdown_v2
+from notification_sender import OutboundQueue
+from notification_state import NotificationState, FAILED, STILL_FAILING, RECOVERED
+from server_filter import compile_server_filter
+from freshness_policy import compile_freshness_policy
+from disk_usage import size_trend, size_anomaly, DAY
+from zip_verifier import ZipVerifier
+from metrics import REGISTRY, SCAN_DURATION, COMMAND_DURATION, COMMAND_ERRORS, SCAN_COUNTERS, record_scan
+from config import get_catalog_path, get_scan_workers, get_cache_ttl, get_timestamp_source, get_notification_routes, get_outbound_limits, get_verify_settings, get_backup_roots, get_delta_settings, get_freshness_rules, get_retention_rules, get_usage_settings
+
 TIMEZONE = 'МСК'
+HISTORY_PAGE_SIZE = 20
+HISTORY_QUERIES_KEPT = 50
+
+_catalogs = {}
+_scan_executors = {}
+_watchers = {}
+_snapshot_cache = None
+_outbound_queue = None
+_zip_verifier = None
+_notification_state = None
+_state_commits = set()
 
 # Функция для чтения пути к резервным копиям
 def read_backup_path(BACKUP_PATH_FILE, logger):
@@ -16,11 +46,16 @@ def read_backup_path(BACKUP_PATH_FILE, logger):
         logger.error(f"Нет доступа к пути {BACKUP_PATH_FILE}. Проверьте права доступа.")
         return None
 
-# Функция для парсинга имени файла бэкапа
+# Шаблон имени файла бэкапа, компилируется один раз при загрузке модуля
 # Обновление шаблона от 24.06.2024 "SERVER-DATABASE_dd-mm-yyyy_hh_nn_ss.zip"
+BACKUP_FILENAME_PATTERN = re.compile(r'^(?P<servername>[^-]+)-(?P<dbname>[^-]+)_(?P<date>\d{2}-\d{2}-\d{4})_(?P<time>\d{2}_\d{2}_\d{2})\.zip$') # SERVER-DATABASE_dd-mm-yyyy_hh_nn_ss
+
+# Функция для парсинга имени файла бэкапа
 def parse_backup_filename(filename):
-    pattern = r'^(?P<servername>[^-]+)-(?P<dbname>[^-]+)_(?P<date>\d{2}-\d{2}-\d{4})_(?P<time>\d{2}_\d{2}_\d{2})\.zip$' # SERVER-DATABASE_dd-mm-yyyy_hh_nn_ss
-    match = re.match(pattern, filename)
+    # Дешёвая проверка расширения отсекает посторонние файлы до регулярного выражения
+    if not filename.endswith('.zip'):
+        return None
+    match = BACKUP_FILENAME_PATTERN.match(filename)
     if match:
         return {
             'servername': match.group('servername'),
@@ -30,276 +65,732 @@ def parse_backup_filename(filename):
         }
     return None
 
-# Функция для получения информации о последних бэкапах
-def get_latest_backups(backup_root_path, SERVER_LIST_ALLOWED, SERVER_LIST_DISALLOWED):
-    backup_info = {}
+# Функция для получения времени бэкапа из имени файла (epoch), None - если дата в имени некорректна
+def backup_filename_timestamp(info):
+    date, time = info['date'], info['time']  # dd-mm-yyyy, hh_nn_ss
+    try:
+        return datetime(
+            int(date[6:10]), int(date[3:5]), int(date[0:2]),
+            int(time[0:2]), int(time[3:5]), int(time[6:8]),
+        ).timestamp()
+    except ValueError:
+        return None
 
-    # Обрабатываем каждый сервер в корневой папке бэкапов
-    for servername in os.listdir(backup_root_path):
-        # Пропускаем сервера, которые не разрешены или запрещены для мониторинга
-        if servername in SERVER_LIST_DISALLOWED or (SERVER_LIST_ALLOWED and servername not in SERVER_LIST_ALLOWED):
-            continue
+# Функция для получения каталога бэкапов (один экземпляр на файл каталога)
+def get_catalog(catalog_path=None):
+    catalog_path = catalog_path or get_catalog_path()
+    if catalog_path not in _catalogs:
+        _catalogs[catalog_path] = BackupCatalog(catalog_path)
+    return _catalogs[catalog_path]
+
+# Функция для закрытия всех открытых каталогов
+def close_catalogs():
+    for catalog in _catalogs.values():
+        catalog.close()
+    _catalogs.clear()
+
+# Функция для получения пула потоков сканирования корневой папки
+# У каждой папки из [Paths] свой пул (ROOT.<имя>.MAX_WORKERS), для остальных - [Scan] MAX_WORKERS
+def get_scan_executor(backup_root_path=None):
+    key = os.path.normpath(backup_root_path) if backup_root_path else None
+    executor = _scan_executors.get(key)
+    if executor is None:
+        max_workers = get_scan_workers()
+        for root in get_backup_roots() if key else ():
+            if os.path.normpath(root['path']) == key:
+                max_workers = root['max_workers']
+        executor = _scan_executors[key] = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='backup-scan')
+    return executor
+
+# Функция для получения снимка состояния бэкапов
+# Каталог обновляется один раз, затем все представления строятся за один проход по его строкам
+def take_backup_snapshot(backup_root_path, SERVER_LIST_ALLOWED, SERVER_LIST_DISALLOWED, servername=None):
+    # Списки компилируются в множества и шаблоны один раз на набор значений
+    server_filter = compile_server_filter(SERVER_LIST_ALLOWED, SERVER_LIST_DISALLOWED)
+
+    # В режиме отслеживания последние бэкапы берутся из памяти, без обращения к диску
+    timestamp_source = get_timestamp_source()
+    watcher = _watchers.get(os.path.normpath(backup_root_path))
+    if watcher is not None and servername is None:
+        snapshot = watcher.snapshot(server_filter, server_filter.names)
+    else:
+        # Обновляем каталог: перечитываются только изменившиеся директории
+        servers = refresh_backup_catalog(backup_root_path, server_filter)
+        records = get_catalog().records(backup_root_path, servername)
+        snapshot = build_backup_snapshot(records, servers, server_filter, server_filter.names)
+
+    if timestamp_source == 'filename_mtime':
+        verify_snapshot_mtime(snapshot, backup_root_path)
+    annotate_verification(snapshot)
+    return snapshot
+
+# Функция для получения снимка по данным каталога, без обращения к папке бэкапов
+# Используется, когда папка недоступна или не ответила вовремя: показываются данные последнего сканирования
+def take_catalog_snapshot(backup_root_path, SERVER_LIST_ALLOWED, SERVER_LIST_DISALLOWED):
+    server_filter = compile_server_filter(SERVER_LIST_ALLOWED, SERVER_LIST_DISALLOWED)
+    records = get_catalog().records(backup_root_path)
+    snapshot = build_backup_snapshot(records, records.servers, server_filter, server_filter.names)
+    annotate_verification(snapshot)
+    return snapshot
+
+# Функция для инкрементального обновления каталога бэкапов
+# Длительность и счётчики сканирования по серверам записываются в метрики
+def refresh_backup_catalog(backup_root_path, server_filter=None):
+    filename_timestamp = get_filename_timestamp(get_timestamp_source())
+    stats = {}
+    started = time.perf_counter()
+    servers = get_catalog().refresh(backup_root_path, parse_backup_filename, server_filter, get_scan_executor(backup_root_path), filename_timestamp, stats)
+    record_scan(time.perf_counter() - started, stats)
+    return servers
+
+# Функция для выбора функции времени бэкапа по источнику времени из config.ini ([Scan] TIMESTAMP_SOURCE)
+# None означает, что время берётся из mtime файла
+def get_filename_timestamp(timestamp_source):
+    return None if timestamp_source == 'mtime' else backup_filename_timestamp
+
+# Функция для проверки mtime только у выбранных по имени файла последних бэкапов
+# Один stat на пару (сервер, БД) вместо stat на каждый файл
+def verify_snapshot_mtime(snapshot, backup_root_path=None):
+    infos = {id(info): info for info in list(snapshot.latest.values()) + list(snapshot.today.values()) if info.get('path')}
+
+    def stat_info(info):
+        try:
+            stat = os.stat(info['path'])
+        except OSError:
+            return
+        info['mtime'] = stat.st_mtime
+        info['size'] = stat.st_size
+
+    list(get_scan_executor(backup_root_path).map(stat_info, infos.values()))
+
+# Функция для запуска отслеживания папки бэкапов (inotify или периодическое сканирование)
+def start_backup_watcher(backup_root_path, mode, poll_interval, logger):
+    backup_root_path = os.path.normpath(backup_root_path)
+
+    def load_rows():
+        servers = refresh_backup_catalog(backup_root_path)
+        return servers, get_catalog().latest(backup_root_path, datetime.now().strftime('%d-%m-%Y'))
+
+    filename_timestamp = get_filename_timestamp(get_timestamp_source())
+    watcher = BackupWatcher(backup_root_path, parse_backup_filename, load_rows, mode, poll_interval, logger, filename_timestamp)
+    watcher.start()
+    _watchers[backup_root_path] = watcher
+    return watcher
+
+# Функция для остановки всех отслеживаний
+def stop_backup_watchers():
+    for watcher in _watchers.values():
+        watcher.stop()
+    _watchers.clear()
+
+# Функция для получения кэша снимков (время жизни задаётся в config.ini, [Cache] TTL)
+def get_snapshot_cache():
+    global _snapshot_cache
+    if _snapshot_cache is None:
+        _snapshot_cache = ResultCache(get_cache_ttl())
+    return _snapshot_cache
+
+# Функция для сброса кэша снимков (например, после изменения конфигурации)
+def invalidate_snapshot_cache():
+    if _snapshot_cache is not None:
+        _snapshot_cache.invalidate()
+
+# Функция для получения проверки архивов (None, если проверка отключена в config.ini, [Verify] ENABLED)
+def get_zip_verifier():
+    global _zip_verifier
+    if _zip_verifier is None:
+        enabled, workers, bandwidth_mb = get_verify_settings()
+        if not enabled:
+            return None
+        _zip_verifier = ZipVerifier(get_catalog(), workers, bandwidth_mb * 1024 * 1024, logging.getLogger(__name__))
+    return _zip_verifier
+
+# Функция для режима без бота: у архивов показываются сохранённые результаты проверки, новые проверки не запускаются
+# Иначе процесс отчёта не завершится, пока не будет дочитан архив, проверка которого уже началась
+def use_stored_verifications():
+    global _zip_verifier
+    enabled, workers, bandwidth_mb = get_verify_settings()
+    if enabled:
+        _zip_verifier = ZipVerifier(get_catalog(), logger=logging.getLogger(__name__), background=False)
+
+# Функция для отметки результата проверки архива у последних бэкапов снимка
+# Непроверенные архивы ставятся в фоновую очередь проверки, ответ бота их не ждёт
+# Если время бэкапа берётся из имени файла, результат проверки ищется по настоящим размеру и mtime архива (stat)
+def annotate_verification(snapshot):
+    verifier = get_zip_verifier()
+    if verifier is not None:
+        verifier.annotate(snapshot.latest, get_timestamp_source() != 'mtime')
+
+# Функция для получения состояния разностных уведомлений (хранится в каталоге)
+def get_notification_state(remind_days):
+    global _notification_state
+    if _notification_state is None:
+        _notification_state = NotificationState(get_catalog(), remind_days)
+    _notification_state.remind_days = remind_days
+    return _notification_state
+
+# Функция для получения очереди исходящих сообщений (лимиты задаются в config.ini, [Outbound])
+def get_outbound_queue(bot, logger=None):
+    global _outbound_queue
+    if _outbound_queue is None or _outbound_queue.bot is not bot:
+        global_rate, chat_rate, group_rate_per_minute = get_outbound_limits()
+        _outbound_queue = OutboundQueue(bot, global_rate, chat_rate, group_rate_per_minute, logger)
+    return _outbound_queue
+
+# Функция для получения значений кэша снимков и очереди отправки для /metrics
+def collect_runtime_metrics():
+    values = []
+    if _snapshot_cache is not None:
+        stats = _snapshot_cache.stats()
+        values.append(('backup_cache_hits', 'Ответов из кэша снимков', stats['hits']))
+        values.append(('backup_cache_misses', 'Сканирований при промахе кэша', stats['misses']))
+        values.append(('backup_cache_coalesced', 'Запросов, дождавшихся уже идущего сканирования', stats['coalesced']))
+        values.append(('backup_cache_entries', 'Снимков в кэше', stats['entries']))
+    if _zip_verifier is not None:
+        values.append(('backup_verify_verified', 'Проверено целых архивов', _zip_verifier.verified))
+        values.append(('backup_verify_corrupt', 'Найдено повреждённых архивов', _zip_verifier.corrupt))
+        values.append(('backup_verify_pending', 'Архивов в очереди проверки', _zip_verifier.pending))
+        values.append(('backup_verify_bytes_read', 'Прочитано байт при проверке', _zip_verifier.bytes_read))
+    if _outbound_queue is not None:
+        values.append(('bot_outbound_sent', 'Отправлено сообщений через очередь', _outbound_queue.sent))
+        values.append(('bot_outbound_failed', 'Не удалось отправить сообщений', _outbound_queue.failed))
+        values.append(('bot_outbound_retried', 'Повторов отправки', _outbound_queue.retried))
+        values.append(('bot_outbound_pending', 'Сообщений в очереди', _outbound_queue.pending))
+    return values
+
+REGISTRY.add_collector(collect_runtime_metrics)
+
+# Асинхронная функция для получения снимка: сканирование выполняется в потоке, не блокируя цикл событий
+# Результат кэшируется по корневой папке и спискам серверов, одновременные запросы ждут одно сканирование
+async def take_backup_snapshot_async(backup_root_path, SERVER_LIST_ALLOWED, SERVER_LIST_DISALLOWED, servername=None):
+    # Снимок из памяти отслеживания дешевле обращения к кэшу и всегда актуален
+    # Он тоже строится в потоке: в режиме filename_mtime у последних бэкапов проверяется mtime (stat)
+    if servername is None and os.path.normpath(backup_root_path) in _watchers:
+        return await asyncio.to_thread(take_backup_snapshot, backup_root_path, SERVER_LIST_ALLOWED, SERVER_LIST_DISALLOWED)
+
+    key = (os.path.normpath(backup_root_path), tuple(SERVER_LIST_ALLOWED), tuple(SERVER_LIST_DISALLOWED), servername)
+    compute = partial(asyncio.to_thread, take_backup_snapshot, backup_root_path, SERVER_LIST_ALLOWED, SERVER_LIST_DISALLOWED, servername)
+    snapshot = await get_snapshot_cache().get(key, compute)
+    # Снимок из кэша мог быть построен до окончания проверки архивов - обновляем отметки
+    # (в режимах filename и filename_mtime - в потоке, так как для них вызывается stat)
+    if get_timestamp_source() == 'mtime':
+        annotate_verification(snapshot)
+    else:
+        await asyncio.to_thread(annotate_verification, snapshot)
+    return snapshot
+
+# Асинхронная функция для получения общего снимка по всем корневым папкам бэкапов ([Paths])
+# Папки сканируются параллельно, каждая со своим таймаутом. Медленная или недоступная папка не задерживает ответ:
+# для неё используются данные последнего сканирования из каталога, и она отмечается в snapshot.degraded
+# Возвращает None, если папки не настроены или ни одна не доступна и данных о бэкапах нет
+async def take_backups_snapshot_async(BACKUP_PATH_FILE, SERVER_LIST_ALLOWED, SERVER_LIST_DISALLOWED, logger=None):
+    roots = get_backup_roots(BACKUP_PATH_FILE)
+    if not roots:
+        return None
+
+    async def take_root_snapshot(root):
+        try:
+            return await asyncio.wait_for(
+                take_backup_snapshot_async(root['path'], SERVER_LIST_ALLOWED, SERVER_LIST_DISALLOWED), root['timeout']
+            )
+        except asyncio.TimeoutError:
+            reason = f"нет ответа за {root['timeout']:g} с"
+        except OSError as e:
+            reason = e.strerror or str(e)
+        if logger:
+            logger.warning(f"Папка бэкапов {root['name']} ({root['path']}): {reason}. Используются данные последнего сканирования.")
+        snapshot = await asyncio.to_thread(take_catalog_snapshot, root['path'], SERVER_LIST_ALLOWED, SERVER_LIST_DISALLOWED)
+        snapshot.degraded[root['name']] = reason
+        return snapshot
+
+    snapshot = merge_snapshots(await asyncio.gather(*(take_root_snapshot(root) for root in roots)))
+    if len(snapshot.degraded) == len(roots) and not any(info.get('path') for info in snapshot.latest.values()):
+        return None
+    return snapshot
 
-        server_path = os.path.join(backup_root_path, servername)
-        if os.path.isdir(server_path):
-            found_backup = False  # Флаг для отслеживания наличия бэкапов для текущего сервера
-
-            # Проходим по всем файлам в директории сервера
-            for root, dirs, files in os.walk(server_path):
-                for backup in files:
-                    backup_path = os.path.join(root, backup)
-                    info = parse_backup_filename(backup)
-                    if info:
-                        key = (servername, info['dbname'])
-                        file_mtime = os.path.getmtime(backup_path)
-                        backup_datetime = datetime.fromtimestamp(file_mtime)
-                        if key not in backup_info or backup_datetime > backup_info[key]['datetime']:
-                            backup_info[key] = {
-                                'filename': backup,
-                                'datetime': backup_datetime,
-                                'date': info['date'],
-                            }
-                        found_backup = True  # Устанавливаем флаг, если нашли хотя бы один бэкап
-
-            # Если для текущего сервера не было найдено ни одного бэкапа
-            if not found_backup:
-                backup_info[(servername, None)] = {
-                    'filename': None,
-                    'datetime': None,
-                    'date': None,
-                }
-
-    # Добавляем информацию для серверов из SERVER_LIST_ALLOWED, для которых не найдено ни одного бэкапа
-    for servername in SERVER_LIST_ALLOWED:
-        if not any(key[0] == servername for key in backup_info.keys()):
-            backup_info[(servername, None)] = {
-                'filename': None,
-                'datetime': None,
-                'date': None,
-            }
-
-    return backup_info
+# Функция для добавления к заголовку отчёта предупреждения о недоступных папках бэкапов
+def degraded_header(header, snapshot):
+    lines = [header]
+    for name, reason in snapshot.degraded.items():
+        lines.append(f"⚠️ Папка бэкапов {name}: {reason}. Показаны данные последнего сканирования.")
+    return '\n'.join(lines)
 
+# Функция для получения информации о последних бэкапах
+def get_latest_backups(backup_root_path, SERVER_LIST_ALLOWED, SERVER_LIST_DISALLOWED):
+    return take_backup_snapshot(backup_root_path, SERVER_LIST_ALLOWED, SERVER_LIST_DISALLOWED).latest
 
 # Функция для получения информации о бэкапах за сегодня
 def get_today_backups(backup_root_path, SERVER_LIST_ALLOWED, SERVER_LIST_DISALLOWED):
-    today = datetime.now().strftime('%d-%m-%Y')
-    backup_info = {}
-
-    for servername in os.listdir(backup_root_path):
-        if servername in SERVER_LIST_DISALLOWED or (SERVER_LIST_ALLOWED and servername not in SERVER_LIST_ALLOWED):
-            continue
-        server_path = os.path.join(backup_root_path, servername)
-        if os.path.isdir(server_path):
-            for root, dirs, files in os.walk(server_path):
-                for backup in files:
-                    backup_path = os.path.join(root, backup)
-                    info = parse_backup_filename(backup)
-                    if info and info['date'] == today:
-                        key = (servername, info['dbname'])
-                        file_mtime = os.path.getmtime(backup_path)
-                        backup_datetime = datetime.fromtimestamp(file_mtime)
-                        if key not in backup_info or backup_datetime > backup_info[key]['datetime']:
-                            backup_info[key] = {
-                                'filename': backup,
-                                'datetime': backup_datetime,
-                                'date': info['date'],
-                            }
-
-    return backup_info
+    return take_backup_snapshot(backup_root_path, SERVER_LIST_ALLOWED, SERVER_LIST_DISALLOWED).today
 
 # Функция для получения истории резервных копий
 def get_backup_history(backup_root_path, servername):
-    history = []
-    server_path = os.path.join(backup_root_path, servername)
-    if os.path.isdir(server_path):
-        for root, dirs, files in os.walk(server_path):
-            for backup in files:
-                backup_path = os.path.join(root, backup)
-                file_mtime = os.path.getmtime(backup_path)
-                backup_datetime = datetime.fromtimestamp(file_mtime)
-                parsed_filename = parse_backup_filename(backup)
-                if parsed_filename:
-                    dbname = parsed_filename['dbname']
-                    history.append((backup, dbname, backup_datetime))
-    history.sort(key=lambda x: x[2], reverse=True)
-    return history
-
-# Функция для форматирования статуса бэкапа
-def format_backup_status(servername, dbname, datetime, timezone):
-    if datetime is not None:
-        date_str = datetime.strftime('%d.%m.%Y %H:%M:%S')
-    else:
-        date_str = "НЕТ"
-    return f"{servername:<15} | БД: {dbname if dbname else 'Неизвестно':<20} | {date_str}"
-
-
-# Функция для форматирования статуса бэкапа (мобильная версия)
-def format_backup_status_mobile(servername, dbname, datetime):
-    if datetime is not None:
-        date_str = datetime.strftime('%d.%m.%Y')
-    else:
-        date_str = "НЕТ"
-    return f"{servername[:10]:<10}|{dbname if dbname else 'Неизвестно'[:10]:<10}|{date_str}"
+    if not os.path.isdir(os.path.join(backup_root_path, servername)):
+        return []
+    return take_backup_snapshot(backup_root_path, [servername], [], servername).history(servername)
+
+# Функция для оценки свежести бэкапов по правилам [Freshness] (по умолчанию - не раньше 15:00 предыдущего дня)
+# Возвращает {(servername, dbname): (свежий ли, просрочка в секундах или None)}
+def evaluate_freshness(backups, now=None):
+    return compile_freshness_policy(get_freshness_rules()).evaluate(backups, now)
+
+# Функция для отбора свежих бэкапов
+def get_recent_backups(backups, freshness=None):
+    if freshness is None:
+        freshness = evaluate_freshness(backups)
+    return {key: info for key, info in backups.items() if freshness[key][0]}
+
+# Функция для оценки бэкапов: {(servername, dbname): True, если бэкап свежий и архив не повреждён}
+def evaluate_backup_health(backups):
+    recent_backups = get_recent_backups(backups)
+    return {
+        key: key in recent_backups and recent_backups[key].get('verification') != 'corrupt'
+        for key in backups
+    }
+
+# Функция для формирования разностного уведомления: сводка и только изменившиеся пары (сервер, БД)
+# servers - ограничить уведомление этими серверами (для рассылки по маршрутам)
+def generate_delta_message(snapshot, transitions, health, servers=None):
+    if servers is not None:
+        transitions = [transition for transition in transitions if transition.key[0] in servers]
+        health = {key: ok for key, ok in health.items() if key[0] in servers}
+    failing = sum(1 for ok in health.values() if not ok)
+    summary = f"Бэкапов: {len(health)}, в порядке: {len(health) - failing}, с ошибками: {failing}."
+
+    if not transitions:
+        header = f"{'✅' if not failing else '❌'} Без изменений. {summary}"
+        return [escape_markdown_v2(degraded_header(header, snapshot) + '\nПолный отчёт: /notify')]
+
+    labels = {FAILED: 'новых ошибок', STILL_FAILING: 'не исправлено', RECOVERED: 'восстановлено'}
+    counts = [f"{label} {sum(1 for transition in transitions if transition.kind == kind)}" for kind, label in labels.items()
+              if any(transition.kind == kind for transition in transitions)]
+    header = f"{'✅' if not failing else '❌'} Изменения статуса резервных копий: {', '.join(counts)}. {summary}\nПолный отчёт: /notify"
+    order = {FAILED: 0, STILL_FAILING: 1, RECOVERED: 2}
+    now = time.time()
+    freshness = evaluate_freshness({transition.key: snapshot.latest.get(transition.key) for transition in transitions}, now)
+    rows = []
+    for transition in sorted(transitions, key=lambda transition: order[transition.kind]):
+        servername, dbname = transition.key
+        info = snapshot.latest.get(transition.key)
+        days = int((now - transition.since) // 86400) if transition.since is not None else None
+        rows.append(format_transition(
+            transition.kind, servername, dbname, info['datetime'] if info else None, TIMEZONE, days,
+            info.get('verification') if info else None, freshness[transition.key][1]
+        ))
+    return render_report(degraded_header(header, snapshot), rows, markdown_v2=True)
 
 # Функция для обработки резервных копий и генерации сообщения
-def generate_backup_message(path, SERVER_LIST_ALLOWED, SERVER_LIST_DISALLOWED, logger):
-    now = datetime.now()
-    start_time = datetime.combine(now.date(), datetime.min.time()).replace(hour=15) - timedelta(days=1)
-
-    def is_recent_backup(backup_datetime):
-         return backup_datetime is not None and start_time <= backup_datetime <= now
-
-    today_backups = get_latest_backups(path, SERVER_LIST_ALLOWED, SERVER_LIST_DISALLOWED)
-    recent_backups = {key: info for key, info in today_backups.items() if is_recent_backup(info['datetime'])}
-
-    all_backups_present = True
-    message = '```\n'
-    for (servername, dbname), info in today_backups.items():
-        if (servername, dbname) in recent_backups:
-            recent_info = recent_backups[(servername, dbname)]
-            message += f"{servername:<15} | БД: {dbname:<20} | {recent_info['datetime'].strftime('%d.%m.%Y %H:%M:%S')}\n"
-        else:
-            message += f"{servername:<15} | БД: {dbname if dbname else 'Неизвестно':<20} | НЕТ\n"
-            all_backups_present = False
-    message += '```'
+# Возвращает список сообщений (MarkdownV2): большой отчёт разбивается по границам строк
+# servers - ограничить отчёт этими серверами (для рассылки по маршрутам)
+def generate_backup_message(path, SERVER_LIST_ALLOWED, SERVER_LIST_DISALLOWED, logger, snapshot=None, servers=None):
+    if snapshot is None:
+        snapshot = take_backup_snapshot(path, SERVER_LIST_ALLOWED, SERVER_LIST_DISALLOWED)
+    today_backups = snapshot.latest
+    if servers is not None:
+        today_backups = {key: info for key, info in today_backups.items() if key[0] in servers}
+    freshness = evaluate_freshness(today_backups)
+    recent_backups = get_recent_backups(today_backups, freshness)
+    overdue = {key: late for key, (fresh, late) in freshness.items() if late is not None}
+    # Повреждённый архив считается ошибкой резервного копирования, даже если он свежий
+    corrupt = any(info.get('verification') == 'corrupt' for info in recent_backups.values())
+    all_backups_present = len(recent_backups) == len(today_backups) and not corrupt
 
     if all_backups_present:
-        message = '✅📂🔒 Резервное копирование успешно. Работа системы продолжается без сбоев.\n' + message
+        header = '✅📂🔒 Резервное копирование успешно. Работа системы продолжается без сбоев.'
     else:
-        message = '❌📂⚠️ Выявлены ошибки при выполнении резервного копирования.\n' + message
-    
-    # Экранирование символов для MarkdownV2
-    message = message.replace('_', '\\_').replace('*', '\\*').replace('[', '\\[').replace(']', '\\]').replace('(', '\\(').replace(')', '\\)').replace('-', '\\-').replace('|', '\\|').replace('.', '\\.')
-    
-    return message
+        header = '❌📂⚠️ Выявлены ошибки при выполнении резервного копирования.'
+
+    rows = render_status_rows(today_backups, 'desktop', TIMEZONE, reference=recent_backups, overdue=overdue)
+    return render_report(degraded_header(header, snapshot), rows, markdown_v2=True)
+
+# Асинхронная функция для отправки ответа, разбитого на несколько сообщений
+async def reply_messages(update, messages, parse_mode):
+    for message in messages:
+        await update.message.reply_text(message, parse_mode=parse_mode)
 
 # Асинхронная функция для обработки команды /notify
 async def notify_backup_command(update, context, BACKUP_PATH_FILE, SERVER_LIST_ALLOWED, SERVER_LIST_DISALLOWED, logger):
-    path = read_backup_path(BACKUP_PATH_FILE, logger)
-
-    if not path:
+    snapshot = await take_backups_snapshot_async(BACKUP_PATH_FILE, SERVER_LIST_ALLOWED, SERVER_LIST_DISALLOWED, logger)
+    if snapshot is None:
         await update.message.reply_text('Путь к бэкапам не установлен. Используйте команду /pathbackup для установки пути.')
         return
 
-    message = generate_backup_message(path, SERVER_LIST_ALLOWED, SERVER_LIST_DISALLOWED, logger)
-    await update.message.reply_text(message, parse_mode='MarkdownV2')
+    messages = generate_backup_message(BACKUP_PATH_FILE, SERVER_LIST_ALLOWED, SERVER_LIST_DISALLOWED, logger, snapshot)
+    await reply_messages(update, messages, 'MarkdownV2')
 
-# Асинхронная функция для уведомлений по расписанию
-async def notify_backup_status(context, BACKUP_PATH_FILE, SERVER_LIST_ALLOWED, SERVER_LIST_DISALLOWED, CHAT_ID, logger):
-    path = read_backup_path(BACKUP_PATH_FILE, logger)
+# Асинхронная функция для сохранения состояния уведомлений после доставки отчёта
+# Если хотя бы одно сообщение не доставлено, состояние не меняется и переходы попадут в следующий отчёт
+async def commit_after_delivery(state, scope, changes, futures, logger):
+    results = await asyncio.gather(*futures, return_exceptions=True)
+    if any(isinstance(result, BaseException) for result in results):
+        logger.warning(f"Отчёт расписания {scope} доставлен не во все чаты, изменения статуса будут отправлены повторно")
+        return
+    await asyncio.to_thread(state.commit, scope, changes)
 
-    if not path:
-        await context['application'].bot.send_message(CHAT_ID, 'Путь к бэкапам не установлен. Используйте команду /pathbackup для установки пути.')
+# Асинхронная функция для уведомлений по расписанию
+# snapshot - отчёт, подготовленный заранее (если не передан, папки сканируются сейчас)
+# routes - {chat_id: серверы или None}: получатели отчёта, по умолчанию CHAT_ID и маршруты из [Routing]
+# missed - сколько отправок было пропущено, пока бот не работал (перед отчётом отправляется предупреждение)
+# scope - имя расписания: если включены разностные уведомления ([Notification] DELTA), отправляются только изменения
+# статуса с прошлого отчёта этого расписания (первый отчёт - полная таблица), без изменений ничего не отправляется
+async def notify_backup_status(context, BACKUP_PATH_FILE, SERVER_LIST_ALLOWED, SERVER_LIST_DISALLOWED, CHAT_ID, logger, snapshot=None, routes=None, missed=0, scope=None):
+    if snapshot is None:
+        snapshot = await take_backups_snapshot_async(BACKUP_PATH_FILE, SERVER_LIST_ALLOWED, SERVER_LIST_DISALLOWED, logger)
+
+    if snapshot is None:
+        get_outbound_queue(context['application'].bot, logger).send(CHAT_ID, 'Путь к бэкапам не установлен. Используйте команду /pathbackup для установки пути.')
         return
 
-    message = generate_backup_message(path, SERVER_LIST_ALLOWED, SERVER_LIST_DISALLOWED, logger)
-    await context['application'].bot.send_message(CHAT_ID, message, parse_mode='MarkdownV2')
+    # Чаты группируются по набору серверов: отчёт формируется один раз на набор и рассылается всем его чатам
+    # CHAT_ID получает полный отчёт, чаты из [Routing] - только по своим серверам
+    if routes is None:
+        routes = {CHAT_ID: None} if CHAT_ID else {}
+        routes.update(get_notification_routes())
+    chats_by_servers = {}
+    for chat_id, servers in routes.items():
+        chats_by_servers.setdefault(servers, []).append(chat_id)
+
+    # Переходы вычисляются один раз по всем серверам, для каждого набора серверов отбираются свои
+    transitions = None
+    state = changes = None
+    delta_enabled, remind_days, send_unchanged = get_delta_settings()
+    if scope is not None and delta_enabled:
+        health = evaluate_backup_health(snapshot.latest)
+        state = get_notification_state(remind_days)
+        first, transitions, changes = await asyncio.to_thread(state.diff, scope, health)
+        if first:
+            transitions = None
+        elif not transitions and not send_unchanged:
+            await asyncio.to_thread(state.commit, scope, changes)
+            return
+
+    queue = get_outbound_queue(context['application'].bot, logger)
+    futures = []
+    if missed:
+        # Очередь сохраняет порядок сообщений в чате: предупреждение придёт перед отчётом
+        queue.send_many(list(routes), [f"Бот не работал во время отправки по расписанию (пропущено: {missed}). Ниже актуальный отчёт."], None)
+    for servers, chat_ids in chats_by_servers.items():
+        if servers is not None and not any(servername in servers for servername, _ in snapshot.latest):
+            logger.warning(f"Для чатов {', '.join(chat_ids)} не найдено ни одного сервера из {', '.join(servers)}")
+            continue
+        if transitions is None:
+            messages = generate_backup_message(BACKUP_PATH_FILE, SERVER_LIST_ALLOWED, SERVER_LIST_DISALLOWED, logger, snapshot, servers)
+        else:
+            messages = generate_delta_message(snapshot, transitions, health, servers)
+        # Отправка идёт в фоне с учётом лимитов Telegram, задача планировщика не ждёт её завершения
+        futures.extend(queue.send_many(chat_ids, messages, 'MarkdownV2'))
+
+    if state is not None:
+        # Состояние сохраняется фоновой задачей, когда все сообщения отчёта доставлены
+        task = asyncio.create_task(commit_after_delivery(state, scope, changes, futures, logger))
+        _state_commits.add(task)
+        task.add_done_callback(_state_commits.discard)
 
 
 # Асинхронная функция для проверки бэкапов за сегодня (мобильная версия)
 async def mtoday_backup_status(update, context, BACKUP_PATH_FILE, SERVER_LIST_ALLOWED, SERVER_LIST_DISALLOWED, logger):
-    path = read_backup_path(BACKUP_PATH_FILE, logger)
-    if not path:
+    # Один снимок на ответ: бэкапы за сегодня и последние бэкапы получаются за одно сканирование
+    snapshot = await take_backups_snapshot_async(BACKUP_PATH_FILE, SERVER_LIST_ALLOWED, SERVER_LIST_DISALLOWED, logger)
+    if snapshot is None:
         await update.message.reply_text('Путь к бэкапам не установлен. Используйте команду /pathbackup для установки пути.')
         return
-
-    today_backups = get_today_backups(path, SERVER_LIST_ALLOWED, SERVER_LIST_DISALLOWED)
-    all_backups = get_latest_backups(path, SERVER_LIST_ALLOWED, SERVER_LIST_DISALLOWED)
-    today_date = datetime.now().strftime('%d.%m.%Y')
-
-    message = 'Статус резервных копий на сегодня:\n```\n'
-    for (servername, dbname), info in all_backups.items():
-        if (servername, dbname) in today_backups:
-            today_info = today_backups[(servername, dbname)]
-            message += format_backup_status_mobile(servername, dbname, today_info['datetime']) + '\n'
-        else:
-            message += f"{servername[:10]:<10}|{dbname if dbname else 'Неизвестно'[:10]:<10}|НЕТ\n"
-    message += '```'
-
-    await update.message.reply_text(message, parse_mode='Markdown')
+    rows = render_status_rows(snapshot.latest, 'mobile', reference=snapshot.today)
+    await reply_messages(update, render_report(degraded_header('Статус резервных копий на сегодня:', snapshot), rows), 'Markdown')
 
 # Асинхронная функция для проверки статуса бэкапов (мобильная версия)
 async def mbackup_status(update, context, BACKUP_PATH_FILE, SERVER_LIST_ALLOWED, SERVER_LIST_DISALLOWED, logger):
-    path = read_backup_path(BACKUP_PATH_FILE, logger)
-    if not path:
+    snapshot = await take_backups_snapshot_async(BACKUP_PATH_FILE, SERVER_LIST_ALLOWED, SERVER_LIST_DISALLOWED, logger)
+    if snapshot is None:
         await update.message.reply_text('Путь к бэкапам не установлен. Используйте команду /pathbackup для установки пути.')
         return
 
-    backups = get_latest_backups(path, SERVER_LIST_ALLOWED, SERVER_LIST_DISALLOWED)
+    backups = snapshot.latest
 
     if backups:
-        message = 'Статус текущих резервных копий:\n```\n'
-        for (servername, dbname), info in backups.items():
-            message += format_backup_status_mobile(servername, dbname, info['datetime']) + '\n'
-        message += '```'
+        messages = render_report(degraded_header('Статус текущих резервных копий:', snapshot), render_status_rows(backups, 'mobile'))
     else:
-        message = 'Бэкапы не найдены.'
-
-    await update.message.reply_text(message, parse_mode='Markdown')
+        messages = ['Бэкапы не найдены.']
+
+    await reply_messages(update, messages, 'Markdown')
+
+# Функция для разбора аргументов /history: [база] [с дд.мм.гггг] [по дд.мм.гггг]
+# Возвращает (dbname, start, end), где start и end - epoch, конец диапазона включает весь указанный день
+def parse_history_args(args):
+    dbname = None
+    dates = []
+    for arg in args:
+        try:
+            dates.append(datetime.strptime(arg, '%d.%m.%Y'))
+        except ValueError:
+            if dbname is not None or dates:
+                raise
+            dbname = arg
+    if len(dates) > 2:
+        raise ValueError('too many dates')
+    start = dates[0].timestamp() if dates else None
+    end = (dates[1] + timedelta(days=1)).timestamp() if len(dates) > 1 else None
+    return dbname, start, end
+
+# Асинхронная функция для инкрементального пересканирования всех корневых папок перед запросом к каталогу
+# Недоступная папка не пересканируется, её бэкапы берутся из каталога по последнему сканированию
+async def refresh_backup_roots(roots, server_filter, logger):
+    async def refresh_root(root):
+        try:
+            await asyncio.wait_for(asyncio.to_thread(refresh_backup_catalog, root['path'], server_filter), root['timeout'])
+        except asyncio.TimeoutError:
+            logger.warning(f"Папка бэкапов {root['name']} ({root['path']}) не пересканирована: нет ответа за {root['timeout']:g} с")
+        except OSError as e:
+            logger.warning(f"Папка бэкапов {root['name']} ({root['path']}) не пересканирована: {e}")
+
+    await asyncio.gather(*(refresh_root(root) for root in roots))
+
+# Функция для формирования страницы истории и кнопок листания
+def render_history_page(query, page):
+    total, rows = get_catalog().history_page(
+        query['path'], query['servername'], query['dbname'], query['start'], query['end'],
+        HISTORY_PAGE_SIZE, page * HISTORY_PAGE_SIZE
+    )
+    servername = query['servername']
+    if not total:
+        return f"Нет данных о резервных копиях для сервера {servername}.", None
+
+    pages = (total + HISTORY_PAGE_SIZE - 1) // HISTORY_PAGE_SIZE
+    lines = [f"История резервных копий для сервера {servername} (стр. {page + 1} из {pages}, всего {total}):", '```']
+    for backup, dbname, mtime, size in rows:
+        lines.append(format_backup_status(servername, dbname, datetime.fromtimestamp(mtime), TIMEZONE))
+    lines.append('```')
+
+    buttons = []
+    if page > 0:
+        buttons.append(('◀️ Новее', f'history:{page - 1}'))
+    if page + 1 < pages:
+        buttons.append(('Старее ▶️', f'history:{page + 1}'))
+    return '\n'.join(lines), buttons
+
+# Функция для построения inline-клавиатуры (telegram импортируется только при отправке ответа)
+def build_inline_keyboard(buttons):
+    if not buttons:
+        return None
+    from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+    return InlineKeyboardMarkup([[InlineKeyboardButton(text, callback_data=data) for text, data in buttons]])
 
 # Асинхронная функция для получения истории резервных копий
 async def backup_history(update, context, BACKUP_PATH_FILE, logger):
-    path = read_backup_path(BACKUP_PATH_FILE, logger)
-    if not path:
+    roots = get_backup_roots(BACKUP_PATH_FILE)
+    if not roots:
         await update.message.reply_text('Путь к бэкапам не установлен. Используйте команду /pathbackup для установки пути.')
         return
 
+    usage = 'Использование: /history <servername> [база] [с дд.мм.гггг] [по дд.мм.гггг]'
     if len(context.args) == 0:
-        await update.message.reply_text('Использование: /history <servername>')
+        await update.message.reply_text(usage)
         return
 
     servername = context.args[0]
-    history = get_backup_history(path, servername)
+    try:
+        dbname, start, end = parse_history_args(context.args[1:])
+    except ValueError:
+        await update.message.reply_text(usage)
+        return
 
-    if history:
-        message = f"История резервных копий для сервера {servername}:\n```\n"
-        for backup, dbname, datetime in history:
-            message += format_backup_status(servername, dbname, datetime, TIMEZONE) + '\n'
-        message += '```'
-    else:
-        message = f"Нет данных о резервных копиях для сервера {servername}."
+    # История собирается из всех корневых папок
+    await refresh_backup_roots(roots, lambda name: name == servername, logger)
+    query = {'path': [root['path'] for root in roots], 'servername': servername, 'dbname': dbname, 'start': start, 'end': end}
+    message, buttons = await asyncio.to_thread(render_history_page, query, 0)
+    sent = await update.message.reply_text(message, parse_mode='Markdown', reply_markup=build_inline_keyboard(buttons))
+
+    # Параметры запроса хранятся в данных чата по id сообщения: callback_data ограничена 64 байтами
+    if buttons:
+        queries = context.chat_data.setdefault('history', {})
+        queries[sent.message_id] = query
+        while len(queries) > HISTORY_QUERIES_KEPT:
+            queries.pop(next(iter(queries)))
+
+# Асинхронная функция для листания истории (нажатие inline-кнопки)
+async def backup_history_page(update, context, logger):
+    callback_query = update.callback_query
+    page = int(callback_query.data.split(':', 1)[1])
+    query = context.chat_data.get('history', {}).get(callback_query.message.message_id)
+    if query is None:
+        await callback_query.answer('История устарела, повторите команду /history.')
+        return
 
-    await update.message.reply_text(message, parse_mode='Markdown')
+    message, buttons = await asyncio.to_thread(render_history_page, query, page)
+    await callback_query.answer()
+    await callback_query.edit_message_text(message, parse_mode='Markdown', reply_markup=build_inline_keyboard(buttons))
 
 # Асинхронная функция для проверки бэкапов за сегодня
 async def today_backup_status(update, context, BACKUP_PATH_FILE, SERVER_LIST_ALLOWED, SERVER_LIST_DISALLOWED, TIMEZONE, logger):
-    path = read_backup_path(BACKUP_PATH_FILE, logger)
-    if not path:
+    # Один снимок на ответ: бэкапы за сегодня и последние бэкапы получаются за одно сканирование
+    snapshot = await take_backups_snapshot_async(BACKUP_PATH_FILE, SERVER_LIST_ALLOWED, SERVER_LIST_DISALLOWED, logger)
+    if snapshot is None:
         await update.message.reply_text('Путь к бэкапам не установлен. Используйте команду /pathbackup для установки пути.')
         return
-
-    today_backups = get_today_backups(path, SERVER_LIST_ALLOWED, SERVER_LIST_DISALLOWED)
-    all_backups = get_latest_backups(path, SERVER_LIST_ALLOWED, SERVER_LIST_DISALLOWED)
-    today_date = datetime.now().strftime('%d.%m.%Y')
-
-    message = 'Статус резервных копий на сегодня:\n```\n'
-    for (servername, dbname), info in all_backups.items():
-        if (servername, dbname) in today_backups:
-            today_info = today_backups[(servername, dbname)]
-            message += format_backup_status(servername, dbname, today_info['datetime'], TIMEZONE) + '\n'
-        else:
-            message += f"{servername:<15} | БД: {dbname if dbname else 'Неизвестно':<20} | КОПИЯ ОТСУТСТВУЕТ\n"
-    message += '```'
-
-    await update.message.reply_text(message, parse_mode='Markdown')
+    rows = render_status_rows(snapshot.latest, 'desktop', TIMEZONE, reference=snapshot.today, missing='КОПИЯ ОТСУТСТВУЕТ')
+    await reply_messages(update, render_report(degraded_header('Статус резервных копий на сегодня:', snapshot), rows), 'Markdown')
 
 # Асинхронная функция для проверки статуса бэкапов
 async def backup_status(update, context, BACKUP_PATH_FILE, SERVER_LIST_ALLOWED, SERVER_LIST_DISALLOWED, TIMEZONE, logger):
-    path = read_backup_path(BACKUP_PATH_FILE, logger)
-    if not path:
+    snapshot = await take_backups_snapshot_async(BACKUP_PATH_FILE, SERVER_LIST_ALLOWED, SERVER_LIST_DISALLOWED, logger)
+    if snapshot is None:
         await update.message.reply_text('Путь к бэкапам не установлен. Используйте команду /pathbackup для установки пути.')
         return
 
-    backups = get_latest_backups(path, SERVER_LIST_ALLOWED, SERVER_LIST_DISALLOWED)
+    backups = snapshot.latest
 
     if backups:
-        message = 'Статус текущих резервных копий:\n```\n'
-        for (servername, dbname), info in backups.items():
-            message += format_backup_status(servername, dbname, info['datetime'], TIMEZONE) + '\n'
-        message += '```'
+        messages = render_report(degraded_header('Статус текущих резервных копий:', snapshot), render_status_rows(backups, 'desktop', TIMEZONE))
     else:
-        message = 'Бэкапы не найдены.'
+        messages = ['Бэкапы не найдены.']
+
+    await reply_messages(update, messages, 'Markdown')
+
+# Функция для формирования отчёта /diskusage по агрегатам каталога (файлы бэкапов не перечитываются)
+# Без servername - итоги по серверам, с servername - по базам сервера; в конце - аномалии размера последних бэкапов
+def render_disk_usage(paths, server_filter, servername=None):
+    trend_days, anomaly_days, anomaly_percent = get_usage_settings()
+    catalog = get_catalog()
+    now = time.time()
+    usage = catalog.usage(paths, servername)
+    if servername is None:
+        usage = {key: value for key, value in usage.items() if server_filter(key[0])}
+    if not usage:
+        return [f"Нет данных о резервных копиях для сервера {servername}." if servername else 'Бэкапы не найдены.']
+
+    sizes = catalog.recent_sizes(paths, now - max(trend_days, anomaly_days + 1) * DAY, servername)
+    trend_since = now - trend_days * DAY
+    groups = {}  # имя строки -> [файлов, байт, без размера, тренд байт/сутки]
+    anomalies = []
+    for (server, dbname), (files, total, unknown, oldest, newest) in sorted(usage.items()):
+        points = sizes.get((server, dbname), [])
+        trend = size_trend([point for point in points if point[0] >= trend_since])
+        anomaly = size_anomaly(points, anomaly_days, anomaly_percent)
+        if anomaly is not None:
+            change, median = anomaly
+            anomalies.append(
+                f"{server}/{dbname}: {format_size(points[-1][1])}, на {abs(change):.0f}% "
+                f"{'больше' if change > 0 else 'меньше'} медианы за {anomaly_days} дн. ({format_size(median)})"
+            )
+        group = groups.setdefault(dbname if servername else server, [0, 0, 0, None])
+        group[0] += files
+        group[1] += total
+        group[2] += unknown
+        if trend is not None:
+            group[3] = (group[3] or 0) + trend
+
+    rows = [f"{'База' if servername else 'Сервер':<20} {'Размер':>10} {'Файлов':>7} {'Рост/нед':>11}"]
+    for name, (files, total, unknown, trend) in groups.items():
+        growth = f"{'+' if trend >= 0 else '-'}{format_size(abs(trend) * 7)}" if trend is not None else '-'
+        rows.append(f"{name[:20]:<20} {format_size(total):>10} {files:>7} {growth:>11}")
+    rows.append(f"{'Всего':<20} {format_size(sum(group[1] for group in groups.values())):>10} {sum(group[0] for group in groups.values()):>7}")
+    unknown = sum(group[2] for group in groups.values())
+    if unknown:
+        rows.append(f"Размер неизвестен для {unknown} файлов (TIMESTAMP_SOURCE = filename)")
+    if anomalies:
+        rows.append('')
+        rows.append('Аномалии размера последнего бэкапа:')
+        rows.extend(anomalies)
+
+    header = f"Использование диска бэкапами сервера {servername}:" if servername else 'Использование диска бэкапами:'
+    return render_report(header, rows)
+
+# Функция для формирования отчёта /retention: копии старше срока хранения из [Retention] по парам (сервер, БД)
+# Число и размер устаревших копий запрашиваются из каталога только для пар, у которых самая старая копия старше срока
+def render_retention(paths, server_filter, servername=None):
+    retention = compile_freshness_policy(get_retention_rules(), 'off', 'Retention')
+    catalog = get_catalog()
+    now = time.time()
+    usage = catalog.usage(paths, servername)
+    if servername is None:
+        usage = {key: value for key, value in usage.items() if server_filter(key[0])}
+    if not usage:
+        return [f"Нет данных о резервных копиях для сервера {servername}." if servername else 'Бэкапы не найдены.']
+
+    rows = [f"{'Сервер':<15} {'База':<15} {'Срок':>6} {'Старейшая':>10} {'Лишних':>7} {'Размер':>10}"]
+    stale_files = stale_bytes = 0
+    for (server, dbname), (files, total, unknown, oldest, newest) in sorted(usage.items()):
+        policy = retention.policy(server, dbname)
+        count = size = 0
+        if policy is not None:
+            cutoff = policy.window_start(now)
+            if oldest < cutoff:
+                count, size = catalog.stale(paths, server, dbname, cutoff)
+        stale_files += count
+        stale_bytes += size
+        rows.append(
+            f"{server[:15]:<15} {dbname[:15]:<15} {policy.text if policy else '-':>6} "
+            f"{datetime.fromtimestamp(oldest):%d.%m.%Y} {count:>7} {format_size(size) if count else '-':>10}"
+        )
+
+    header = f"Хранение бэкапов: копий старше срока хранения - {stale_files} ({format_size(stale_bytes)})."
+    return render_report(header, rows)
+
+# Асинхронная функция для обработки команд /diskusage и /retention: каталог обновляется инкрементально,
+# затем отчёт строится по агрегатам директорий
+async def usage_report(update, context, BACKUP_PATH_FILE, SERVER_LIST_ALLOWED, SERVER_LIST_DISALLOWED, logger, render):
+    roots = get_backup_roots(BACKUP_PATH_FILE)
+    if not roots:
+        await update.message.reply_text('Путь к бэкапам не установлен. Используйте команду /pathbackup для установки пути.')
+        return
 
-    await update.message.reply_text(message, parse_mode='Markdown')
+    servername = context.args[0] if context.args else None
+    server_filter = compile_server_filter(SERVER_LIST_ALLOWED, SERVER_LIST_DISALLOWED)
+    await refresh_backup_roots(roots, (lambda name: name == servername) if servername else server_filter, logger)
+    messages = await asyncio.to_thread(render, [root['path'] for root in roots], server_filter, servername)
+    await reply_messages(update, messages, 'Markdown')
+
+# Асинхронная функция для обработки команды /diskusage [сервер]
+async def disk_usage_command(update, context, BACKUP_PATH_FILE, SERVER_LIST_ALLOWED, SERVER_LIST_DISALLOWED, logger):
+    await usage_report(update, context, BACKUP_PATH_FILE, SERVER_LIST_ALLOWED, SERVER_LIST_DISALLOWED, logger, render_disk_usage)
+
+# Асинхронная функция для обработки команды /retention [сервер]
+async def retention_command(update, context, BACKUP_PATH_FILE, SERVER_LIST_ALLOWED, SERVER_LIST_DISALLOWED, logger):
+    await usage_report(update, context, BACKUP_PATH_FILE, SERVER_LIST_ALLOWED, SERVER_LIST_DISALLOWED, logger, render_retention)
+
+# Функция для формирования сводки метрик для команды /stats
+def render_stats():
+    rows = []
+    scans, scan_seconds = SCAN_DURATION.summary().get((), (0, 0))
+    rows.append(f"Сканирований: {scans}, среднее время: {scan_seconds / scans * 1000 if scans else 0:.0f} мс, p95 <= {_format_bound(SCAN_DURATION.quantile(0.95))}")
+
+    totals = {key: counter.values() for key, counter in SCAN_COUNTERS}
+    servers = sorted(servername for servername, in totals['directories'])
+    if servers:
+        rows.append('')
+        rows.append(f"{'Сервер':<15} {'Время, с':>9} {'Папок':>7} {'Файлов':>8} {'Бэкапов':>8} {'stat':>8}")
+        for servername in servers:
+            key = (servername,)
+            rows.append(
+                f"{servername[:15]:<15} {totals['seconds'].get(key, 0):>9.2f} {totals['directories'].get(key, 0):>7} "
+                f"{totals['files'].get(key, 0):>8} {totals['matches'].get(key, 0):>8} {totals['stat_calls'].get(key, 0):>8}"
+            )
+
+    commands = COMMAND_DURATION.summary()
+    if commands:
+        errors = COMMAND_ERRORS.values()
+        rows.append('')
+        rows.append(f"{'Команда':<20} {'Вызовов':>8} {'Среднее':>9} {'p95 <=':>8} {'Ошибок':>7}")
+        for (command,), (count, seconds) in sorted(commands.items()):
+            rows.append(
+                f"{command[:20]:<20} {count:>8} {seconds / count * 1000:>7.0f}мс {_format_bound(COMMAND_DURATION.quantile(0.95, command)):>8} "
+                f"{errors.get((command,), 0):>7}"
+            )
+
+    runtime = collect_runtime_metrics()
+    if runtime:
+        rows.append('')
+        for name, help_text, value in runtime:
+            rows.append(f"{help_text}: {value}")
+    return rows
+
+def _format_bound(seconds):
+    if seconds is None:
+        return '-'
+    if seconds == float('inf'):
+        return '>60с'
+    return f"{seconds * 1000:.0f}мс" if seconds < 1 else f"{seconds:g}с"
+
+# Асинхронная функция для обработки команды /stats
+async def stats_command(update, context, logger):
+    await reply_messages(update, render_report('Статистика работы бота:', render_stats()), 'Markdown')
 
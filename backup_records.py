@@ -0,0 +1,141 @@
+import os
+from array import array
+from datetime import datetime
+
+# Компактное хранение записей о бэкапах в памяти.
+# Имена серверов, БД, даты и директории хранятся один раз (интернируются) и в строках заменяются номерами,
+# время и размер - числа в массивах array, а не объекты datetime и словари на каждый файл.
+# Запросы последних бэкапов, бэкапов за дату и истории выполняются по столбцам.
+
+NO_SIZE = -1
+
+
+# Запись о бэкапе, возвращаемая запросами: поддерживает обращение как к словарю (info['datetime'], info.get('path'))
+class BackupRecord:
+    __slots__ = ('filename', 'date', 'mtime', 'size', 'path', 'verification')
+
+    def __init__(self, filename=None, date=None, mtime=None, size=None, path=None):
+        self.filename = filename
+        self.date = date
+        self.mtime = mtime
+        self.size = size
+        self.path = path
+        self.verification = None
+
+    @property
+    def datetime(self):
+        return datetime.fromtimestamp(self.mtime) if self.mtime is not None else None
+
+    def __getitem__(self, name):
+        try:
+            return getattr(self, name)
+        except AttributeError:
+            raise KeyError(name) from None
+
+    def __setitem__(self, name, value):
+        if name not in self.__slots__:
+            raise KeyError(name)
+        setattr(self, name, value)
+
+    def get(self, name, default=None):
+        value = getattr(self, name, None)
+        return default if value is None else value
+
+    def __repr__(self):
+        return f'BackupRecord({self.filename!r}, {self.date!r}, {self.mtime!r}, {self.size!r}, {self.path!r})'
+
+
+# Столбцы записей о бэкапах
+# Строки должны добавляться упорядоченными по серверу и от новых к старым (как их отдаёт каталог):
+# тогда строки одного сервера идут подряд, а первая строка для пары (сервер, БД) - последний бэкап
+class BackupRecords:
+    def __init__(self):
+        self.servers = []       # номер -> имя сервера
+        self.dbnames = []
+        self.dates = []
+        self.directories = []
+        self._ids = ({}, {}, {}, {})  # имя -> номер для каждого из списков выше
+
+        self.server = array('I')
+        self.db = array('I')
+        self.date = array('I')
+        self.directory = array('I')
+        self.mtime = array('d')  # время бэкапа, секунды epoch с дробной частью, как в каталоге
+        self.size = array('q')   # NO_SIZE, если размер не известен
+        self.filename = []
+
+        self._ranges = {}        # номер сервера -> (первая строка, строка после последней)
+
+    def _intern(self, kind, values, value):
+        ids = self._ids[kind]
+        index = ids.get(value)
+        if index is None:
+            index = ids[value] = len(values)
+            values.append(value)
+        return index
+
+    def append(self, servername, dbname, filename, date, mtime, size, directory):
+        server = self._intern(0, self.servers, servername)
+        row = len(self.filename)
+        start, _ = self._ranges.get(server, (row, row))
+        self._ranges[server] = (start, row + 1)
+
+        self.server.append(server)
+        self.db.append(self._intern(1, self.dbnames, dbname))
+        self.date.append(self._intern(2, self.dates, date))
+        self.directory.append(self._intern(3, self.directories, directory))
+        self.mtime.append(mtime)
+        self.size.append(NO_SIZE if size is None else size)
+        self.filename.append(filename)
+
+    # Функция для построения столбцов из строк (servername, dbname, filename, date, mtime, size, path)
+    @classmethod
+    def from_rows(cls, rows):
+        records = cls()
+        for servername, dbname, filename, date, mtime, size, path in rows:
+            records.append(servername, dbname, filename, date, mtime, size, os.path.dirname(path))
+        return records
+
+    def __len__(self):
+        return len(self.filename)
+
+    def server_rows(self, servername):
+        server = self._ids[0].get(servername)
+        if server is None:
+            return range(0)
+        return range(*self._ranges[server])
+
+    # Функция для получения записи строки
+    def record(self, row):
+        size = self.size[row]
+        filename = self.filename[row]
+        return BackupRecord(
+            filename,
+            self.dates[self.date[row]],
+            self.mtime[row],
+            None if size == NO_SIZE else size,
+            os.path.join(self.directories[self.directory[row]], filename),
+        )
+
+    # Функция для получения последних бэкапов сервера за один проход по его строкам
+    # Возвращает ({dbname: строка последнего бэкапа}, {dbname: строка последнего бэкапа с датой date в имени файла})
+    def latest(self, servername, date=None):
+        date_id = self._ids[2].get(date)
+        latest = {}
+        dated = {}
+        db, dates = self.db, self.date
+        for row in self.server_rows(servername):
+            db_id = db[row]
+            if db_id not in latest:
+                latest[db_id] = row
+            if date_id is not None and db_id not in dated and dates[row] == date_id:
+                dated[db_id] = row
+        names = self.dbnames
+        return {names[db_id]: row for db_id, row in latest.items()}, {names[db_id]: row for db_id, row in dated.items()}
+
+    # Функция для получения истории бэкапов сервера от новых к старым: [(filename, dbname, datetime)]
+    def history(self, servername):
+        return [
+            (self.filename[row], self.dbnames[self.db[row]], datetime.fromtimestamp(self.mtime[row]))
+            for row in self.server_rows(servername)
+        ]
@@ -0,0 +1,190 @@
+import sys
+import csv
+import json
+import asyncio
+import logging
+import argparse
+from datetime import datetime
+
+import backup_manager
+from config import config_store
+from message_renderer import format_backup_status, render_status_rows
+
+# Отчёты о бэкапах без запуска бота - для cron и скриптов мониторинга:
+#   python -m backup_report scan [сервер ...] [--format text|json|csv] [--output файл]
+#   python -m backup_report history <сервер> [база] [с дд.мм.гггг] [по дд.мм.гггг] [--limit N]
+# Используются те же config.ini (из текущей папки), каталог и правила свежести, что и у бота.
+# telegram и apscheduler не импортируются, новые проверки архивов не запускаются (показываются сохранённые результаты).
+# Код возврата scan: 0 - все бэкапы в порядке, 1 - есть ошибки, 2 - путь к бэкапам не установлен.
+
+FORMATS = ('text', 'json', 'csv')
+
+STATUS_FIELDS = ('server', 'db', 'status', 'backup_time', 'overdue_seconds', 'size', 'verification', 'path')
+HISTORY_FIELDS = ('server', 'db', 'backup_time', 'size', 'filename')
+
+NO_BACKUP_PATH = 'Путь к бэкапам не установлен: укажите BACKUP_PATH_FILE в config.ini или параметр --path.'
+
+
+# Функция для получения статуса пары (сервер, БД): ok, stale (просрочен), missing (нет бэкапа), corrupt (архив повреждён)
+def backup_status(info, fresh):
+    if not info or info.get('mtime') is None:
+        return 'missing'
+    if info.get('verification') == 'corrupt':
+        return 'corrupt'
+    return 'ok' if fresh else 'stale'
+
+
+# Функция для формирования отчёта о статусе последних бэкапов
+# Возвращает (заголовок, строки-словари, строки текстового отчёта, есть ли ошибки)
+def build_status_report(snapshot, servers=None):
+    backups = snapshot.latest
+    if servers:
+        backups = {key: info for key, info in backups.items() if key[0] in servers}
+    freshness = backup_manager.evaluate_freshness(backups)
+    recent_backups = backup_manager.get_recent_backups(backups, freshness)
+    overdue = {key: late for key, (fresh, late) in freshness.items() if late is not None}
+
+    records = []
+    for (servername, dbname), info in backups.items():
+        fresh, late = freshness[(servername, dbname)]
+        records.append({
+            'server': servername,
+            'db': dbname,
+            'status': backup_status(info, fresh),
+            'backup_time': info['datetime'].isoformat(sep=' ', timespec='seconds') if info and info.get('mtime') is not None else None,
+            'overdue_seconds': round(late) if late is not None else None,
+            'size': info.get('size') if info else None,
+            'verification': info.get('verification') if info else None,
+            'path': info.get('path') if info else None,
+        })
+    failed = any(record['status'] != 'ok' for record in records)
+
+    if failed:
+        header = 'Выявлены ошибки при выполнении резервного копирования.'
+    else:
+        header = 'Резервное копирование успешно.'
+    rows = render_status_rows(backups, 'desktop', backup_manager.TIMEZONE, reference=recent_backups, overdue=overdue)
+    return backup_manager.degraded_header(header, snapshot), records, rows, failed
+
+
+# Функция для формирования отчёта об истории бэкапов сервера из каталога
+def build_history_report(paths, servername, dbname, start, end, limit):
+    total, rows = backup_manager.get_catalog().history_page(paths, servername, dbname, start, end, limit or -1, 0)
+    records = [
+        {
+            'server': servername,
+            'db': db,
+            'backup_time': datetime.fromtimestamp(mtime).isoformat(sep=' ', timespec='seconds'),
+            'size': size,
+            'filename': filename,
+        }
+        for filename, db, mtime, size in rows
+    ]
+    header = f"История резервных копий для сервера {servername} (показано {len(rows)} из {total}):"
+    lines = [
+        format_backup_status(servername, db, datetime.fromtimestamp(mtime), backup_manager.TIMEZONE)
+        for filename, db, mtime, size in rows
+    ]
+    return header, records, lines
+
+
+# Функция для вывода отчёта в выбранном формате
+def write_report(output, output_format, report, header, records, fields, lines, extra=None):
+    if output_format == 'json':
+        document = {'report': report, 'generated_at': datetime.now().isoformat(sep=' ', timespec='seconds')}
+        document.update(extra or {})
+        document['items'] = records
+        json.dump(document, output, ensure_ascii=False, indent=2)
+        output.write('\n')
+    elif output_format == 'csv':
+        writer = csv.DictWriter(output, fieldnames=fields, lineterminator='\n')
+        writer.writeheader()
+        writer.writerows(records)
+    else:
+        output.write(header + '\n')
+        for line in lines:
+            output.write(line + '\n')
+
+
+async def scan_command(args, settings, logger, output):
+    backup_path_file = args.path or settings.backup_path_file
+    if not backup_manager.get_backup_roots(backup_path_file):
+        logger.error(NO_BACKUP_PATH)
+        return 2
+    snapshot = await backup_manager.take_backups_snapshot_async(
+        backup_path_file, settings.server_list_allowed, settings.server_list_disallowed, logger
+    )
+    if snapshot is None:
+        logger.error('Папки бэкапов недоступны, данных последнего сканирования нет.')
+        return 2
+    header, records, lines, failed = build_status_report(snapshot, set(args.servers))
+    summary = {
+        'total': len(records),
+        'ok': sum(1 for record in records if record['status'] == 'ok'),
+        'failed': sum(1 for record in records if record['status'] != 'ok'),
+    }
+    # Недоступные папки в CSV не попадают - о них сообщается в stderr
+    write_report(output, args.format, 'status', header, records, STATUS_FIELDS, lines, {'summary': summary, 'degraded': snapshot.degraded})
+    return 1 if failed else 0
+
+
+async def history_command(args, settings, logger, output):
+    roots = backup_manager.get_backup_roots(args.path or settings.backup_path_file)
+    if not roots:
+        logger.error(NO_BACKUP_PATH)
+        return 2
+    try:
+        dbname, start, end = backup_manager.parse_history_args(args.filters)
+    except ValueError:
+        logger.error('Использование: history <сервер> [база] [с дд.мм.гггг] [по дд.мм.гггг]')
+        return 2
+
+    servername = args.servername
+    await backup_manager.refresh_backup_roots(roots, lambda name: name == servername, logger)
+    header, records, lines = await asyncio.to_thread(
+        build_history_report, [root['path'] for root in roots], servername, dbname, start, end, args.limit
+    )
+    write_report(output, args.format, 'history', header, records, HISTORY_FIELDS, lines)
+    return 0
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog='python -m backup_report', description='Отчёты о резервных копиях без запуска бота')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    scan = commands.add_parser('scan', help='Статус последних резервных копий')
+    scan.add_argument('servers', nargs='*', help='Только эти серверы')
+    scan.set_defaults(handler=scan_command)
+
+    history = commands.add_parser('history', help='История резервных копий сервера')
+    history.add_argument('servername')
+    history.add_argument('filters', nargs='*', help='[база] [с дд.мм.гггг] [по дд.мм.гггг]')
+    history.add_argument('--limit', type=int, default=0, help='Не больше N последних копий (0 - все)')
+    history.set_defaults(handler=history_command)
+
+    for command in (scan, history):
+        command.add_argument('--format', choices=FORMATS, default='text')
+        command.add_argument('--output', help='Файл отчёта (по умолчанию stdout)')
+        command.add_argument('--path', help='Папка бэкапов вместо BACKUP_PATH_FILE из config.ini')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # Сообщения о недоступных папках и ошибках - в stderr, отчёт - в stdout или файл
+    logging.basicConfig(format='%(levelname)s: %(message)s', level=logging.WARNING, stream=sys.stderr)
+    logger = logging.getLogger('backup_report')
+    settings = config_store.current()
+    backup_manager.use_stored_verifications()
+
+    output = open(args.output, 'w', encoding='utf-8', newline='') if args.output else sys.stdout
+    try:
+        return asyncio.run(args.handler(args, settings, logger, output))
+    finally:
+        if args.output:
+            output.close()
+        backup_manager.close_catalogs()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
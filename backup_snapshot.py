@@ -0,0 +1,109 @@
+import heapq
+from datetime import datetime
+
+from backup_records import BackupRecord, BackupRecords
+
+
+# Снимок состояния бэкапов, построенный за один проход по каталогу.
+# Содержит сразу все представления: последние бэкапы, бэкапы за сегодня и историю по серверам.
+# Записи хранятся в столбцах BackupRecords, записи BackupRecord создаются только для последних бэкапов.
+class BackupSnapshot:
+    def __init__(self, latest, today, records, monitored, created_at, degraded=None):
+        self.latest = latest        # {(servername, dbname): BackupRecord}
+        self.today = today          # {(servername, dbname): BackupRecord} только за сегодня
+        self._records = records
+        self._monitored = monitored
+        self.created_at = created_at
+        self.degraded = degraded if degraded is not None else {}  # {имя корневой папки: причина}
+
+    # Функция для получения истории бэкапов сервера в формате get_backup_history
+    def history(self, servername):
+        if servername not in self._monitored:
+            return []
+        return self._records.history(servername)
+
+
+# Функция для построения снимка из записей каталога
+# records - BackupRecords (или строки (servername, dbname, filename, date, mtime, size, path)),
+# упорядоченные по серверу и убыванию mtime
+def build_backup_snapshot(records, servers, server_filter, SERVER_LIST_ALLOWED, today=None):
+    if not isinstance(records, BackupRecords):
+        records = BackupRecords.from_rows(records)
+    now = datetime.now()
+    today = today or now.strftime('%d-%m-%Y')
+    latest = {}
+    today_backups = {}
+    monitored = set()
+
+    # Порядок серверов - как в корневой папке бэкапов
+    for servername in servers:
+        # Пропускаем сервера, которые не разрешены или запрещены для мониторинга
+        if not server_filter(servername):
+            continue
+        monitored.add(servername)
+
+        latest_rows, today_rows = records.latest(servername, today)
+
+        # Если для текущего сервера не было найдено ни одного бэкапа
+        if not latest_rows:
+            latest[(servername, None)] = BackupRecord()
+            continue
+
+        # Одна запись на строку: если последний бэкап сделан сегодня, в обоих представлениях один и тот же объект
+        created = {}
+        for dbname in sorted(latest_rows):
+            row = latest_rows[dbname]
+            latest[(servername, dbname)] = created[row] = records.record(row)
+        for dbname, row in today_rows.items():
+            today_backups[(servername, dbname)] = created.get(row) or records.record(row)
+
+    # Добавляем информацию для серверов из SERVER_LIST_ALLOWED, для которых не найдено ни одного бэкапа
+    present = {servername for servername, _ in latest}
+    for servername in SERVER_LIST_ALLOWED:
+        if servername not in present:
+            present.add(servername)
+            latest[(servername, None)] = BackupRecord()
+
+    return BackupSnapshot(latest, today_backups, records, monitored, now)
+
+
+# Общий снимок нескольких корневых папок бэкапов
+class MergedSnapshot(BackupSnapshot):
+    def __init__(self, latest, today, snapshots, created_at, degraded):
+        super().__init__(latest, today, None, set(), created_at, degraded)
+        self._snapshots = snapshots
+
+    # История сервера из всех папок, от новых к старым
+    def history(self, servername):
+        return list(heapq.merge(*(snapshot.history(servername) for snapshot in self._snapshots), key=lambda item: item[2], reverse=True))
+
+
+# Функция для объединения снимков нескольких корневых папок
+# Если пара (сервер, БД) есть в нескольких папках, берётся более новый бэкап;
+# строка "нет бэкапов" остаётся только для серверов, у которых бэкапов нет ни в одной папке
+def merge_snapshots(snapshots):
+    if len(snapshots) == 1:
+        return snapshots[0]
+
+    latest = {}
+    today = {}
+    degraded = {}
+    for snapshot in snapshots:
+        degraded.update(snapshot.degraded)
+        for backups, merged in ((snapshot.latest, latest), (snapshot.today, today)):
+            for key, info in backups.items():
+                current = merged.get(key)
+                if current is None or (info.get('mtime') or 0) > (current.get('mtime') or 0):
+                    merged[key] = info
+
+    # Строки одного сервера идут подряд, сервера - в порядке первого появления
+    order = {}
+    for servername, dbname in latest:
+        order.setdefault(servername, len(order))
+    with_backups = {servername for servername, dbname in latest if dbname is not None}
+    latest = {
+        key: latest[key] for key in sorted(latest, key=lambda key: order[key[0]])
+        if key[1] is not None or key[0] not in with_backups
+    }
+    today = {key: today[key] for key in sorted(today, key=lambda key: order.get(key[0], len(order)))}
+    return MergedSnapshot(latest, today, snapshots, max(snapshot.created_at for snapshot in snapshots), degraded)
@@ -0,0 +1,279 @@
+import os
+import sys
+import select
+import struct
+import ctypes
+import ctypes.util
+import threading
+from datetime import datetime
+
+from backup_snapshot import build_backup_snapshot
+
+# Флаги inotify (linux/inotify.h)
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+EVENT_HEADER = struct.Struct('iIII')  # wd, mask, cookie, len
+
+
+# Функция для загрузки inotify из libc (None, если платформа его не поддерживает)
+def load_inotify():
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+# Отслеживание последних бэкапов в памяти.
+# Состояние строится один раз при запуске, затем поддерживается событиями inotify,
+# а на файловых системах без inotify (сетевые ресурсы, Windows) - периодическим пересканированием.
+# load_rows - функция без аргументов, возвращающая (servers, rows) в формате каталога бэкапов.
+# filename_timestamp - функция info -> epoch; если задана, время нового бэкапа берётся из имени файла без вызова stat.
+class BackupWatcher:
+    def __init__(self, backup_root_path, parse_filename, load_rows, mode='auto', poll_interval=60, logger=None, filename_timestamp=None):
+        self.backup_root_path = os.path.normpath(backup_root_path)
+        self.parse_filename = parse_filename
+        self.load_rows = load_rows
+        self.mode = mode
+        self.poll_interval = poll_interval
+        self.logger = logger
+        self.filename_timestamp = filename_timestamp
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._servers = []
+        self._latest = {}   # (servername, dbname) -> (filename, date, mtime, size, path)
+        self._today = {}    # то же, только бэкапы с датой self._today_date в имени файла
+        self._today_date = None
+
+        self._libc = None
+        self._fd = None
+        self._watches = {}  # wd -> (dir_path, servername); servername None для корневой папки
+        self.active_mode = None
+
+    def _log(self, level, message):
+        if self.logger:
+            getattr(self.logger, level)(message)
+
+    # Функция для запуска отслеживания: начальное построение состояния и фоновый поток
+    # Наблюдение устанавливается до построения состояния, чтобы не потерять файлы, появившиеся в процессе
+    def start(self):
+        if self.mode in ('auto', 'inotify'):
+            self._libc = load_inotify()
+            if self._libc is not None:
+                fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+                if fd >= 0:
+                    self._fd = fd
+                    try:
+                        self._watch_tree(self.backup_root_path, None, apply_files=False)
+                    except OSError as e:
+                        self._log('error', f"Не удалось установить inotify для {self.backup_root_path}: {e}")
+                        self._close_inotify()
+            if self._fd is None and self.mode == 'inotify':
+                self._log('warning', "inotify недоступен, используется периодическое сканирование.")
+
+        self._load()
+
+        self.active_mode = 'inotify' if self._fd is not None else 'poll'
+        target = self._inotify_loop if self._fd is not None else self._poll_loop
+        self._thread = threading.Thread(target=target, name='backup-watcher', daemon=True)
+        self._thread.start()
+        self._log('info', f"Отслеживание {self.backup_root_path} запущено, режим: {self.active_mode}")
+
+    # Функция для остановки отслеживания
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._close_inotify()
+
+    def _close_inotify(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+            self._watches.clear()
+
+    # Функция для полного перестроения состояния
+    def _load(self):
+        servers, rows = self.load_rows()
+        today = datetime.now().strftime('%d-%m-%Y')
+        latest = {}
+        today_backups = {}
+        for servername, dbname, filename, date, mtime, size, path in rows:
+            key = (servername, dbname)
+            row = (filename, date, mtime, size, path)
+            if key not in latest or mtime > latest[key][2]:
+                latest[key] = row
+            if date == today and (key not in today_backups or mtime > today_backups[key][2]):
+                today_backups[key] = row
+        with self._lock:
+            self._servers = list(servers)
+            self._latest = latest
+            self._today = today_backups
+            self._today_date = today
+
+    # Функция для учёта нового или изменённого файла бэкапа
+    def _apply_file(self, servername, path):
+        filename = os.path.basename(path)
+        info = self.parse_filename(filename)
+        if not info:
+            return
+        timestamp = self.filename_timestamp(info) if self.filename_timestamp is not None else None
+        if timestamp is None:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                return
+            timestamp, size = stat.st_mtime, stat.st_size
+        else:
+            size = None
+        key = (servername, info['dbname'])
+        row = (filename, info['date'], timestamp, size, path)
+        with self._lock:
+            if key not in self._latest or row[2] >= self._latest[key][2]:
+                self._latest[key] = row
+            if info['date'] == self._today_date and (key not in self._today or row[2] >= self._today[key][2]):
+                self._today[key] = row
+
+    # Функция для проверки, является ли удалённый файл одним из текущих последних бэкапов
+    def _is_tracked(self, servername, filename):
+        info = self.parse_filename(filename)
+        if not info:
+            return False
+        key = (servername, info['dbname'])
+        with self._lock:
+            return any(key in state and state[key][0] == filename for state in (self._latest, self._today))
+
+    # Функция для установки наблюдения за директорией и всеми её поддиректориями
+    # Файлы, появившиеся в новой директории до установки наблюдения, сразу учитываются в состоянии
+    def _watch_tree(self, dir_path, servername, apply_files=True):
+        stack = [(dir_path, servername)]
+        while stack:
+            path, server = stack.pop()
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), WATCH_MASK)
+            if wd < 0:
+                errno = ctypes.get_errno()
+                raise OSError(errno, os.strerror(errno), path)
+            self._watches[wd] = (path, server)
+            try:
+                with os.scandir(path) as entries:
+                    for entry in entries:
+                        if entry.is_dir():
+                            stack.append((entry.path, server if server is not None else entry.name))
+                        elif apply_files and server is not None:
+                            self._apply_file(server, entry.path)
+            except OSError:
+                continue
+
+    # Цикл чтения событий inotify
+    def _inotify_loop(self):
+        while not self._stop.is_set():
+            readable, _, _ = select.select([self._fd], [], [], 1.0)
+            if not readable:
+                self._check_date()
+                continue
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                continue
+            except OSError as e:
+                self._log('error', f"Ошибка чтения событий inotify: {e}")
+                continue
+            try:
+                self._handle_events(data)
+            except Exception as e:
+                self._log('exception', f"Ошибка обработки событий inotify: {e}")
+                self._load()
+
+    # Функция для разбора буфера событий inotify
+    def _handle_events(self, data):
+        offset = 0
+        reload_needed = False
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b'\0')
+            offset += EVENT_HEADER.size + length
+
+            if mask & IN_Q_OVERFLOW:
+                reload_needed = True
+                continue
+            if mask & IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+            if wd not in self._watches or not name:
+                continue
+
+            dir_path, servername = self._watches[wd]
+            path = os.path.join(dir_path, os.fsdecode(name))
+
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    if servername is None:
+                        with self._lock:
+                            self._servers.append(os.fsdecode(name))
+                    self._watch_tree(path, servername if servername is not None else os.fsdecode(name))
+                elif mask & (IN_DELETE | IN_MOVED_FROM):
+                    reload_needed = True
+                continue
+
+            if servername is None:
+                continue
+            if mask & (IN_CLOSE_WRITE | IN_MOVED_TO | IN_ATTRIB):
+                self._apply_file(servername, path)
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                if self._is_tracked(servername, os.fsdecode(name)):
+                    reload_needed = True
+
+        if reload_needed:
+            self._load()
+        self._check_date()
+
+    # Цикл периодического пересканирования (без inotify)
+    def _poll_loop(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self._load()
+            except Exception as e:
+                self._log('exception', f"Ошибка пересканирования {self.backup_root_path}: {e}")
+
+    # Функция для смены текущих суток: бэкапы за новый день берутся из последних бэкапов
+    def _check_date(self):
+        today = datetime.now().strftime('%d-%m-%Y')
+        with self._lock:
+            if today != self._today_date:
+                self._today_date = today
+                self._today = {key: row for key, row in self._latest.items() if row[1] == today}
+
+    # Функция для получения снимка из памяти, без обращения к диску
+    # История в таком снимке неполная: она по-прежнему берётся из каталога
+    def snapshot(self, server_filter, SERVER_LIST_ALLOWED):
+        self._check_date()
+        with self._lock:
+            servers = list(self._servers)
+            rows = [(key[0], key[1]) + row for key, row in self._latest.items()]
+            rows.extend(
+                (key[0], key[1]) + row for key, row in self._today.items()
+                if self._latest.get(key) != row
+            )
+            today = self._today_date
+        rows.sort(key=lambda row: (row[0], -row[4]))
+        return build_backup_snapshot(rows, servers, server_filter, SERVER_LIST_ALLOWED, today)
@@ -0,0 +1,138 @@
+import json
+import time
+import asyncio
+from urllib.parse import parse_qsl
+
+from http_server import start_http_server
+
+# Заглушка Telegram Bot API для локальных замеров без сети.
+# Отвечает на методы, которые использует бот, getUpdates отдаёт update из очереди (long polling),
+# отправленные сообщения записываются вместе со временем отправки.
+# В групповых чатах бот отвечает с reply_to_message_id, поэтому время ответа известно для каждой команды.
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'BackupMonitorBot', 'username': 'backup_monitor_bot'}
+
+
+class FakeBotApi:
+    def __init__(self):
+        self._updates = asyncio.Queue()
+        self._next_update_id = 1
+        self._next_message_id = 1
+        self.sent = []  # (время отправки, chat_id, текст)
+        self.injected = {}  # update_id -> время постановки в очередь
+        self.flood = {}  # chat_id -> retry_after для следующей отправки в этот чат (имитация ответа 429)
+        self.replies = {}  # message_id команды -> время первого ответа на неё
+        self._reply_waiters = {}
+        self.server = None
+        self.port = None
+
+    # Функция для запуска заглушки на свободном локальном порту
+    async def start(self, host='127.0.0.1', port=0):
+        self.server = await start_http_server(self._handle, host, port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self.port}/bot'
+
+    # Функция для постановки входящего сообщения с командой в очередь getUpdates
+    def inject_message(self, chat_id, text, chat_type='private'):
+        update_id = self._next_update_id
+        self._next_update_id += 1
+        message = {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': chat_type},
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': 'User'},
+            'text': text,
+        }
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+        self.injected[update_id] = time.perf_counter()
+        self._updates.put_nowait({'update_id': update_id, 'message': message})
+        return update_id
+
+    # Функция для ожидания первого ответа на сообщение (ответ с reply_to_message_id); возвращает время ответа
+    async def wait_reply(self, message_id, timeout=None):
+        if message_id not in self.replies:
+            waiter = self._reply_waiters.get(message_id)
+            if waiter is None:
+                waiter = self._reply_waiters[message_id] = asyncio.get_running_loop().create_future()
+            await asyncio.wait_for(asyncio.shield(waiter), timeout)
+        return self.replies[message_id]
+
+    # Функция для немедленного завершения текущего запроса getUpdates (при остановке бота не ждать long polling)
+    def release_polling(self):
+        self._updates.put_nowait(None)
+
+    def _message(self, chat_id, text):
+        message_id = self._next_message_id
+        self._next_message_id += 1
+        return {'message_id': message_id, 'date': int(time.time()), 'chat': {'id': int(chat_id), 'type': 'private'}, 'from': BOT_USER, 'text': text}
+
+    async def _get_updates(self, params):
+        timeout = float(params.get('timeout') or 0)
+        limit = int(params.get('limit') or 100)
+        updates = []
+        try:
+            update = await asyncio.wait_for(self._updates.get(), timeout)
+        except asyncio.TimeoutError:
+            return []
+        while update is not None:
+            updates.append(update)
+            if len(updates) >= limit or self._updates.empty():
+                break
+            update = self._updates.get_nowait()
+        return updates
+
+    async def _handle(self, request):
+        method = request.path.rsplit('/', 1)[-1]
+        params = _parse_params(request)
+
+        if method == 'getMe':
+            result = BOT_USER
+        elif method == 'getUpdates':
+            result = await self._get_updates(params)
+        elif method == 'sendMessage':
+            retry_after = self.flood.pop(str(params.get('chat_id')), None)
+            if retry_after is not None:
+                body = {'ok': False, 'error_code': 429, 'description': f'Too Many Requests: retry after {retry_after}', 'parameters': {'retry_after': retry_after}}
+                return 429, json.dumps(body), 'application/json'
+            sent_at = time.perf_counter()
+            self.sent.append((sent_at, params.get('chat_id'), params.get('text')))
+            reply_to = params.get('reply_to_message_id')
+            if reply_to is not None and int(reply_to) not in self.replies:
+                self.replies[int(reply_to)] = sent_at
+                waiter = self._reply_waiters.pop(int(reply_to), None)
+                if waiter is not None and not waiter.done():
+                    waiter.set_result(sent_at)
+            result = self._message(params.get('chat_id'), params.get('text'))
+        elif method == 'editMessageText':
+            result = self._message(params.get('chat_id', 0), params.get('text'))
+        elif method in ('answerCallbackQuery', 'deleteWebhook', 'setWebhook', 'setMyCommands'):
+            result = True
+        else:
+            body = {'ok': False, 'error_code': 404, 'description': f'Not Found: method {method}'}
+            return 404, json.dumps(body), 'application/json'
+
+        return 200, json.dumps({'ok': True, 'result': result}), 'application/json'
+
+
+# Функция для разбора параметров запроса (PTB отправляет JSON или form-urlencoded)
+def _parse_params(request):
+    if not request.body:
+        return {}
+    if request.headers.get('content-type', '').startswith('application/json'):
+        return json.loads(request.body)
+    params = {}
+    for name, value in parse_qsl(request.body.decode('utf-8')):
+        try:
+            params[name] = json.loads(value)
+        except ValueError:
+            params[name] = value
+    return params
@@ -0,0 +1,221 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import tempfile
+import configparser
+from statistics import quantiles
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_bot_api import FakeBotApi
+from benchmarks.tree_generator import SIZES, generate_backup_tree
+
+# Нагрузочный тест бота: настоящее приложение из BackupMonitorBot.main() работает с локальной заглушкой Bot API.
+# Каждый пользователь - отдельный групповой чат: отправляет команду, ждёт первого ответа, делает паузу и отправляет следующую.
+# Команды выбираются случайно с весами из --mix по синтетическому дереву бэкапов (benchmarks.tree_generator).
+# Для каждого числа пользователей выводятся пропускная способность, задержка первого ответа p50/p95/p99
+# и время, на которое блокировался цикл событий (задержки пробуждения контрольной задачи сверх интервала).
+
+DEFAULT_MIX = 'backupstatus=5,history=3,notify=2'
+
+# Задержка пробуждения больше этого значения считается блокировкой цикла событий
+STALL_THRESHOLD = 0.05
+
+
+# Функция для разбора смеси команд: "backupstatus=5,history=3" -> (['backupstatus', 'history'], [5.0, 3.0])
+def parse_mix(value):
+    commands, weights = [], []
+    for item in value.split(','):
+        command, _, weight = item.strip().partition('=')
+        commands.append(command.strip().lstrip('/'))
+        weights.append(float(weight or 1))
+    return commands, weights
+
+
+# Функция для записи config.ini рабочей папки: опрос заглушки, без расписаний, метрик и проверки архивов
+def write_config(workdir, tree, max_concurrency, cache_ttl, watch):
+    config = configparser.ConfigParser()
+    config['Paths'] = {'BACKUP_PATH_FILE': tree, 'CATALOG_FILE': 'backup_catalog.db'}
+    config['Servers'] = {'SERVER_LIST_ALLOWED': '', 'SERVER_LIST_DISALLOWED': ''}
+    config['Notification'] = {'CHAT_ID': '', 'MODE': 'OFF', 'TIME_NOTIFICATION': '15:00:00', 'DELTA': 'no'}
+    config['Scan'] = {'MAX_WORKERS': '4', 'TIMESTAMP_SOURCE': 'mtime', 'TIMEOUT': '60'}
+    config['Watch'] = {'ENABLED': 'yes' if watch else 'no', 'MODE': 'auto', 'POLL_INTERVAL': '60'}
+    config['Cache'] = {'TTL': str(cache_ttl)}
+    config['Bot'] = {'MODE': 'polling', 'MAX_CONCURRENCY': str(max_concurrency)}
+    config['Metrics'] = {'ENABLED': 'no'}
+    config['Verify'] = {'ENABLED': 'no'}
+    with open(os.path.join(workdir, 'config.ini'), 'w') as f:
+        config.write(f)
+
+
+# Функция для текста команды; /history - по случайному серверу и, в половине случаев, базе из дерева
+def command_text(command, rng, servers, databases):
+    if command == 'history':
+        text = f'/history SRV{rng.randrange(servers):03d}'
+        if rng.random() < 0.5:
+            text += f' DB{rng.randrange(databases):02d}'
+        return text
+    return f'/{command}'
+
+
+# Асинхронная функция для замера блокировок цикла событий: задача просыпается каждые interval секунд,
+# опоздание пробуждения - время, когда цикл был занят другой работой
+async def monitor_event_loop(stop_event, interval, lags):
+    loop = asyncio.get_running_loop()
+    expected = loop.time() + interval
+    while not stop_event.is_set():
+        await asyncio.sleep(interval)
+        now = loop.time()
+        lags.append(max(0.0, now - expected))
+        expected = now + interval
+
+
+# Асинхронная функция одного пользователя: команда, ожидание первого ответа, пауза think_time (экспоненциальное распределение)
+async def run_user(api, chat_id, mix, rng, deadline, think_time, reply_timeout, tree_shape, results):
+    commands, weights = mix
+    while time.perf_counter() < deadline:
+        command = rng.choices(commands, weights)[0]
+        message_id = api.inject_message(chat_id, command_text(command, rng, *tree_shape), chat_type='group')
+        try:
+            replied_at = await api.wait_reply(message_id, reply_timeout)
+        except asyncio.TimeoutError:
+            results.append((command, None))
+        else:
+            results.append((command, replied_at - api.injected[message_id]))
+        if think_time:
+            await asyncio.sleep(rng.expovariate(1 / think_time))
+
+
+# Функция для перцентилей задержки в миллисекундах
+def latency_percentiles(latencies):
+    if len(latencies) < 2:
+        value = latencies[0] * 1000 if latencies else None
+        return {'p50': value, 'p95': value, 'p99': value}
+    percentiles = quantiles(latencies, n=100)
+    return {'p50': percentiles[49] * 1000, 'p95': percentiles[94] * 1000, 'p99': percentiles[98] * 1000}
+
+
+# Асинхронная функция для одного прогона: бот запускается, users пользователей шлют команды duration секунд
+async def run_once(users, duration, mix, think_time, reply_timeout, tree_shape, seed):
+    import BackupMonitorBot
+
+    api = await FakeBotApi().start()
+    stop_event = asyncio.Event()
+    bot = asyncio.create_task(BackupMonitorBot.main(token='123:TEST', base_url=api.base_url, stop_event=stop_event))
+
+    # Ответ на /start - признак того, что бот запущен и принимает команды
+    ready = asyncio.ensure_future(api.wait_reply(api.inject_message(-1, '/start', chat_type='group')))
+    await asyncio.wait([ready, bot], timeout=60, return_when=asyncio.FIRST_COMPLETED)
+    if not ready.done():
+        ready.cancel()
+        if bot.done():
+            bot.result()
+        raise RuntimeError('бот не ответил на /start (проверьте config.ini рабочей папки)')
+
+    lags = []
+    monitor_stop = asyncio.Event()
+    monitor = asyncio.create_task(monitor_event_loop(monitor_stop, 0.01, lags))
+    results = []
+    started = time.perf_counter()
+    deadline = started + duration
+    await asyncio.gather(*(
+        run_user(api, -1000 - user, mix, random.Random(seed + user), deadline, think_time, reply_timeout, tree_shape, results)
+        for user in range(users)
+    ))
+    elapsed = time.perf_counter() - started
+    monitor_stop.set()
+    await monitor
+
+    stop_event.set()
+    api.release_polling()
+    await bot
+    await api.stop()
+
+    latencies = [latency for command, latency in results if latency is not None]
+    by_command = {}
+    for command in mix[0]:
+        command_latencies = [latency for name, latency in results if name == command and latency is not None]
+        by_command[command] = dict(count=len(command_latencies), **latency_percentiles(command_latencies))
+    stalls = [lag for lag in lags if lag > STALL_THRESHOLD]
+    return {
+        'users': users,
+        'elapsed': elapsed,
+        'commands': len(latencies),
+        'timeouts': len(results) - len(latencies),
+        'throughput': len(latencies) / elapsed,
+        **latency_percentiles(latencies),
+        'by_command': by_command,
+        'loop_lag_total': sum(lags),
+        'loop_lag_max': max(lags, default=0.0),
+        'loop_stalls': len(stalls),
+        'loop_stall_time': sum(stalls),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Нагрузочный тест бота на локальной заглушке Telegram Bot API')
+    parser.add_argument('--users', default='1,10,50', help='число одновременных пользователей (чатов) через запятую')
+    parser.add_argument('--duration', type=float, default=20, help='длительность прогона, с')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='команды и их веса')
+    parser.add_argument('--think-time', type=float, default=0.5, help='средняя пауза пользователя между командами, с')
+    parser.add_argument('--reply-timeout', type=float, default=60, help='ответ не пришёл за это время - команда считается потерянной')
+    parser.add_argument('--size', choices=SIZES, default='small', help='размер синтетического дерева бэкапов')
+    parser.add_argument('--concurrency', type=int, default=8, help='[Bot] MAX_CONCURRENCY')
+    parser.add_argument('--cache-ttl', type=int, default=30, help='[Cache] TTL, с (0 - без кэша снимков)')
+    parser.add_argument('--watch', action='store_true', help='включить отслеживание папки бэкапов ([Watch] ENABLED)')
+    parser.add_argument('--workdir', help='рабочая папка (config.ini, каталог, дерево); по умолчанию временная')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='JSON с результатами')
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    output = os.path.abspath(args.output) if args.output else None
+    temporary = None
+    workdir = args.workdir
+    if workdir is None:
+        temporary = tempfile.TemporaryDirectory(prefix='bot-load-')
+        workdir = temporary.name
+    workdir = os.path.abspath(workdir)
+
+    servers, databases, days = SIZES[args.size]
+    tree = os.path.join(workdir, 'tree')
+    if not os.path.isdir(tree):
+        files = generate_backup_tree(tree, servers, databases, days, args.seed)
+        print(f"Дерево бэкапов {args.size}: {files} файлов в {tree}")
+    write_config(workdir, tree, args.concurrency, args.cache_ttl, args.watch)
+
+    # Бот читает config.ini и пишет bot.log в текущей папке
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    import logging_config  # noqa: F401 - настройка логирования бота; в консоль выводятся только предупреждения
+    logging.getLogger().setLevel(logging.WARNING)
+
+    results = []
+    try:
+        for users in (int(value) for value in args.users.split(',')):
+            result = asyncio.run(run_once(users, args.duration, mix, args.think_time, args.reply_timeout, (servers, databases), args.seed))
+            results.append(result)
+            print(f"пользователей {users:>4}: {result['throughput']:>7.1f} команд/с  "
+                  f"p50 {result['p50'] or 0:>8.1f} мс  p95 {result['p95'] or 0:>8.1f} мс  p99 {result['p99'] or 0:>8.1f} мс  "
+                  f"потеряно {result['timeouts']}  блокировки цикла: {result['loop_stalls']} "
+                  f"({result['loop_stall_time'] * 1000:.0f} мс, макс. {result['loop_lag_max'] * 1000:.0f} мс)")
+            for command, stats in result['by_command'].items():
+                if stats['count']:
+                    print(f"    /{command:<14} {stats['count']:>6}  p50 {stats['p50']:>8.1f} мс  p95 {stats['p95']:>8.1f} мс  p99 {stats['p99']:>8.1f} мс")
+    finally:
+        os.chdir(cwd)
+        if temporary is not None:
+            temporary.cleanup()
+
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
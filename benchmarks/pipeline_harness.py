@@ -0,0 +1,109 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+from statistics import quantiles
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram.ext import ApplicationBuilder, CommandHandler
+
+from update_pipeline import UpdatePipeline, poll_updates
+from benchmarks.fake_bot_api import FakeBotApi
+
+logger = logging.getLogger('benchmarks')
+
+
+# Функция для сборки приложения с медленной (имитация сканирования) и быстрой командами
+def build_application(api, slow_delay):
+    application = ApplicationBuilder().token('123:TEST').base_url(api.base_url).build()
+
+    async def slow_command(update, context):
+        await asyncio.sleep(slow_delay)
+        await update.message.reply_text(str(update.update_id))
+
+    async def fast_command(update, context):
+        await update.message.reply_text(str(update.update_id))
+
+    application.add_handler(CommandHandler('slow', slow_command))
+    application.add_handler(CommandHandler('fast', fast_command))
+    return application
+
+
+# Функция для одного прогона: updates команд по chats чатам, доля медленных команд - slow_share
+async def run_once(max_concurrency, updates, chats, slow_share, slow_delay, seed):
+    api = await FakeBotApi().start()
+    application = build_application(api, slow_delay)
+    await application.initialize()
+
+    rng = random.Random(seed)
+    for _ in range(updates):
+        api.inject_message(rng.randint(1, chats), '/slow' if rng.random() < slow_share else '/fast')
+
+    pipeline = UpdatePipeline(application, max_concurrency=max_concurrency, logger=logger)
+    stop_event = asyncio.Event()
+    started = time.perf_counter()
+    polling = asyncio.create_task(poll_updates(application, pipeline, logger, ['message'], stop_event, timeout=1))
+
+    while len(api.sent) < updates:
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - started
+    stop_event.set()
+    await pipeline.join()
+    await polling
+
+    await application.shutdown()
+    await api.stop()
+
+    latencies = sorted(sent_at - api.injected[int(text)] for sent_at, _, text in api.sent)
+    percentiles = quantiles(latencies, n=100)
+
+    # Порядок внутри чата должен совпадать с порядком поступления
+    replies = {}
+    for _, chat_id, text in api.sent:
+        replies.setdefault(chat_id, []).append(int(text))
+    ordered = all(ids == sorted(ids) for ids in replies.values())
+
+    return {
+        'max_concurrency': max_concurrency,
+        'updates': updates,
+        'chats': chats,
+        'elapsed': elapsed,
+        'throughput': updates / elapsed,
+        'p50': percentiles[49],
+        'p95': percentiles[94],
+        'p99': percentiles[98],
+        'per_chat_order': ordered,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Замер очереди обработки update на заглушке Telegram Bot API')
+    parser.add_argument('--updates', type=int, default=200)
+    parser.add_argument('--chats', type=int, default=20)
+    parser.add_argument('--slow-share', type=float, default=0.2, help='доля медленных команд')
+    parser.add_argument('--slow-delay', type=float, default=0.2, help='длительность медленной команды, с')
+    parser.add_argument('--concurrency', default='1,8,32', help='значения max_concurrency через запятую')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='JSON с результатами')
+    args = parser.parse_args()
+
+    results = []
+    for max_concurrency in (int(value) for value in args.concurrency.split(',')):
+        result = asyncio.run(run_once(max_concurrency, args.updates, args.chats, args.slow_share, args.slow_delay, args.seed))
+        results.append(result)
+        print(f"concurrency {max_concurrency:>3}: {result['throughput']:>8.1f} update/с  "
+              f"p50 {result['p50'] * 1000:>8.1f} мс  p95 {result['p95'] * 1000:>8.1f} мс  p99 {result['p99'] * 1000:>8.1f} мс  "
+              f"порядок в чатах: {'да' if result['per_chat_order'] else 'НЕТ'}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,240 @@
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import backup_manager
+from benchmarks.tree_generator import SIZES, generate_backup_tree
+
+logger = logging.getLogger('benchmarks')
+
+
+# Прокси для os.DirEntry: считает вызовы stat() (сам DirEntry подменить нельзя)
+class CountingEntry:
+    __slots__ = ('_entry', '_counters')
+
+    def __init__(self, entry, counters):
+        self._entry = entry
+        self._counters = counters
+
+    @property
+    def name(self):
+        return self._entry.name
+
+    @property
+    def path(self):
+        return self._entry.path
+
+    def is_dir(self, *args, **kwargs):
+        return self._entry.is_dir(*args, **kwargs)
+
+    def is_file(self, *args, **kwargs):
+        return self._entry.is_file(*args, **kwargs)
+
+    def stat(self, *args, **kwargs):
+        self._counters.add('stat_calls')
+        return self._entry.stat(*args, **kwargs)
+
+    def __fspath__(self):
+        return self._entry.path
+
+
+class CountingScandir:
+    def __init__(self, iterator, counters):
+        self._iterator = iterator
+        self._counters = counters
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._iterator.close()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        entry = next(self._iterator)
+        self._counters.add('dirs_visited' if entry.is_dir() else 'files_visited')
+        return CountingEntry(entry, self._counters)
+
+    def close(self):
+        self._iterator.close()
+
+
+# Счётчики файловых операций на время замера: подменяют os.scandir, os.stat и os.path.getmtime
+class FsCounters:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.values = {'scandir_calls': 0, 'dirs_visited': 0, 'files_visited': 0, 'stat_calls': 0}
+
+    def add(self, name):
+        with self._lock:
+            self.values[name] += 1
+
+    def __enter__(self):
+        self._originals = (os.scandir, os.stat, os.path.getmtime)
+        scandir, stat, getmtime = self._originals
+
+        def counting_scandir(path='.'):
+            self.add('scandir_calls')
+            return CountingScandir(scandir(path), self)
+
+        def counting_stat(path, *args, **kwargs):
+            self.add('stat_calls')
+            return stat(path, *args, **kwargs)
+
+        def counting_getmtime(path):
+            self.add('stat_calls')
+            return getmtime(path)
+
+        os.scandir, os.stat, os.path.getmtime = counting_scandir, counting_stat, counting_getmtime
+        return self
+
+    def __exit__(self, *exc):
+        os.scandir, os.stat, os.path.getmtime = self._originals
+
+
+# Функция для замера одного вызова: время, файловые операции и пиковая память
+# Время замеряется в отдельном запуске без tracemalloc и счётчиков: они замедляют каждое выделение памяти
+# и вызов scandir/stat. prepare приводит состояние к исходному перед каждым запуском (например, удаляет каталог)
+def measure(function, prepare=None):
+    if prepare:
+        prepare()
+    started = time.perf_counter()
+    function()
+    wall_time = time.perf_counter() - started
+
+    if prepare:
+        prepare()
+    tracemalloc.start()
+    with FsCounters() as counters:
+        function()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    result = {'wall_time': wall_time, 'peak_memory': peak}
+    result.update(counters.values)
+    return result
+
+
+def get_version():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Функция для запуска бенчмарков на дереве одного размера
+# cold - первый вызов с пустым каталогом, warm - повторный вызов без изменений на диске
+def run_size(size, servers, databases, days, work_dir):
+    tree_path = os.path.join(work_dir, f'tree-{size}')
+    if not os.path.isdir(tree_path):
+        generate_backup_tree(tree_path, servers, databases, days)
+    files = sum(len(names) for _, _, names in os.walk(tree_path))
+
+    benchmarks = {
+        'get_latest_backups': lambda: backup_manager.get_latest_backups(tree_path, [], []),
+        'get_today_backups': lambda: backup_manager.get_today_backups(tree_path, [], []),
+        'get_backup_history': lambda: backup_manager.get_backup_history(tree_path, 'SRV000'),
+        'generate_backup_message': lambda: backup_manager.generate_backup_message(tree_path, [], [], logger),
+    }
+
+    catalog_path = os.path.join(work_dir, 'backup_catalog.db')
+
+    def drop_catalog():
+        backup_manager.close_catalogs()
+        if os.path.exists(catalog_path):
+            os.remove(catalog_path)
+
+    results = []
+    for name, function in benchmarks.items():
+        for phase in ('cold', 'warm'):
+            result = {'size': size, 'servers': servers, 'databases': databases, 'days': days, 'files': files, 'function': name, 'phase': phase}
+            result.update(measure(function, drop_catalog if phase == 'cold' else None))
+            results.append(result)
+            print(f"{size:<8} {name:<25} {phase:<5} {result['wall_time'] * 1000:>10.1f} мс  "
+                  f"файлов: {result['files_visited']:>7}  stat: {result['stat_calls']:>7}  "
+                  f"память: {result['peak_memory'] / 1024:>9.0f} КБ")
+    return results
+
+
+# Функция для сравнения результатов с сохранёнными ранее (например, из предыдущей версии)
+def compare(results, baseline_path):
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = {
+            (item['size'], item['function'], item['phase']): item
+            for item in json.load(f)['results']
+        }
+    print(f'\nСравнение с {baseline_path}:')
+    for item in results:
+        old = baseline.get((item['size'], item['function'], item['phase']))
+        if old is None or not old['wall_time']:
+            continue
+        ratio = item['wall_time'] / old['wall_time']
+        print(f"{item['size']:<8} {item['function']:<25} {item['phase']:<5} x{ratio:.2f}  "
+              f"({old['wall_time'] * 1000:.1f} мс -> {item['wall_time'] * 1000:.1f} мс)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарки сканирования резервных копий')
+    parser.add_argument('--sizes', default='small,medium', help='размеры дерева через запятую: ' + ', '.join(SIZES))
+    parser.add_argument('--work-dir', help='папка для деревьев и каталога (по умолчанию временная; сгенерированные деревья переиспользуются)')
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--compare', help='JSON с результатами предыдущего запуска')
+    parser.add_argument('--timestamp-source', choices=('mtime', 'filename', 'filename_mtime'), default='mtime')
+    args = parser.parse_args()
+
+    work_dir = os.path.abspath(args.work_dir or tempfile.mkdtemp(prefix='backup-bench-'))
+    os.makedirs(work_dir, exist_ok=True)
+    output = os.path.abspath(args.output)
+
+    # Бот читает config.ini из текущей папки: подкладываем свой, чтобы каталог создавался в work_dir
+    with open(os.path.join(work_dir, 'config.ini'), 'w') as f:
+        f.write('[Paths]\nbackup_path_file = .\ncatalog_file = backup_catalog.db\n\n'
+                f'[Scan]\nmax_workers = 4\ntimestamp_source = {args.timestamp_source}\n')
+    previous_dir = os.getcwd()
+    os.chdir(work_dir)
+
+    results = []
+    try:
+        for size in args.sizes.split(','):
+            servers, databases, days = SIZES[size.strip()]
+            results.extend(run_size(size.strip(), servers, databases, days, work_dir))
+    finally:
+        backup_manager.close_catalogs()
+        os.chdir(previous_dir)
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        'version': get_version(),
+        'timestamp_source': args.timestamp_source,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'results': results,
+    }
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f'\nРезультаты сохранены в {output}')
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+import os
+import random
+import argparse
+from datetime import datetime, timedelta
+
+# Предустановленные размеры синтетического дерева: (серверов, БД на сервер, дней истории)
+SIZES = {
+    'small': (10, 3, 30),
+    'medium': (30, 5, 90),
+    'large': (100, 5, 365),
+}
+
+NOISE_FILES = ('backup.log', 'readme.txt', 'Thumbs.db', 'partial.zip.tmp', 'old-format.zip')
+
+
+# Функция для генерации синтетического дерева бэкапов
+# Имена файлов - в формате parse_backup_filename, mtime совпадает со временем в имени файла.
+# Файлы создаются разреженными (os.truncate), поэтому даже большие деревья почти не занимают места.
+def generate_backup_tree(root, servers, databases, days, seed=0, now=None):
+    rng = random.Random(seed)
+    now = (now or datetime.now()).replace(microsecond=0)
+    files = 0
+
+    for server_index in range(servers):
+        servername = f'SRV{server_index:03d}'
+        server_path = os.path.join(root, servername)
+        for db_index in range(databases):
+            dbname = f'DB{db_index:02d}'
+            base_size = rng.randint(10, 500) * 1024 * 1024
+            for day in range(days):
+                backup_time = (now - timedelta(days=day)).replace(hour=rng.randint(0, 23), minute=rng.randint(0, 59), second=rng.randint(0, 59))
+                if backup_time > now:
+                    backup_time -= timedelta(days=1)
+
+                # Вложенные папки: сервер/БД/год-месяц
+                dir_path = os.path.join(server_path, dbname, backup_time.strftime('%Y-%m'))
+                os.makedirs(dir_path, exist_ok=True)
+                filename = f"{servername}-{dbname}_{backup_time.strftime('%d-%m-%Y_%H_%M_%S')}.zip"
+                path = os.path.join(dir_path, filename)
+                with open(path, 'wb') as f:
+                    f.truncate(int(base_size * rng.uniform(0.9, 1.1)))
+                timestamp = backup_time.timestamp()
+                os.utime(path, (timestamp, timestamp))
+                files += 1
+
+            # Посторонние файлы, которые сканер должен пропускать
+            for noise in NOISE_FILES:
+                open(os.path.join(server_path, dbname, noise), 'wb').close()
+                files += 1
+
+    # Директории получают mtime последнего записанного в них файла, как на настоящем ресурсе:
+    # иначе все они изменены только что, и каталог перечитывает их при каждом сканировании (MTIME_GRANULARITY)
+    oldest = (now - timedelta(days=days)).timestamp()
+    for dir_path, dirnames, filenames in os.walk(root, topdown=False):
+        newest = oldest
+        for name in dirnames + filenames:
+            path = os.path.join(dir_path, name)
+            if name in NOISE_FILES:
+                os.utime(path, (oldest, oldest))
+            newest = max(newest, os.stat(path).st_mtime)
+        os.utime(dir_path, (newest, newest))
+
+    return files
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Генерация синтетического дерева бэкапов')
+    parser.add_argument('root')
+    parser.add_argument('--size', choices=SIZES, default='small')
+    parser.add_argument('--servers', type=int)
+    parser.add_argument('--databases', type=int)
+    parser.add_argument('--days', type=int)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    servers, databases, days = SIZES[args.size]
+    files = generate_backup_tree(
+        args.root,
+        args.servers or servers,
+        args.databases or databases,
+        args.days or days,
+        args.seed,
+    )
+    print(f'Создано файлов: {files}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,12 @@
+import os
+import logging
+import threading
 import configparser
 
+from server_filter import compile_server_filter
+
+logger = logging.getLogger(__name__)
+
 #       
 def read_config():
     config = configparser.ConfigParser()
@@ -20,20 +27,298 @@ def write_chat_id(chat_id):
 
 #       
 def get_config_values():
-    config = read_config()
-    backup_path_file = config['Paths']['BACKUP_PATH_FILE']
-    server_list_allowed = config['Servers']['SERVER_LIST_ALLOWED'].split(', ')
-    server_list_disallowed = config['Servers']['SERVER_LIST_DISALLOWED'].split(', ')
-    chat_id = config['Notification']['CHAT_ID']
-    time_notification = config['Notification']['TIME_NOTIFICATION']
-    return backup_path_file, server_list_allowed, server_list_disallowed, chat_id, time_notification
-
-# experimental
+    settings = config_store.current()
+    return settings.backup_path_file, settings.server_list_allowed, settings.server_list_disallowed, settings.chat_id, settings.time_notification
+
+#     config.ini ( /reloadconfig)
 def reload_config():
-    global BACKUP_PATH_FILE, SERVER_LIST_ALLOWED, SERVER_LIST_DISALLOWED, TIME_NOTIFICATION, CHAT_ID
-    config = read_config()
-    BACKUP_PATH_FILE = config['Paths']['BACKUP_PATH_FILE']
-    SERVER_LIST_ALLOWED = config['Servers']['SERVER_LIST_ALLOWED'].split(', ')
-    SERVER_LIST_DISALLOWED = config['Servers']['SERVER_LIST_DISALLOWED'].split(', ')
-    TIME_NOTIFICATION = config['Notification']['TIME_NOTIFICATION']
-    CHAT_ID = config.get('Notification', 'CHAT_ID', fallback=None)
+    return config_store.reload()
+
+#   config.ini.  :      
+#      ,  get_*      config_store.current()
+class BotConfig:
+    def __init__(self, config, mtime):
+        self.mtime = mtime
+        self.backup_path_file = config.get('Paths', 'BACKUP_PATH_FILE', fallback='')
+        self.server_list_allowed = split_list(config.get('Servers', 'SERVER_LIST_ALLOWED', fallback=''))
+        self.server_list_disallowed = split_list(config.get('Servers', 'SERVER_LIST_DISALLOWED', fallback=''))
+        self.chat_id = config.get('Notification', 'CHAT_ID', fallback=None)
+        self.time_notification = config.get('Notification', 'TIME_NOTIFICATION', fallback=None)
+        #        
+        self.server_filter = compile_server_filter(self.server_list_allowed, self.server_list_disallowed)
+
+        self.catalog_path = config.get('Paths', 'CATALOG_FILE', fallback='backup_catalog.db')
+        self.scan_workers = config.getint('Scan', 'MAX_WORKERS', fallback=4)
+        self.scan_timeout = config.getfloat('Scan', 'TIMEOUT', fallback=60)
+        self.timestamp_source = config.get('Scan', 'TIMESTAMP_SOURCE', fallback='mtime')
+        self.watch_settings = (
+            config.getboolean('Watch', 'ENABLED', fallback=False),
+            config.get('Watch', 'MODE', fallback='auto'),
+            config.getint('Watch', 'POLL_INTERVAL', fallback=60),
+        )
+        self.cache_ttl = config.getint('Cache', 'TTL', fallback=30)
+        self.bot_settings = {
+            'mode': config.get('Bot', 'MODE', fallback='polling'),
+            'max_concurrency': config.getint('Bot', 'MAX_CONCURRENCY', fallback=8),
+            'webhook_url': config.get('Bot', 'WEBHOOK_URL', fallback=''),
+            'webhook_listen': config.get('Bot', 'WEBHOOK_LISTEN', fallback='127.0.0.1'),
+            'webhook_port': config.getint('Bot', 'WEBHOOK_PORT', fallback=8443),
+            'webhook_path': config.get('Bot', 'WEBHOOK_PATH', fallback='/telegram'),
+            'secret_token': config.get('Bot', 'SECRET_TOKEN', fallback=''),
+        }
+        self.notification_routes = {}
+        if config.has_section('Routing'):
+            for chat_id, servers in config.items('Routing'):
+                servers = tuple(split_list(servers))
+                self.notification_routes[chat_id] = None if '*' in servers else servers
+        self.outbound_limits = (
+            config.getfloat('Outbound', 'GLOBAL_RATE', fallback=25),
+            config.getfloat('Outbound', 'CHAT_RATE', fallback=1),
+            config.getfloat('Outbound', 'GROUP_RATE_PER_MINUTE', fallback=20),
+        )
+        self.metrics_settings = (
+            config.getboolean('Metrics', 'ENABLED', fallback=False),
+            config.get('Metrics', 'LISTEN', fallback='127.0.0.1'),
+            config.getint('Metrics', 'PORT', fallback=9108),
+        )
+        self.verify_settings = (
+            config.getboolean('Verify', 'ENABLED', fallback=False),
+            config.getint('Verify', 'WORKERS', fallback=1),
+            config.getfloat('Verify', 'BANDWIDTH_MB', fallback=20),
+        )
+        self.extra_roots = read_extra_roots(config, self.scan_workers, self.scan_timeout)
+        self.schedules = read_schedules(config)
+        self.missed_run_window = config.getfloat('Notification', 'CATCH_UP', fallback=43200)
+        self.delta_settings = (
+            config.getboolean('Notification', 'DELTA', fallback=True),
+            config.getfloat('Notification', 'REMIND_DAYS', fallback=3),
+            config.getboolean('Notification', 'SEND_UNCHANGED', fallback=False),
+        )
+        self.freshness_rules = tuple(config.items('Freshness')) if config.has_section('Freshness') else ()
+        self.retention_rules = tuple(config.items('Retention')) if config.has_section('Retention') else ()
+        self.usage_settings = (
+            config.getint('Usage', 'TREND_DAYS', fallback=14),
+            config.getint('Usage', 'ANOMALY_DAYS', fallback=7),
+            config.getfloat('Usage', 'ANOMALY_PERCENT', fallback=50),
+        )
+
+    #          
+    def handler_values(self):
+        return {
+            'BACKUP_PATH_FILE': self.backup_path_file,
+            'SERVER_LIST_ALLOWED': self.server_list_allowed,
+            'SERVER_LIST_DISALLOWED': self.server_list_disallowed,
+            'CHAT_ID': self.chat_id,
+        }
+
+#      
+def split_list(value):
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+#  :  config.ini,     ,
+#       (listener(old, new))
+# current()     (,  ):      
+# ,      ,      , 
+#  .     ,    ,    .
+class ConfigStore:
+    def __init__(self, path='config.ini'):
+        self.path = path
+        self._config = None
+        self._failed_version = None
+        self.error = None  #    ,      
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    # loop -  ,    listener; None -  ,  
+    def subscribe(self, listener, loop=None):
+        with self._lock:
+            self._listeners.append((listener, loop))
+
+    def unsubscribe(self, listener):
+        with self._lock:
+            self._listeners = [(subscribed, loop) for subscribed, loop in self._listeners if subscribed is not listener]
+
+    #      ( stat   )
+    def current(self):
+        version = self._file_version()
+        config = self._config
+        if config is not None and (config.mtime == version or self._failed_version == version):
+            return config
+        return self._load(version)
+
+    def reload(self):
+        return self._load(self._file_version(), force=True)
+
+    #     :   ,   
+    def _file_version(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _load(self, version, force=False):
+        with self._lock:
+            old = self._config
+            #   ,     
+            if not force and old is not None and (old.mtime == version or self._failed_version == version):
+                return old
+            try:
+                config = configparser.ConfigParser()
+                config.read(self.path)
+                new = BotConfig(config, version)
+            except (configparser.Error, ValueError) as e:
+                if old is None:
+                    raise
+                #       ,     
+                self._failed_version = version
+                self.error = str(e)
+                logger.error(f"{self.path}: {e}. The previous configuration is kept until the file is fixed.")
+                return old
+            self._config = new
+            self._failed_version = None
+            self.error = None
+            listeners = list(self._listeners) if old is not None else []
+        for listener, loop in listeners:
+            if loop is None:
+                listener(old, new)
+            else:
+                loop.call_soon_threadsafe(listener, old, new)
+        return new
+
+config_store = ConfigStore()
+
+#         (    config.ini)
+def get_catalog_path():
+    return config_store.current().catalog_path
+
+#       (    )
+def get_scan_workers():
+    return config_store.current().scan_workers
+
+#         : (, ,  )
+def get_watch_settings():
+    return config_store.current().watch_settings
+
+#         ( )
+def get_cache_ttl():
+    return config_store.current().cache_ttl
+
+#      :
+# mtime -   , filename -    ,
+# filename_mtime -       mtime    
+def get_timestamp_source():
+    return config_store.current().timestamp_source
+
+#      update (polling  webhook)
+def get_bot_settings():
+    return dict(config_store.current().bot_settings)
+
+#      : {chat_id:    None ( )}
+#   [Routing]  - id ,  -     *
+def get_notification_routes():
+    return dict(config_store.current().notification_routes)
+
+#       (      ,    )
+def get_outbound_limits():
+    return config_store.current().outbound_limits
+
+#     HTTP-  (/metrics   Prometheus)
+def get_metrics_settings():
+    return config_store.current().metrics_settings
+
+#        (      /, 0 -  )
+def get_verify_settings():
+    return config_store.current().verify_settings
+
+#         [Paths] (ROOT.<> = )
+#         (ROOT.<>.MAX_WORKERS)     (ROOT.<>.TIMEOUT),
+#    [Scan] MAX_WORKERS  [Scan] TIMEOUT
+#  main    (BACKUP_PATH_FILE),        
+def read_extra_roots(config, max_workers, timeout):
+    roots = []
+    if config.has_section('Paths'):
+        for key, path in config.items('Paths'):
+            parts = key.split('.')
+            if len(parts) != 2 or parts[0] != 'root' or not path:
+                continue
+            name = parts[1]
+            if name == 'main':
+                raise ValueError("[Paths] ROOT.main: the name 'main' is reserved for BACKUP_PATH_FILE, choose another root name")
+            roots.append({
+                'name': name,
+                'path': path,
+                'max_workers': config.getint('Paths', f'root.{name}.max_workers', fallback=max_workers),
+                'timeout': config.getfloat('Paths', f'root.{name}.timeout', fallback=timeout),
+            })
+    return roots
+
+#      :  (BACKUP_PATH_FILE)    [Paths]
+def get_backup_roots(backup_path_file=None):
+    settings = config_store.current()
+    if backup_path_file is None:
+        backup_path_file = settings.backup_path_file
+
+    roots = []
+    if backup_path_file:
+        roots.append({'name': 'main', 'path': backup_path_file, 'max_workers': settings.scan_workers, 'timeout': settings.scan_timeout})
+    roots.extend(dict(root) for root in settings.extra_roots)
+    return roots
+
+#     
+#   default   [Notification] (MODE, TIME_NOTIFICATION, DAYS),  -  [Schedule.<>]
+# MODE - EVERYDAY, WEEKDAYS, HOURLY  OFF; DAYS -     cron (mon-fri, sat,sun);
+# SERVERS -     ; CHAT_ID -   (  CHAT_ID   [Routing]);
+# LEAD_TIME -       
+def read_schedules(config):
+    lead_time = config.getfloat('Notification', 'LEAD_TIME', fallback=300)
+    schedules = [{
+        'name': 'default',
+        'mode': config.get('Notification', 'MODE', fallback='EVERYDAY').upper(),
+        'time': config.get('Notification', 'TIME_NOTIFICATION', fallback=None),
+        'days': config.get('Notification', 'DAYS', fallback='') or None,
+        'servers': None,
+        'chat_id': None,
+        'lead_time': lead_time,
+    }]
+    for section in config.sections():
+        if not section.startswith('Schedule.'):
+            continue
+        schedules.append({
+            'name': section.split('.', 1)[1],
+            'mode': config.get(section, 'MODE', fallback='EVERYDAY').upper(),
+            'time': config.get(section, 'TIME', fallback=None),
+            'days': config.get(section, 'DAYS', fallback='') or None,
+            'servers': tuple(split_list(config.get(section, 'SERVERS', fallback=''))) or None,
+            'chat_id': config.get(section, 'CHAT_ID', fallback='') or None,
+            'lead_time': config.getfloat(section, 'LEAD_TIME', fallback=lead_time),
+        })
+    return schedules
+
+#     
+def get_schedules():
+    return [dict(schedule) for schedule in config_store.current().schedules]
+
+#        ( ):       ,
+#        ,         
+def get_missed_run_window():
+    return config_store.current().missed_run_window
+
+#      :     (DELTA)
+#         REMIND_DAYS  (0 -  );
+# SEND_UNCHANGED -  ,      (    )
+def get_delta_settings():
+    return config_store.current().delta_settings
+
+#        [Freshness]:  (/, )   
+def get_freshness_rules():
+    return config_store.current().freshness_rules
+
+#        [Retention]:  (/, )   
+def get_retention_rules():
+    return config_store.current().retention_rules
+
+#      :   (),   ()
+#       (   )
+def get_usage_settings():
+    return config_store.current().usage_settings
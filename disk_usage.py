@@ -0,0 +1,39 @@
+import statistics
+
+# Аналитика размеров бэкапов: тренд роста и аномалии размера последнего бэкапа.
+# Считается по размерам из каталога (points - [(mtime, size)] по возрастанию mtime), к файлам не обращается.
+
+DAY = 86400
+
+
+# Функция для оценки тренда размера бэкапов: наклон прямой по методу наименьших квадратов, байт в сутки
+# None - если точек меньше двух или все бэкапы сделаны в одно время
+def size_trend(points):
+    if len(points) < 2:
+        return None
+    xs = [mtime / DAY for mtime, size in points]
+    ys = [size for mtime, size in points]
+    mean_x = sum(xs) / len(xs)
+    mean_y = sum(ys) / len(ys)
+    variance = sum((x - mean_x) ** 2 for x in xs)
+    if not variance:
+        return None
+    return sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / variance
+
+
+# Функция для поиска аномалии размера последнего бэкапа: сравнение с медианой бэкапов за window_days дней до него
+# Возвращает (отклонение в процентах, медиана) или None, если отклонение меньше percent или истории недостаточно
+def size_anomaly(points, window_days=7, percent=50, min_points=3):
+    if len(points) < min_points + 1:
+        return None
+    mtime, size = points[-1]
+    previous = [previous_size for previous_mtime, previous_size in points[:-1] if previous_mtime >= mtime - window_days * DAY]
+    if len(previous) < min_points:
+        return None
+    median = statistics.median(previous)
+    if median <= 0:
+        return None
+    change = (size - median) / median * 100
+    if abs(change) < percent:
+        return None
+    return change, median
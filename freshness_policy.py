@@ -0,0 +1,149 @@
+import re
+import time
+import logging
+from datetime import datetime, timedelta
+from fnmatch import translate
+from functools import lru_cache
+
+from server_filter import GLOB_CHARS
+
+# Правила свежести бэкапов по парам (сервер, БД) из config.ini, секция [Freshness].
+# Ключ - "сервер/БД" с шаблонами (*, ?, [...]), значение - ожидаемый интервал между бэкапами, например:
+#   1h             - бэкап не старше часа
+#   1w             - бэкап не старше недели
+#   1d at 15:00    - бэкап не старше 15:00 предыдущего дня (окно привязано ко времени суток)
+#   off            - свежесть не проверяется
+# Правила разбираются один раз; для каждой пары правило находится один раз и запоминается,
+# а начало окна вычисляется один раз на правило за проход по всем бэкапам.
+
+UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 7 * 86400}
+POLICY_PATTERN = re.compile(
+    r'^(?P<count>\d+(?:\.\d+)?)\s*(?P<unit>[smhdw])(?:\s+at\s+(?P<at>\d{1,2}:\d{2}(?::\d{2})?))?$', re.IGNORECASE
+)
+
+# Правило по умолчанию - бэкап сделан не раньше 15:00 предыдущего дня
+DEFAULT_POLICY = '1d at 15:00'
+
+# Отметка "правило не найдено" (None означает правило off)
+NO_RULE = object()
+
+
+# Правило свежести: интервал в секундах и необязательное время суток, к которому привязано окно
+class Policy:
+    __slots__ = ('text', 'interval', 'at')
+
+    def __init__(self, text, interval, at=None):
+        self.text = text
+        self.interval = interval
+        self.at = at
+
+    # Функция для получения начала окна (epoch): бэкапы старше него считаются просроченными
+    def window_start(self, now):
+        if self.at is None:
+            return now - self.interval
+        now_datetime = datetime.fromtimestamp(now)
+        start = datetime.combine(now_datetime.date(), self.at) - timedelta(seconds=self.interval)
+        while start > now_datetime:
+            start -= timedelta(days=1)
+        return start.timestamp()
+
+    def __repr__(self):
+        return f'Policy({self.text!r})'
+
+
+# Функция для разбора значения правила; None - свежесть не проверяется (off)
+def parse_policy(text):
+    text = text.strip()
+    if text.lower() == 'off':
+        return None
+    match = POLICY_PATTERN.match(text)
+    if not match:
+        raise ValueError(f"неправильное правило свежести: {text!r}")
+    interval = float(match['count']) * UNITS[match['unit'].lower()]
+    at = None
+    if match['at']:
+        at_format = '%H:%M:%S' if match['at'].count(':') == 2 else '%H:%M'
+        at = datetime.strptime(match['at'], at_format).time()
+    return Policy(text, interval, at)
+
+
+class FreshnessPolicy:
+    # rules - пары (ключ "сервер/БД" или "сервер", значение правила) в порядке config.ini
+    # Приоритет: точный ключ "сервер/БД", затем "сервер", затем шаблоны по порядку до первого совпадения
+    # section - секция config.ini для сообщений об ошибках в правилах
+    def __init__(self, rules, default=DEFAULT_POLICY, logger=None, section='Freshness'):
+        self._exact = {}
+        self._patterns = []
+        for key, value in rules:
+            servername, _, dbname = key.strip().lower().partition('/')
+            try:
+                policy = parse_policy(value)
+            except ValueError as e:
+                if logger:
+                    logger.error(f"[{section}] {key}: {e}. Правило пропущено.")
+                continue
+            # Ключи "сервер" и "сервер/*" без шаблонов в имени сервера - правило сервера, а не шаблон
+            dbname = dbname or '*'
+            if GLOB_CHARS & set(servername) or (dbname != '*' and GLOB_CHARS & set(dbname)):
+                self._patterns.append((re.compile(translate(servername)), re.compile(translate(dbname)), policy))
+            else:
+                self._exact.setdefault((servername, dbname), policy)
+        self.default = parse_policy(default)
+        self._policies = {}
+
+    # Функция для получения правила пары (сервер, БД); результат запоминается
+    def policy(self, servername, dbname):
+        key = (servername, dbname)
+        try:
+            return self._policies[key]
+        except KeyError:
+            pass
+        server_lower, db_lower = servername.lower(), (dbname or '').lower()
+        policy = self._exact.get((server_lower, db_lower), NO_RULE)
+        if policy is NO_RULE:
+            policy = self._exact.get((server_lower, '*'), NO_RULE)
+        if policy is NO_RULE:
+            policy = self.default
+            for server_pattern, db_pattern, pattern_policy in self._patterns:
+                if server_pattern.match(server_lower) and db_pattern.match(db_lower):
+                    policy = pattern_policy
+                    break
+        self._policies[key] = policy
+        return policy
+
+    # Функция для оценки свежести всех бэкапов за один проход
+    # backups - {(servername, dbname): info}; возвращает {(servername, dbname): (свежий ли, просрочка в секундах или None)}
+    # Просрочка - на сколько последний бэкап старше начала окна; для пар без бэкапов - None
+    def evaluate(self, backups, now=None):
+        now = time.time() if now is None else now
+        starts = {}
+        results = {}
+        for key, info in backups.items():
+            policy = self.policy(*key)
+            mtime = info.get('mtime') if info else None
+            if mtime is None:
+                results[key] = (policy is None and key[1] is not None, None)
+                continue
+            if policy is None:
+                results[key] = (True, None)
+                continue
+            start = starts.get(policy)
+            if start is None:
+                start = starts[policy] = policy.window_start(now)
+            if mtime < start:
+                results[key] = (False, start - mtime)
+            else:
+                # Бэкап с временем в будущем (расхождение часов) свежим не считается
+                results[key] = (mtime <= now, None)
+        return results
+
+
+# Функция для получения правил свежести; одинаковые правила компилируются один раз
+# Те же правила используются для сроков хранения ([Retention], правило по умолчанию off)
+def compile_freshness_policy(rules, default=DEFAULT_POLICY, section='Freshness'):
+    return _compile_freshness_policy(tuple(rules), default, section)
+
+
+@lru_cache(maxsize=8)
+def _compile_freshness_policy(rules, default, section):
+    return FreshnessPolicy(rules, default, logging.getLogger(__name__), section)
@@ -0,0 +1,84 @@
+import asyncio
+from urllib.parse import urlsplit
+
+# Минимальный HTTP/1.1 сервер на asyncio без внешних зависимостей.
+# Используется для приёма webhook от Telegram. Поддерживает keep-alive: несколько запросов в одном соединении.
+
+MAX_BODY_SIZE = 10 * 1024 * 1024
+
+REASONS = {200: 'OK', 400: 'Bad Request', 403: 'Forbidden', 404: 'Not Found', 405: 'Method Not Allowed', 413: 'Payload Too Large', 429: 'Too Many Requests', 500: 'Internal Server Error'}
+
+
+class HttpRequest:
+    def __init__(self, method, path, query, headers, body):
+        self.method = method
+        self.path = path
+        self.query = query
+        self.headers = headers  # имена заголовков в нижнем регистре
+        self.body = body
+
+
+# Функция для чтения одного HTTP-запроса из потока (None, если соединение закрыто или запрос некорректен)
+async def read_http_request(reader):
+    try:
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        method, target, _ = request_line.decode('latin-1').split(' ', 2)
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get('content-length', 0))
+        if length > MAX_BODY_SIZE:
+            return None
+        body = await reader.readexactly(length) if length else b''
+    except (ValueError, asyncio.IncompleteReadError, ConnectionError):
+        return None
+    url = urlsplit(target)
+    return HttpRequest(method.upper(), url.path, url.query, headers, body)
+
+
+# Функция для записи HTTP-ответа
+async def write_http_response(writer, status, body=b'', content_type='text/plain; charset=utf-8', keep_alive=False):
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    head = (
+        f'HTTP/1.1 {status} {REASONS.get(status, "Unknown")}\r\n'
+        f'Content-Type: {content_type}\r\n'
+        f'Content-Length: {len(body)}\r\n'
+        f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n'
+    )
+    writer.write(head.encode('latin-1') + body)
+    try:
+        await writer.drain()
+    except ConnectionError:
+        pass
+
+
+# Функция для запуска HTTP-сервера
+# handler - корутина (HttpRequest) -> (status, body, content_type)
+async def start_http_server(handler, host, port, logger=None):
+    async def handle_connection(reader, writer):
+        try:
+            while True:
+                request = await read_http_request(reader)
+                if request is None:
+                    return
+                try:
+                    status, body, content_type = await handler(request)
+                except Exception as e:
+                    if logger:
+                        logger.exception(f"Ошибка обработки HTTP-запроса {request.path}: {e}")
+                    status, body, content_type = 500, b'', 'text/plain; charset=utf-8'
+                keep_alive = request.headers.get('connection', '').lower() != 'close'
+                await write_http_response(writer, status, body, content_type, keep_alive)
+                if not keep_alive:
+                    return
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle_connection, host, port)
@@ -0,0 +1,164 @@
+# Формирование текстов ответов бота.
+# Строки собираются в список и склеиваются один раз, экранирование MarkdownV2 выполняется
+# за один проход по таблице, а большие отчёты разбиваются на несколько сообщений по границам строк.
+
+import re
+
+# Максимальная длина сообщения Telegram
+MESSAGE_LIMIT = 4096
+
+CODE_BLOCK_OPEN = '```\n'
+CODE_BLOCK_CLOSE = '```'
+
+# Символы, которые нужно экранировать в MarkdownV2 (кроме `, иначе сломаются блоки кода)
+MARKDOWN_V2_ESCAPE = str.maketrans({char: '\\' + char for char in '_*[]()~>#+-=|{}.!'})
+
+# Символ вместе с экранирующей его обратной косой чертой - при разбиении строки не разделяется
+ESCAPED_CHAR = re.compile(r'\\.|.', re.S)
+
+
+# Отметки результата проверки целостности архива (zip_verifier)
+VERIFICATION_LABELS = {'verified': 'проверен', 'unverified': 'не проверен', 'corrupt': 'ПОВРЕЖДЁН'}
+VERIFICATION_LABELS_MOBILE = {'verified': '✓', 'unverified': '?', 'corrupt': '✗'}
+
+
+# Функция для экранирования текста для MarkdownV2 (один проход по строке)
+def escape_markdown_v2(text):
+    return text.translate(MARKDOWN_V2_ESCAPE)
+
+
+# Функция для форматирования статуса бэкапа
+def format_backup_status(servername, dbname, datetime, timezone, missing="НЕТ", verification=None):
+    if datetime is not None:
+        date_str = datetime.strftime('%d.%m.%Y %H:%M:%S')
+    else:
+        date_str = missing
+    line = f"{servername:<15} | БД: {dbname if dbname else 'Неизвестно':<20} | {date_str}"
+    if verification is not None and datetime is not None:
+        line += f" | {VERIFICATION_LABELS[verification]}"
+    return line
+
+
+# Функция для форматирования статуса бэкапа (мобильная версия)
+def format_backup_status_mobile(servername, dbname, datetime, missing="НЕТ", verification=None):
+    if datetime is not None:
+        date_str = datetime.strftime('%d.%m.%Y')
+    else:
+        date_str = missing
+    line = f"{servername[:10]:<10}|{dbname if dbname else 'Неизвестно'[:10]:<10}|{date_str}"
+    if verification is not None and datetime is not None:
+        line += VERIFICATION_LABELS_MOBILE[verification]
+    return line
+
+
+# Отметки переходов в разностном уведомлении (notification_state)
+TRANSITION_LABELS = {'failed': 'ОШИБКА', 'still_failing': 'ОШИБКА {days} дн.', 'recovered': 'ВОССТАНОВЛЕН'}
+
+
+# Функция для форматирования строки перехода: отметка перехода и строка статуса бэкапа
+def format_transition(kind, servername, dbname, datetime, timezone, days=None, verification=None, overdue=None):
+    label = TRANSITION_LABELS[kind].format(days=days)
+    row = f"{label:<16} | " + format_backup_status(servername, dbname, datetime, timezone, verification=verification)
+    if overdue is not None:
+        row += f" | просрочен на {format_duration(overdue)}"
+    return row
+
+
+# Функция для форматирования длительности просрочки: "2 д 3 ч", "5 ч 10 мин", "12 мин"
+def format_duration(seconds):
+    minutes = int(seconds // 60)
+    days, minutes = divmod(minutes, 1440)
+    hours, minutes = divmod(minutes, 60)
+    if days:
+        return f"{days} д {hours} ч"
+    if hours:
+        return f"{hours} ч {minutes} мин"
+    return f"{minutes} мин"
+
+
+# Функция для форматирования размера: "512 Б", "1.5 МБ", "2.3 ТБ"
+def format_size(size):
+    for unit in ('Б', 'КБ', 'МБ', 'ГБ'):
+        if abs(size) < 1024:
+            return f"{size:.0f} {unit}" if unit == 'Б' else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} ТБ"
+
+
+# Функция для получения строк таблицы статуса в нужной раскладке (desktop или mobile)
+# backups - {(servername, dbname): info}; если задан reference, время берётся из него,
+# а пары, которых там нет, выводятся как отсутствующие (текст missing)
+# Если у бэкапа есть отметка проверки архива (info['verification']), она выводится в конце строки
+# overdue - {(servername, dbname): секунды}: для просроченных пар выводится время последнего бэкапа и просрочка
+def render_status_rows(backups, layout='desktop', timezone=None, reference=None, missing="НЕТ", overdue=None):
+    rows = []
+    for (servername, dbname), info in backups.items():
+        late = overdue.get((servername, dbname)) if overdue else None
+        if reference is not None and late is None:
+            info = reference.get((servername, dbname))
+        backup_datetime = info['datetime'] if info else None
+        verification = info.get('verification') if info else None
+        if layout == 'mobile':
+            row = format_backup_status_mobile(servername, dbname, backup_datetime, missing, verification)
+        else:
+            row = format_backup_status(servername, dbname, backup_datetime, timezone, missing, verification)
+        if late is not None:
+            row += f" | просрочен на {format_duration(late)}"
+        rows.append(row)
+    return rows
+
+
+# Функция для разбиения уже экранированной строки на части не длиннее width
+# Экранированный символ (\\x) не разрывается, иначе обратная черта в конце части экранирует перевод строки или ```
+def split_long_line(text, width):
+    if len(text) <= width:
+        return [text]
+    pieces = []
+    piece = []
+    size = 0
+    for char in ESCAPED_CHAR.findall(text):
+        if size + len(char) > width:
+            pieces.append(''.join(piece))
+            piece = []
+            size = 0
+        piece.append(char)
+        size += len(char)
+    pieces.append(''.join(piece))
+    return pieces
+
+
+# Функция для сборки отчёта из заголовка и строк таблицы в блоке кода
+# Возвращает список сообщений не длиннее limit: отчёт делится по границам строк,
+# каждый фрагмент таблицы закрывается и открывается заново, заголовок выводится только в первом сообщении.
+# Строка, которая вместе с ``` не помещается в одно сообщение, переносится на следующие
+def render_report(header, rows, markdown_v2=False, limit=MESSAGE_LIMIT):
+    escape = escape_markdown_v2 if markdown_v2 else str
+    width = limit - len(CODE_BLOCK_OPEN) - len(CODE_BLOCK_CLOSE) - 1
+
+    messages = []
+    parts = [CODE_BLOCK_OPEN]
+    header_pieces = []
+    if header:
+        header_pieces = split_long_line(escape(header), width)
+        messages.extend(header_pieces[:-1])
+        parts = [header_pieces[-1] + '\n' + CODE_BLOCK_OPEN]
+    size = len(parts[0]) + len(CODE_BLOCK_CLOSE)
+    has_rows = False
+    for row in rows:
+        for piece in split_long_line(escape(row), width):
+            line = piece + '\n'
+            if size + len(line) > limit:
+                # Первая строка не помещается вместе с заголовком - заголовок уходит отдельным сообщением
+                if has_rows:
+                    parts.append(CODE_BLOCK_CLOSE)
+                    messages.append(''.join(parts))
+                else:
+                    messages.append(header_pieces[-1])
+                parts = [CODE_BLOCK_OPEN]
+                size = len(CODE_BLOCK_OPEN) + len(CODE_BLOCK_CLOSE)
+            parts.append(line)
+            size += len(line)
+            has_rows = True
+    parts.append(CODE_BLOCK_CLOSE)
+    messages.append(''.join(parts))
+    return messages
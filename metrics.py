@@ -0,0 +1,194 @@
+import time
+import threading
+from bisect import bisect_left
+from functools import wraps
+
+# Метрики бота в памяти процесса и их вывод в текстовом формате Prometheus.
+# Запись метрики - прибавление к числу под блокировкой, поэтому счётчики можно не отключать в работе.
+
+# Границы корзин гистограмм длительности (в секундах)
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, *label_values):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, label_values, value) for label_values, value in self._values.items()]
+
+    def values(self):
+        with self._lock:
+            return dict(self._values)
+
+    type = 'counter'
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=DURATION_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._values = {}  # значения меток -> [счётчики корзин..., сумма, количество]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(label_values)
+            if state is None:
+                state = self._values[label_values] = [0] * (len(self.buckets) + 3)
+            state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    # Функция для приблизительной оценки квантиля по корзинам (верхняя граница корзины)
+    def quantile(self, q, *label_values):
+        with self._lock:
+            state = self._values.get(label_values)
+            if not state:
+                return None
+            state = list(state)
+        target = q * state[-1]
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), state):
+            total += count
+            if total >= target:
+                return bound
+        return float('inf')
+
+    def summary(self):
+        with self._lock:
+            return {label_values: (state[-1], state[-2]) for label_values, state in self._values.items()}
+
+    def samples(self):
+        with self._lock:
+            values = {label_values: list(state) for label_values, state in self._values.items()}
+        samples = []
+        for label_values, state in values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), state):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                samples.append((self.name + '_bucket', label_values + (le,), cumulative))
+            samples.append((self.name + '_sum', label_values, state[-2]))
+            samples.append((self.name + '_count', label_values, state[-1]))
+        return samples
+
+    type = 'histogram'
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    # Функция для регистрации сборщика значений, вычисляемых в момент запроса
+    # collector() -> [(имя, help, значение)], значения выводятся как gauge
+    def add_collector(self, collector):
+        self._collectors.append(collector)
+
+    # Функция для вывода всех метрик в текстовом формате Prometheus
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            label_names = metric.labels + (('le',) if metric.type == 'histogram' else ())
+            for name, label_values, value in metric.samples():
+                lines.append(f'{name}{_format_labels(label_names, label_values)} {_format_value(value)}')
+        for collector in self._collectors:
+            for name, help_text, value in collector():
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} gauge')
+                lines.append(f'{name} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+def _format_labels(names, values):
+    if not values:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+REGISTRY = Registry()
+
+SCAN_DURATION = REGISTRY.register(Histogram('backup_scan_duration_seconds', 'Длительность обновления каталога бэкапов'))
+SCAN_SERVER_SECONDS = REGISTRY.register(Counter('backup_scan_server_seconds_total', 'Суммарное время сканирования папки сервера', ('server',)))
+SCAN_DIRECTORIES = REGISTRY.register(Counter('backup_scan_directories_visited_total', 'Просмотрено директорий', ('server',)))
+SCAN_DIRECTORIES_READ = REGISTRY.register(Counter('backup_scan_directories_read_total', 'Прочитано изменившихся директорий', ('server',)))
+SCAN_FILES = REGISTRY.register(Counter('backup_scan_files_visited_total', 'Просмотрено файлов', ('server',)))
+SCAN_MATCHES = REGISTRY.register(Counter('backup_scan_regex_matches_total', 'Файлов, совпавших с шаблоном имени бэкапа', ('server',)))
+SCAN_STAT_CALLS = REGISTRY.register(Counter('backup_scan_stat_calls_total', 'Вызовов stat при сканировании', ('server',)))
+COMMAND_DURATION = REGISTRY.register(Histogram('bot_command_duration_seconds', 'Длительность обработки команды бота', ('command',)))
+COMMAND_ERRORS = REGISTRY.register(Counter('bot_command_errors_total', 'Команд, завершившихся ошибкой', ('command',)))
+
+SCAN_COUNTERS = (
+    ('directories', SCAN_DIRECTORIES),
+    ('directories_read', SCAN_DIRECTORIES_READ),
+    ('files', SCAN_FILES),
+    ('matches', SCAN_MATCHES),
+    ('stat_calls', SCAN_STAT_CALLS),
+    ('seconds', SCAN_SERVER_SECONDS),
+)
+
+
+# Функция для записи результатов одного сканирования
+# stats - {servername: {'directories', 'directories_read', 'files', 'matches', 'stat_calls', 'seconds'}}
+def record_scan(duration, stats):
+    SCAN_DURATION.observe(duration)
+    for servername, values in stats.items():
+        for key, counter in SCAN_COUNTERS:
+            counter.inc(values[key], servername)
+
+
+# Функция-обёртка для замера длительности обработчика команды
+def instrument_command(command, callback):
+    @wraps(callback)
+    async def timed_callback(update, context):
+        started = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except Exception:
+            COMMAND_ERRORS.inc(1, command)
+            raise
+        finally:
+            COMMAND_DURATION.observe(time.perf_counter() - started, command)
+    return timed_callback
+
+
+# Асинхронная функция для запуска HTTP-эндпоинта /metrics
+async def start_metrics_server(host, port, logger=None):
+    from http_server import start_http_server
+
+    async def handle(request):
+        if request.path != '/metrics':
+            return 404, b'', 'text/plain; charset=utf-8'
+        return 200, REGISTRY.render(), 'text/plain; version=0.0.4; charset=utf-8'
+
+    server = await start_http_server(handle, host, port, logger)
+    if logger:
+        logger.info(f"Метрики доступны на http://{host}:{port}/metrics")
+    return server
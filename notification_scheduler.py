@@ -0,0 +1,226 @@
+import time
+import asyncio
+from datetime import datetime, timedelta
+
+from apscheduler.triggers.cron import CronTrigger
+
+# Расписания уведомлений о бэкапах.
+# Для каждого расписания в APScheduler ставятся две задачи: отправка и подготовка отчёта. Подготовка (сканирование папок)
+# запускается за LEAD_TIME секунд до отправки, поэтому сообщение уходит вовремя даже при медленном сканировании.
+# Время отправки сохраняется в каталоге: если бот был выключен, при запуске пропущенные отправки объединяются в одну.
+
+JOB_PREFIX = 'notify:'
+
+# Поля cron для режимов MODE (время отправки добавляется из TIME_NOTIFICATION / TIME)
+MODES = {
+    'EVERYDAY': {},
+    'WEEKDAYS': {'day_of_week': 'mon-fri'},
+    'HOURLY': {'hour': '*'},
+}
+
+# Ограничение подсчёта пропущенных отправок (для HOURLY после долгого простоя)
+MAX_MISSED_RUNS = 1000
+
+
+# Функция для построения триггера расписания; None - расписание выключено (MODE = OFF) или задано с ошибкой
+def build_trigger(schedule, logger=None):
+    name, mode = schedule['name'], schedule['mode']
+    if mode == 'OFF':
+        return None
+    if mode not in MODES:
+        if logger:
+            logger.error(f"Расписание {name}: неизвестный режим MODE = {mode}. Допустимо: {', '.join(MODES)}, OFF.")
+        return None
+    try:
+        at = datetime.strptime(schedule['time'] or '', '%H:%M:%S').time()
+    except ValueError:
+        if logger:
+            logger.error(f"Расписание {name}: неправильный формат времени {schedule['time']!r}. Ожидается формат HH:MM:SS.")
+        return None
+
+    fields = {'hour': at.hour, 'minute': at.minute, 'second': at.second}
+    fields.update(MODES[mode])
+    if schedule['days']:
+        fields['day_of_week'] = schedule['days']
+    try:
+        return CronTrigger(**fields)
+    except ValueError as e:
+        if logger:
+            logger.error(f"Расписание {name}: неправильное значение DAYS = {schedule['days']}: {e}")
+        return None
+
+
+# Функция для подсчёта отправок, пропущенных с момента last_run (epoch) до now (epoch)
+# Возвращает (число пропущенных отправок, время последней пропущенной или None)
+def count_missed_runs(trigger, last_run, now):
+    last_run = datetime.fromtimestamp(last_run, trigger.timezone)
+    now = datetime.fromtimestamp(now, trigger.timezone)
+    count = 0
+    latest = None
+    fire_time = trigger.get_next_fire_time(last_run, last_run)
+    while fire_time is not None and fire_time <= now and count < MAX_MISSED_RUNS:
+        count += 1
+        latest = fire_time
+        fire_time = trigger.get_next_fire_time(fire_time, fire_time)
+    return count, latest
+
+
+# Функция для получения цикла событий текущего потока (None, если поток не выполняет цикл событий)
+def running_loop():
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+class NotificationScheduler:
+    # prepare(schedule) - корутина, готовящая отчёт (снимок бэкапов)
+    # send(schedule, snapshot, missed) - корутина отправки; missed - число объединённых пропущенных отправок
+    # store - хранилище времени отправок (BackupCatalog: schedule_runs, store_schedule_run)
+    # missed_run_window - пропущенная отправка старше этого числа секунд при запуске не отправляется
+    def __init__(self, scheduler, prepare, send, store, logger, missed_run_window=43200):
+        self.scheduler = scheduler
+        self.prepare = prepare
+        self.send = send
+        self.store = store
+        self.logger = logger
+        self.missed_run_window = missed_run_window
+        self._schedules = {}   # имя -> (расписание, триггер)
+        self._prepared = {}    # имя -> (время отправки, задача подготовки)
+        self._loop = running_loop()
+
+    # Функция для применения расписаний из config.ini; неизменившиеся расписания и подготовленные отчёты сохраняются
+    # Задачи APScheduler и подготовки отчётов принадлежат циклу событий: вызов из другого потока
+    # (например, изменение config.ini заметил поток сканирования) переносится в цикл событий планировщика
+    def configure(self, schedules):
+        if self._loop is not None and running_loop() is not self._loop:
+            self._loop.call_soon_threadsafe(self.configure, schedules)
+            return
+        schedules = {schedule['name']: schedule for schedule in schedules}
+        for name, (schedule, trigger) in list(self._schedules.items()):
+            if schedules.get(name) != schedule:
+                self._remove(name)
+
+        for name, schedule in schedules.items():
+            if name in self._schedules:
+                continue
+            trigger = build_trigger(schedule, self.logger)
+            if trigger is None:
+                continue
+            self._schedules[name] = (schedule, trigger)
+            self.scheduler.add_job(
+                self._run,
+                trigger=trigger,
+                args=[name],
+                id=f'{JOB_PREFIX}send:{name}',
+                replace_existing=True,
+                # Если цикл событий был занят, запоздавшие срабатывания объединяются в одно
+                coalesce=True,
+                misfire_grace_time=int(self.missed_run_window),
+            )
+            self._schedule_prepare(name)
+            self.logger.info(f"Расписание уведомлений {name}: {self.describe(name)}")
+
+    def _remove(self, name):
+        self._schedules.pop(name, None)
+        prepared = self._prepared.pop(name, None)
+        if prepared is not None:
+            prepared[1].cancel()
+        for kind in ('send', 'prepare', 'catchup'):
+            job = self.scheduler.get_job(f'{JOB_PREFIX}{kind}:{name}')
+            if job is not None:
+                job.remove()
+
+    # Функция для описания расписания (режим, время и следующая отправка)
+    def describe(self, name):
+        schedule, trigger = self._schedules[name]
+        job = self.scheduler.get_job(f'{JOB_PREFIX}send:{name}')
+        next_run = job.next_run_time if job is not None and hasattr(job, 'next_run_time') else None
+        if next_run is None:
+            next_run = trigger.get_next_fire_time(None, datetime.now(trigger.timezone))
+        description = f"{schedule['mode']} {schedule['time']}"
+        if schedule['days']:
+            description += f" ({schedule['days']})"
+        if schedule['servers']:
+            description += f", серверы: {', '.join(schedule['servers'])}"
+        if next_run is not None:
+            description += f", следующая отправка {next_run:%d.%m.%Y %H:%M:%S}"
+        return description
+
+    # Функция для постановки подготовки отчёта за lead_time секунд до следующей отправки
+    def _schedule_prepare(self, name):
+        schedule, trigger = self._schedules[name]
+        if schedule['lead_time'] <= 0:
+            return
+        now = datetime.now(trigger.timezone)
+        fire_time = trigger.get_next_fire_time(None, now)
+        if fire_time is None:
+            return
+        self.scheduler.add_job(
+            self._prepare,
+            trigger='date',
+            run_date=max(fire_time - timedelta(seconds=schedule['lead_time']), now),
+            args=[name, fire_time],
+            id=f'{JOB_PREFIX}prepare:{name}',
+            replace_existing=True,
+            misfire_grace_time=None,
+        )
+
+    async def _prepare(self, name, fire_time):
+        entry = self._schedules.get(name)
+        if entry is None:
+            return
+        # Сканирование идёт в отдельной задаче: задача планировщика не ждёт его, результат забирает отправка
+        task = asyncio.ensure_future(self.prepare(entry[0]))
+        task.add_done_callback(lambda task: task.cancelled() or task.exception())
+        self._prepared[name] = (fire_time, task)
+
+    async def _run(self, name, missed=0):
+        entry = self._schedules.get(name)
+        if entry is None:
+            return
+        schedule, trigger = entry
+        started = time.time()
+        try:
+            snapshot = None
+            # Отчёт, подготовленный к следующей отправке, остаётся ей (например, при догоняющей отправке после запуска)
+            prepared = self._prepared.get(name)
+            if prepared is not None and prepared[0].timestamp() <= started + 1:
+                del self._prepared[name]
+                try:
+                    snapshot = await prepared[1]
+                except Exception as e:
+                    self.logger.warning(f"Подготовка отчёта по расписанию {name} не удалась: {e}. Сканирование повторяется.")
+            if snapshot is None:
+                snapshot = await self.prepare(schedule)
+            await self.send(schedule, snapshot, missed)
+        except Exception as e:
+            self.logger.exception(f"Ошибка отправки уведомления по расписанию {name}: {e}")
+        finally:
+            await asyncio.to_thread(self.store.store_schedule_run, name, started)
+            if name in self._schedules and name not in self._prepared:
+                self._schedule_prepare(name)
+
+    # Функция для отправки пропущенных уведомлений после запуска бота
+    # По каждому расписанию отправляется не больше одного отчёта, сколько бы отправок ни было пропущено
+    async def catch_up(self):
+        runs = await asyncio.to_thread(self.store.schedule_runs)
+        now = time.time()
+        for name, (schedule, trigger) in self._schedules.items():
+            last_run = runs.get(name)
+            if last_run is None:
+                # Первый запуск расписания: отсчёт пропусков начинается с этого момента
+                await asyncio.to_thread(self.store.store_schedule_run, name, now)
+                continue
+            missed, latest = count_missed_runs(trigger, last_run, now)
+            if not missed:
+                continue
+            if now - latest.timestamp() > self.missed_run_window:
+                self.logger.warning(
+                    f"Расписание {name}: пропущено отправок - {missed}, последняя {latest:%d.%m.%Y %H:%M:%S}. "
+                    f"Она старше {self.missed_run_window:g} с и не отправляется."
+                )
+                await asyncio.to_thread(self.store.store_schedule_run, name, now)
+                continue
+            self.logger.info(f"Расписание {name}: пропущено отправок - {missed}, отправляется один отчёт.")
+            self.scheduler.add_job(self._run, args=[name, missed], id=f'{JOB_PREFIX}catchup:{name}', replace_existing=True)
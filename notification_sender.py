@@ -0,0 +1,136 @@
+import asyncio
+from collections import deque
+
+from update_pipeline import backoff_delay
+
+# Очередь исходящих сообщений бота.
+# Сообщения каждого чата отправляются по порядку отдельной задачей, общая скорость и скорость
+# в каждом чате ограничиваются token bucket, чтобы не упираться в лимиты Telegram:
+# около 30 сообщений в секунду всего, 1 сообщение в секунду в чат и 20 сообщений в минуту в группу.
+# На RetryAfter (ответ 429) отправка в чат приостанавливается на указанное Telegram время.
+
+MAX_SEND_ATTEMPTS = 5
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = None
+        self._lock = asyncio.Lock()
+
+    # Асинхронная функция для получения одного токена (ждёт, пока токен накопится)
+    async def acquire(self):
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            while True:
+                now = loop.time()
+                if self._updated is not None:
+                    self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    # Функция для отсчёта накопления токенов с текущего момента (токен получен раньше, чем использован)
+    def restart(self):
+        self._updated = asyncio.get_running_loop().time()
+
+
+class OutboundQueue:
+    def __init__(self, bot, global_rate=25, chat_rate=1, group_rate_per_minute=20, logger=None):
+        self.bot = bot
+        self.logger = logger
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate_per_minute / 60
+        self._global = TokenBucket(global_rate, capacity=global_rate)
+        self._chat_buckets = {}
+        self._chat_queues = {}  # chat_id -> deque[(текст, parse_mode, future)]
+        self._workers = {}
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+
+    def _bucket(self, chat_id):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            # Отрицательные id - группы и каналы, для них лимит строже
+            rate = self.group_rate if str(chat_id).startswith('-') else self.chat_rate
+            bucket = self._chat_buckets[chat_id] = TokenBucket(rate)
+        return bucket
+
+    # Функция для постановки сообщения в очередь; возвращает future с отправленным сообщением
+    def send(self, chat_id, text, parse_mode=None):
+        future = asyncio.get_running_loop().create_future()
+        self._chat_queues.setdefault(chat_id, deque()).append((text, parse_mode, future))
+        if chat_id not in self._workers:
+            self._workers[chat_id] = asyncio.create_task(self._run_chat(chat_id))
+        return future
+
+    # Функция для отправки одного и того же набора сообщений в несколько чатов
+    def send_many(self, chat_ids, messages, parse_mode=None):
+        return [self.send(chat_id, message, parse_mode) for chat_id in chat_ids for message in messages]
+
+    async def _run_chat(self, chat_id):
+        queue = self._chat_queues[chat_id]
+        try:
+            while queue:
+                text, parse_mode, future = queue[0]
+                try:
+                    message = await self._deliver(chat_id, text, parse_mode)
+                    self.sent += 1
+                    if not future.done():
+                        future.set_result(message)
+                except Exception as e:
+                    self.failed += 1
+                    if self.logger:
+                        self.logger.error(f"Не удалось отправить сообщение в чат {chat_id}: {e}")
+                    if not future.done():
+                        future.set_exception(e)
+                        # Ошибка уже записана в лог: не предупреждать, если результат никто не ждёт
+                        future.exception()
+                queue.popleft()
+        finally:
+            del self._workers[chat_id]
+            if not queue:
+                del self._chat_queues[chat_id]
+
+    async def _deliver(self, chat_id, text, parse_mode):
+        from telegram.error import RetryAfter, NetworkError, BadRequest, Forbidden
+
+        attempt = 0
+        while True:
+            bucket = self._bucket(chat_id)
+            await bucket.acquire()
+            await self._global.acquire()
+            # Пока ждали общий лимит, токен чата мог накопиться заново: интервал в чате считается от отправки
+            bucket.restart()
+            try:
+                return await self.bot.send_message(chat_id, text, parse_mode=parse_mode)
+            except RetryAfter as e:
+                self.retried += 1
+                if self.logger:
+                    self.logger.warning(f"Превышен лимит отправки в чат {chat_id}, повтор через {e.retry_after} с.")
+                await asyncio.sleep(e.retry_after)
+            except (BadRequest, Forbidden):
+                raise
+            except NetworkError as e:
+                attempt += 1
+                if attempt >= MAX_SEND_ATTEMPTS:
+                    raise
+                self.retried += 1
+                delay = backoff_delay(attempt)
+                if self.logger:
+                    self.logger.error(f"Ошибка сети при отправке в чат {chat_id}: {e}. Повтор через {delay:.1f} с.")
+                await asyncio.sleep(delay)
+
+    # Асинхронная функция для ожидания отправки всех сообщений из очереди
+    async def join(self):
+        while self._workers:
+            await asyncio.gather(*list(self._workers.values()), return_exceptions=True)
+
+    @property
+    def pending(self):
+        return sum(len(queue) for queue in self._chat_queues.values())
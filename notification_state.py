@@ -0,0 +1,78 @@
+import time
+import threading
+
+# Состояние уведомлений по парам (сервер, БД) для разностных отчётов.
+# Для каждой пары хранится, есть ли ошибка, с какого времени и когда о ней напоминали.
+# Новый отчёт сравнивается с сохранённым состоянием по ключам: в уведомление попадают только переходы - новая ошибка,
+# восстановление и ошибка, которая держится дольше REMIND_DAYS. Изменившиеся пары записываются в каталог (commit)
+# только после доставки уведомления, иначе переходы будут отправлены снова в следующем отчёте.
+# Состояние ведётся отдельно для каждого расписания (scope), чтобы частые проверки не "съедали" переходы ежедневного отчёта.
+
+FAILED = 'failed'
+RECOVERED = 'recovered'
+STILL_FAILING = 'still_failing'
+
+
+# Переход состояния пары (сервер, БД)
+class Transition:
+    __slots__ = ('kind', 'key', 'since')
+
+    def __init__(self, kind, key, since=None):
+        self.kind = kind
+        self.key = key          # (servername, dbname)
+        self.since = since      # epoch начала ошибки (для STILL_FAILING)
+
+    def __repr__(self):
+        return f'Transition({self.kind!r}, {self.key!r}, {self.since!r})'
+
+
+class NotificationState:
+    def __init__(self, catalog, remind_days=3):
+        self.catalog = catalog
+        self.remind_days = remind_days
+        self._lock = threading.Lock()
+        self._scopes = {}  # scope -> {(servername, dbname): (failing, since, reminded_at)}
+
+    # Функция для сравнения текущей оценки бэкапов с сохранённым состоянием
+    # health - {(servername, dbname): True, если бэкап в порядке}
+    # Возвращает (первый ли это отчёт для scope, список переходов, изменения для commit); состояние не меняется
+    def diff(self, scope, health, now=None):
+        now = time.time() if now is None else now
+        remind_after = self.remind_days * 86400
+        with self._lock:
+            stored = self._scopes.get(scope)
+            if stored is None:
+                stored = self._scopes[scope] = self.catalog.notification_state(scope)
+            first = not stored
+
+            transitions = []
+            changed = {}
+            for key, ok in health.items():
+                previous = stored.get(key)
+                if ok:
+                    if previous is None or previous[0]:
+                        if previous is not None:
+                            transitions.append(Transition(RECOVERED, key))
+                        changed[key] = (False, now, None)
+                elif previous is None or not previous[0]:
+                    transitions.append(Transition(FAILED, key))
+                    changed[key] = (True, now, now)
+                elif remind_after > 0 and now - (previous[2] or previous[1]) >= remind_after:
+                    transitions.append(Transition(STILL_FAILING, key, previous[1]))
+                    changed[key] = (True, previous[1], now)
+
+            removed = [key for key in stored if key not in health]
+        return first, transitions, (changed, removed)
+
+    # Функция для сохранения изменений, полученных из diff (вызывается после доставки уведомления)
+    def commit(self, scope, changes):
+        changed, removed = changes
+        with self._lock:
+            stored = self._scopes.get(scope)
+            if stored is None:
+                stored = self._scopes[scope] = self.catalog.notification_state(scope)
+            for key in removed:
+                stored.pop(key, None)
+            stored.update(changed)
+            if changed or removed:
+                self.catalog.store_notification_state(scope, changed, removed)
@@ -0,0 +1,65 @@
+import time
+import asyncio
+
+
+# Кэш результатов сканирования с ограниченным временем жизни (TTL).
+# Одновременные запросы с одинаковым ключом, не нашедшие значения в кэше,
+# ожидают одно и то же выполняющееся сканирование вместо запуска собственного.
+class ResultCache:
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._entries = {}   # key -> (expires_at, value)
+        self._inflight = {}  # key -> asyncio.Task
+        self._generation = 0  # увеличивается при сбросе: результаты начатых до сброса сканирований не сохраняются
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    # Функция для получения значения из кэша или его вычисления
+    # compute - функция без аргументов, возвращающая корутину
+    async def get(self, key, compute):
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self.hits += 1
+            return entry[1]
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            task = asyncio.ensure_future(compute())
+            self._inflight[key] = task
+            generation = self._generation
+            task.add_done_callback(lambda done: self._store(key, done, generation))
+
+        # shield: отмена одного из ожидающих не прерывает сканирование для остальных
+        return await asyncio.shield(task)
+
+    def _store(self, key, task, generation):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if task.cancelled() or task.exception() is not None:
+            return
+        if generation == self._generation and self.ttl > 0:
+            self._entries[key] = (time.monotonic() + self.ttl, task.result())
+
+    # Функция для сброса кэша (целиком или по одному ключу)
+    def invalidate(self, key=None):
+        self._generation += 1
+        if key is None:
+            self._entries.clear()
+            self._inflight.clear()
+        else:
+            self._entries.pop(key, None)
+            self._inflight.pop(key, None)
+
+    # Функция для получения счётчиков кэша
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'entries': len(self._entries),
+            'inflight': len(self._inflight),
+        }
@@ -0,0 +1,50 @@
+import re
+from fnmatch import translate
+from functools import lru_cache
+
+# Фильтр серверов по спискам SERVER_LIST_ALLOWED и SERVER_LIST_DISALLOWED.
+# Точные имена хранятся в множествах, шаблоны (*, ?, [...]) объединяются в одно регулярное выражение,
+# результат проверки запоминается для каждого имени сервера.
+
+GLOB_CHARS = frozenset('*?[')
+
+
+class ServerFilter:
+    def __init__(self, allowed, disallowed):
+        allowed = [name.strip() for name in allowed if name and name.strip()]
+        disallowed = [name.strip() for name in disallowed if name and name.strip()]
+        # Точные имена разрешённых серверов в порядке config.ini (для строк "нет бэкапов")
+        self.names = [name for name in allowed if not GLOB_CHARS & set(name)]
+        self._allow_all = not allowed
+        self._allowed, self._allowed_pattern = _compile(allowed)
+        self._disallowed, self._disallowed_pattern = _compile(disallowed)
+        self._results = {}
+
+    def __call__(self, servername):
+        result = self._results.get(servername)
+        if result is None:
+            result = self._results[servername] = self._check(servername)
+        return result
+
+    def _check(self, servername):
+        if servername in self._disallowed or (self._disallowed_pattern and self._disallowed_pattern.match(servername)):
+            return False
+        if self._allow_all or servername in self._allowed:
+            return True
+        return bool(self._allowed_pattern and self._allowed_pattern.match(servername))
+
+
+def _compile(names):
+    exact = {name for name in names if not GLOB_CHARS & set(name)}
+    patterns = [translate(name) for name in names if GLOB_CHARS & set(name)]
+    return exact, re.compile('|'.join(patterns)) if patterns else None
+
+
+# Функция для получения фильтра серверов; одинаковые списки компилируются один раз
+def compile_server_filter(SERVER_LIST_ALLOWED, SERVER_LIST_DISALLOWED):
+    return _compile_server_filter(tuple(SERVER_LIST_ALLOWED), tuple(SERVER_LIST_DISALLOWED))
+
+
+@lru_cache(maxsize=32)
+def _compile_server_filter(allowed, disallowed):
+    return ServerFilter(allowed, disallowed)
@@ -0,0 +1,69 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+import backup_manager
+
+
+# Каждый тест работает в своей временной папке со своим config.ini и каталогом бэкапов;
+# состояние модулей (каталоги, кэш снимков, состояние уведомлений) после теста сбрасывается
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(config, 'config_store', config.ConfigStore())
+    yield tmp_path
+    backup_manager.stop_backup_watchers()
+    backup_manager.close_catalogs()
+    monkeypatch.setattr(backup_manager, '_snapshot_cache', None)
+    monkeypatch.setattr(backup_manager, '_zip_verifier', None)
+    monkeypatch.setattr(backup_manager, '_notification_state', None)
+    monkeypatch.setattr(backup_manager, '_outbound_queue', None)
+
+
+# Функция для создания файла бэкапа: имя в формате parse_backup_filename, mtime - время из имени
+@pytest.fixture
+def make_backup():
+    def make(directory, servername, dbname, when, size=10):
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{servername}-{dbname}_{when:%d-%m-%Y_%H_%M_%S}.zip")
+        with open(path, 'wb') as f:
+            f.write(b'\0' * size)
+        os.utime(path, (when.timestamp(), when.timestamp()))
+        return path
+    return make
+
+
+# Функция для записи config.ini рабочей папки теста: {секция: {ключ: значение}}
+@pytest.fixture
+def write_config(workdir):
+    def write(sections):
+        lines = []
+        for section, values in sections.items():
+            lines.append(f'[{section}]')
+            lines.extend(f'{key} = {value}' for key, value in values.items())
+            lines.append('')
+        with open(workdir / 'config.ini', 'w') as f:
+            f.write('\n'.join(lines))
+    return write
+
+
+# Функция для чтения дерева бэкапов полным обходом в формате каталога: (серверы, строки)
+@pytest.fixture
+def walk_rows():
+    def walk(root):
+        servers = sorted(entry.name for entry in os.scandir(root) if entry.is_dir())
+        rows = []
+        for servername in servers:
+            for dir_path, _, filenames in os.walk(os.path.join(root, servername)):
+                for filename in filenames:
+                    info = backup_manager.parse_backup_filename(filename)
+                    if info:
+                        path = os.path.join(dir_path, filename)
+                        stat = os.stat(path)
+                        rows.append((servername, info['dbname'], filename, info['date'], stat.st_mtime, stat.st_size, path))
+        return servers, rows
+    return walk
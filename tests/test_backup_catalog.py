@@ -0,0 +1,173 @@
+import os
+import time
+import types
+import shutil
+from datetime import datetime, timedelta
+
+import pytest
+
+import backup_manager
+import backup_catalog
+from backup_catalog import BackupCatalog, MTIME_GRANULARITY
+from server_filter import compile_server_filter
+
+
+@pytest.fixture
+def catalog(workdir):
+    catalog = BackupCatalog(str(workdir / 'catalog.db'))
+    yield catalog
+    catalog.close()
+
+
+# Функция для пересканирования: возвращает (серверы, число перечитанных директорий по всем серверам)
+def refresh(catalog, root, server_filter=None, filename_timestamp=None):
+    stats = {}
+    servers = catalog.refresh(root, backup_manager.parse_backup_filename, server_filter, filename_timestamp=filename_timestamp, stats=stats)
+    return sorted(servers), sum(counters['directories_read'] for counters in stats.values())
+
+
+def catalog_rows(catalog, root):
+    records = catalog.records(root)
+    return sorted(
+        (records.servers[records.server[row]], records.dbnames[records.db[row]], records.filename[row], records.mtime[row])
+        for row in range(len(records))
+    )
+
+
+# Содержимое каталога после пересканирования совпадает с полным обходом дерева
+@pytest.fixture
+def assert_matches_tree(walk_rows):
+    def check(catalog, root):
+        _, rows = walk_rows(root)
+        assert catalog_rows(catalog, root) == sorted((server, db, filename, mtime) for server, db, filename, date, mtime, size, path in rows)
+    return check
+
+
+# Функция для состаривания дерева до первого сканирования: директории изменены давно,
+# поэтому неизменившиеся директории не перечитываются (см. MTIME_GRANULARITY)
+def settle_tree(root):
+    old = datetime.now().timestamp() - 3600
+    for dir_path, _, _ in os.walk(root):
+        os.utime(dir_path, (old, old))
+
+
+def test_rescan_reads_only_changed_directories(workdir, catalog, make_backup, assert_matches_tree):
+    root = str(workdir / 'tree')
+    now = datetime.now().replace(microsecond=0)
+    make_backup(os.path.join(root, 'SRV1'), 'SRV1', 'db1', now - timedelta(days=1))
+    make_backup(os.path.join(root, 'SRV1', 'old'), 'SRV1', 'db1', now - timedelta(days=10))
+    make_backup(os.path.join(root, 'SRV2'), 'SRV2', 'main', now - timedelta(days=1))
+    open(os.path.join(root, 'SRV2', 'readme.txt'), 'w').close()
+    settle_tree(root)
+
+    assert refresh(catalog, root) == (['SRV1', 'SRV2'], 3)
+    assert_matches_tree(catalog, root)
+
+    # Ничего не менялось - ни одна директория не перечитывается
+    assert refresh(catalog, root) == (['SRV1', 'SRV2'], 0)
+    assert_matches_tree(catalog, root)
+
+    # Новый файл во вложенной директории - перечитывается только она
+    make_backup(os.path.join(root, 'SRV1', 'old'), 'SRV1', 'db2', now - timedelta(days=9))
+    assert refresh(catalog, root)[1] == 1
+    assert_matches_tree(catalog, root)
+
+    # Новая вложенная директория - перечитываются она и её родитель,
+    # а также SRV1/old: она прочитана в пределах MTIME_GRANULARITY от своего mtime
+    make_backup(os.path.join(root, 'SRV2', 'new'), 'SRV2', 'main', now)
+    assert refresh(catalog, root)[1] == 3
+    assert_matches_tree(catalog, root)
+
+
+def test_rescan_drops_removed_directories_and_servers(workdir, catalog, make_backup, assert_matches_tree):
+    root = str(workdir / 'tree')
+    now = datetime.now().replace(microsecond=0)
+    make_backup(os.path.join(root, 'SRV1', 'old'), 'SRV1', 'db1', now - timedelta(days=10))
+    make_backup(os.path.join(root, 'SRV1'), 'SRV1', 'db1', now - timedelta(days=1))
+    make_backup(os.path.join(root, 'SRV2'), 'SRV2', 'main', now - timedelta(days=1))
+    settle_tree(root)
+    refresh(catalog, root)
+
+    shutil.rmtree(os.path.join(root, 'SRV1', 'old'))
+    shutil.rmtree(os.path.join(root, 'SRV2'))
+    assert refresh(catalog, root)[0] == ['SRV1']
+    assert_matches_tree(catalog, root)
+
+
+# Серверы, не прошедшие фильтр, не сканируются, но их строки в каталоге сохраняются
+def test_filtered_rescan_keeps_other_servers(workdir, catalog, make_backup, assert_matches_tree):
+    root = str(workdir / 'tree')
+    now = datetime.now().replace(microsecond=0)
+    make_backup(os.path.join(root, 'SRV1'), 'SRV1', 'db1', now - timedelta(days=1))
+    make_backup(os.path.join(root, 'SRV2'), 'SRV2', 'main', now - timedelta(days=1))
+    settle_tree(root)
+    refresh(catalog, root)
+
+    make_backup(os.path.join(root, 'SRV2'), 'SRV2', 'main', now)
+    assert refresh(catalog, root, lambda servername: servername == 'SRV1') == (['SRV1', 'SRV2'], 0)
+    assert len(catalog_rows(catalog, root)) == 2
+    assert refresh(catalog, root)[1] == 1
+    assert_matches_tree(catalog, root)
+
+
+# Файл, появившийся после чтения директории в том же тике mtime (mtime директории не изменился),
+# находится при следующем сканировании; после окна MTIME_GRANULARITY директория снова не перечитывается
+def test_rescan_finds_file_written_within_mtime_granularity(workdir, catalog, make_backup, assert_matches_tree, monkeypatch):
+    root = str(workdir / 'tree')
+    directory = os.path.join(root, 'SRV1')
+    now = datetime.now().replace(microsecond=0)
+    make_backup(directory, 'SRV1', 'db1', now - timedelta(days=1))
+    dir_mtime = os.stat(directory).st_mtime
+    refresh(catalog, root)
+
+    make_backup(directory, 'SRV1', 'db1', now)
+    os.utime(directory, (dir_mtime, dir_mtime))
+    assert refresh(catalog, root)[1] == 1
+    assert_matches_tree(catalog, root)
+
+    # Сканирование позже окна: mtime тот же, директория не перечитывается
+    later = dir_mtime + MTIME_GRANULARITY + 1
+    monkeypatch.setattr(backup_catalog, 'time', types.SimpleNamespace(time=lambda: later, perf_counter=time.perf_counter))
+    assert refresh(catalog, root)[1] == 1
+    assert refresh(catalog, root)[1] == 0
+    assert_matches_tree(catalog, root)
+
+
+# При смене источника времени корень сканируется заново, время бэкапа берётся из имени файла
+def test_timestamp_source_change_rescans_root(workdir, catalog, make_backup):
+    root = str(workdir / 'tree')
+    when = datetime(2026, 1, 1, 10, 0, 0)
+    path = make_backup(os.path.join(root, 'SRV1'), 'SRV1', 'db1', when)
+    os.utime(path, (when.timestamp() + 30, when.timestamp() + 30))
+    refresh(catalog, root)
+    assert catalog_rows(catalog, root)[0][3] == when.timestamp() + 30
+
+    assert refresh(catalog, root, filename_timestamp=backup_manager.backup_filename_timestamp)[1] == 1
+    assert catalog_rows(catalog, root)[0][3] == when.timestamp()
+
+
+# Все представления снимка строятся за один проход: последний бэкап каждой пары, бэкапы за сегодня,
+# история сервера и серверы без бэкапов
+def test_snapshot_views_from_one_pass(workdir, catalog, make_backup):
+    root = str(workdir / 'tree')
+    now = datetime.now().replace(microsecond=0)
+    today = now.replace(hour=0, minute=0, second=1)
+    make_backup(os.path.join(root, 'SRV1'), 'SRV1', 'db1', today)
+    make_backup(os.path.join(root, 'SRV1', 'old'), 'SRV1', 'db1', now - timedelta(days=3))
+    yesterday = make_backup(os.path.join(root, 'SRV1'), 'SRV1', 'db2', now - timedelta(days=1))
+    make_backup(os.path.join(root, 'SRV2'), 'SRV2', 'main', now - timedelta(days=1))
+    os.makedirs(os.path.join(root, 'EMPTY'))
+    os.makedirs(os.path.join(root, 'HIDDEN'))
+
+    servers, _ = refresh(catalog, root)
+    server_filter = compile_server_filter([], ['HIDDEN'])
+    snapshot = backup_manager.build_backup_snapshot(catalog.records(root), servers, server_filter, server_filter.names)
+
+    assert set(snapshot.latest) == {('EMPTY', None), ('SRV1', 'db1'), ('SRV1', 'db2'), ('SRV2', 'main')}
+    assert snapshot.latest[('SRV1', 'db1')].datetime == today
+    assert snapshot.latest[('SRV1', 'db2')].path == yesterday
+    assert snapshot.latest[('EMPTY', None)].mtime is None
+    assert set(snapshot.today) == {('SRV1', 'db1')}
+    assert snapshot.today[('SRV1', 'db1')] is snapshot.latest[('SRV1', 'db1')]
+    assert [db for filename, db, when in snapshot.history('SRV1')] == ['db1', 'db2', 'db1']
+    assert snapshot.history('HIDDEN') == []
@@ -0,0 +1,22 @@
+import os
+from datetime import datetime
+
+import backup_manager
+from backup_records import BackupRecords
+
+
+def test_records_keep_fractional_mtime():
+    records = BackupRecords.from_rows([('SRV1', 'db1', 'a.zip', '01-01-2026', 1767261600.75, None, '/b/SRV1/a.zip')])
+    record = records.record(0)
+    assert record.mtime == 1767261600.75
+    assert record.size is None
+
+
+# mtime в снимке совпадает с os.stat: по нему строится ключ сохранённой проверки архива
+def test_catalog_snapshot_mtime_matches_stat(workdir, write_config, make_backup):
+    write_config({'Paths': {'BACKUP_PATH_FILE': 'tree'}, 'Watch': {'ENABLED': 'no'}, 'Verify': {'ENABLED': 'no'}})
+    path = make_backup(os.path.join('tree', 'SRV1'), 'SRV1', 'db1', datetime(2026, 1, 1, 12, 0, 0))
+    os.utime(path, (1767261600.75, 1767261600.75))
+
+    snapshot = backup_manager.take_backup_snapshot('tree', [], [])
+    assert snapshot.latest[('SRV1', 'db1')].mtime == os.stat(path).st_mtime
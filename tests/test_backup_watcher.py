@@ -0,0 +1,76 @@
+import os
+import time
+import types
+import asyncio
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+import backup_manager
+from backup_watcher import BackupWatcher, load_inotify
+from server_filter import compile_server_filter
+
+
+# Функция для ожидания, пока последний бэкап пары в снимке отслеживания не станет ожидаемым
+def wait_latest(watcher, key, filename, timeout=5):
+    server_filter = compile_server_filter([], [])
+    deadline = time.monotonic() + timeout
+    while True:
+        latest = watcher.snapshot(server_filter, server_filter.names).latest
+        if key in latest and latest[key].filename == filename:
+            return latest
+        if time.monotonic() > deadline:
+            pytest.fail(f"{key}: ожидался {filename}, в снимке {latest.get(key)}")
+        time.sleep(0.02)
+
+
+@pytest.fixture(params=['inotify', 'poll'])
+def mode(request):
+    if request.param == 'inotify' and load_inotify() is None:
+        pytest.skip('inotify недоступен')
+    return request.param
+
+
+def test_watcher_tracks_created_modified_and_deleted_files(workdir, make_backup, walk_rows, mode):
+    root = str(workdir / 'tree')
+    now = datetime.now().replace(microsecond=0)
+    older = make_backup(os.path.join(root, 'SRV1'), 'SRV1', 'db1', now - timedelta(days=2))
+    make_backup(os.path.join(root, 'SRV1', 'sub'), 'SRV1', 'db2', now - timedelta(days=1))
+
+    watcher = BackupWatcher(root, backup_manager.parse_backup_filename, lambda: walk_rows(root), mode, poll_interval=0.05)
+    watcher.start()
+    try:
+        assert watcher.active_mode == mode
+        wait_latest(watcher, ('SRV1', 'db1'), os.path.basename(older))
+
+        # Новый бэкап, в том числе в новой вложенной папке и у нового сервера
+        newer = make_backup(os.path.join(root, 'SRV1', 'new'), 'SRV1', 'db1', now - timedelta(hours=1))
+        added = make_backup(os.path.join(root, 'SRV2'), 'SRV2', 'main', now - timedelta(hours=2))
+        wait_latest(watcher, ('SRV1', 'db1'), os.path.basename(newer))
+        wait_latest(watcher, ('SRV2', 'main'), os.path.basename(added))
+
+        # Изменение: старый архив перезаписан и стал самым новым по mtime
+        with open(older, 'wb') as f:
+            f.write(b'rewritten')
+        os.utime(older, (time.time(), time.time()))
+        wait_latest(watcher, ('SRV1', 'db1'), os.path.basename(older))
+
+        # Удаление последнего бэкапа: последним снова становится предыдущий
+        os.remove(older)
+        latest = wait_latest(watcher, ('SRV1', 'db1'), os.path.basename(newer))
+        assert latest[('SRV1', 'db2')].filename.startswith('SRV1-db2_')
+    finally:
+        watcher.stop()
+
+
+# Снимок из памяти отслеживания строится не в цикле событий: в режиме filename_mtime он вызывает stat
+def test_watcher_snapshot_is_taken_off_the_event_loop(workdir, monkeypatch):
+    threads = []
+    watcher = types.SimpleNamespace(stop=lambda: None)
+    monkeypatch.setattr(backup_manager, '_watchers', {os.path.normpath(str(workdir)): watcher})
+    monkeypatch.setattr(backup_manager, 'take_backup_snapshot', lambda *args: threads.append(threading.current_thread()) or object())
+    monkeypatch.setattr(backup_manager, 'annotate_verification', lambda snapshot: None)
+
+    asyncio.run(backup_manager.take_backup_snapshot_async(str(workdir), [], []))
+    assert threads and threads[0] is not threading.main_thread()
@@ -0,0 +1,87 @@
+import asyncio
+import logging
+import threading
+
+import pytest
+
+import config
+
+
+# Изменение config.ini замечают сразу несколько потоков: файл перечитывается один раз,
+# подписчик вызывается один раз и в цикле событий, а не в заметившем изменение потоке
+def test_change_seen_by_many_threads_notifies_once_on_loop(write_config):
+    write_config({'Scan': {'MAX_WORKERS': '4'}})
+    store = config.ConfigStore()
+    calls = []
+
+    async def scenario():
+        store.current()
+        store.subscribe(lambda old, new: calls.append((old.scan_workers, new.scan_workers, threading.current_thread())),
+                        asyncio.get_running_loop())
+        write_config({'Scan': {'MAX_WORKERS': '16'}})
+
+        barrier = threading.Barrier(8)
+        results = []
+
+        def read():
+            barrier.wait()
+            results.append(store.current().scan_workers)
+
+        threads = [threading.Thread(target=read) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert results == [16] * 8
+        await asyncio.sleep(0)
+
+    asyncio.run(scenario())
+    assert calls == [(4, 16, threading.main_thread())]
+
+
+# Ошибка в изменённом файле: остаются прежние значения, ошибка пишется в лог один раз
+def test_invalid_value_keeps_last_good_config(write_config, caplog):
+    write_config({'Scan': {'MAX_WORKERS': '4'}})
+    store = config.ConfigStore()
+    calls = []
+    store.subscribe(lambda old, new: calls.append(new.scan_workers))
+    good = store.current()
+
+    write_config({'Scan': {'MAX_WORKERS': 'four'}})
+    with caplog.at_level(logging.ERROR, logger='config'):
+        assert store.current() is good
+        assert store.current() is good
+    assert len(caplog.records) == 1 and 'four' in caplog.records[0].getMessage()
+    assert store.error and calls == []
+
+    write_config({'Scan': {'MAX_WORKERS': '8'}})
+    assert store.current().scan_workers == 8
+    assert store.error is None and calls == [8]
+
+
+def test_unsubscribed_listener_is_not_called(write_config):
+    write_config({'Scan': {'MAX_WORKERS': '4'}})
+    store = config.ConfigStore()
+    calls = []
+    listener = calls.append
+    store.subscribe(lambda old, new: listener(new))
+    store.subscribe(listener)
+    store.unsubscribe(listener)
+    store.current()
+    write_config({'Scan': {'MAX_WORKERS': '6'}})
+    store.current()
+    assert len(calls) == 1
+
+
+# Имя main занято основной папкой: ROOT.main - ошибка конфигурации, а не вторая папка с тем же именем
+def test_extra_root_named_main_is_rejected(write_config):
+    write_config({'Paths': {'BACKUP_PATH_FILE': 'primary', 'ROOT.main': 'other'}})
+    with pytest.raises(ValueError, match='reserved'):
+        config.ConfigStore().current()
+
+    write_config({'Paths': {'BACKUP_PATH_FILE': 'primary', 'ROOT.archive': 'archive'}})
+    store = config.ConfigStore()
+    assert [root['name'] for root in store.current().extra_roots] == ['archive']
+    write_config({'Paths': {'BACKUP_PATH_FILE': 'primary', 'ROOT.Main': 'other'}})
+    assert [root['name'] for root in store.current().extra_roots] == ['archive']
+    assert 'reserved' in store.error
@@ -0,0 +1,60 @@
+import logging
+
+from freshness_policy import FreshnessPolicy, compile_freshness_policy
+
+
+def test_rule_errors_are_logged_with_their_section(caplog):
+    with caplog.at_level(logging.ERROR):
+        FreshnessPolicy([('srv1', 'soon')], logger=logging.getLogger('test'))
+        compile_freshness_policy((('srv2', 'later'),), 'off', 'Retention')
+    messages = [record.getMessage() for record in caplog.records]
+    assert any(message.startswith('[Freshness] srv1:') for message in messages)
+    assert any(message.startswith('[Retention] srv2:') for message in messages)
+    assert not any('[Freshness] srv2' in message for message in messages)
+
+
+def test_exact_server_and_glob_rules_take_precedence_in_order():
+    policy = FreshnessPolicy([
+        ('SRV-*/log_*', '1h'),
+        ('srv-*', '2d'),
+        ('srv-1/main', '1w'),
+        ('srv-1', 'off'),
+        ('srv-?/*', '3d'),
+    ])
+    # Точный ключ "сервер/БД" важнее правила сервера и шаблонов, регистр не учитывается
+    assert policy.policy('SRV-1', 'Main').text == '1w'
+    # Правило сервера важнее шаблонов
+    assert policy.policy('srv-1', 'log_a') is None
+    # Шаблоны проверяются по порядку config.ini до первого совпадения
+    assert policy.policy('srv-2', 'log_a').text == '1h'
+    assert policy.policy('srv-2', 'main').text == '2d'
+    assert policy.policy('other', 'main').text == '1d at 15:00'
+
+
+def test_server_rule_with_star_is_not_a_pattern():
+    policy = FreshnessPolicy([('srv*/main', '1h'), ('srv1/*', '1w')])
+    assert policy.policy('srv1', 'main').text == '1w'
+    assert policy.policy('srv2', 'main').text == '1h'
+
+
+def test_glob_rule_matches_whole_names_only():
+    policy = FreshnessPolicy([('srv1/db[12]', '1h'), ('srv1/*_log', 'off')], default='2d')
+    assert policy.policy('srv1', 'db1').text == '1h'
+    assert policy.policy('srv1', 'db10').text == '2d'
+    assert policy.policy('srv10', 'db1').text == '2d'
+    assert policy.policy('srv1', 'main_log') is None
+
+
+def test_evaluate_uses_matched_policy():
+    now = 1_000_000_000
+    policy = FreshnessPolicy([('srv*/hourly', '1h'), ('srv*/archive', 'off')], default='1d')
+    results = policy.evaluate({
+        ('srv1', 'hourly'): {'mtime': now - 7200},
+        ('srv1', 'daily'): {'mtime': now - 7200},
+        ('srv1', 'archive'): {'mtime': now - 30 * 86400},
+        ('srv2', 'hourly'): None,
+    }, now)
+    assert results[('srv1', 'hourly')] == (False, 3600)
+    assert results[('srv1', 'daily')] == (True, None)
+    assert results[('srv1', 'archive')] == (True, None)
+    assert results[('srv2', 'hourly')] == (False, None)
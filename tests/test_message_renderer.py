@@ -0,0 +1,50 @@
+import re
+
+from message_renderer import MESSAGE_LIMIT, escape_markdown_v2, render_report
+
+SPECIAL = '_*[]()~>#+-=|{}.!'
+
+# Символ MarkdownV2, перед которым нет экранирующей обратной черты
+UNESCAPED = re.compile(r'(?<!\\)(?:\\\\)*[' + re.escape(SPECIAL) + ']')
+
+
+def test_escape_markdown_v2_escapes_every_special_character():
+    assert escape_markdown_v2(SPECIAL) == ''.join('\\' + char for char in SPECIAL)
+    assert escape_markdown_v2('SRV-1 | db_main (2.5 ГБ)!') == 'SRV\\-1 \\| db\\_main \\(2\\.5 ГБ\\)\\!'
+    # ` не экранируется: им открываются и закрываются блоки кода
+    assert escape_markdown_v2('`') == '`'
+
+
+def test_report_rows_are_escaped_once():
+    messages = render_report('Итог: 1.', ['SRV-1 | db_1 | 01.01.2026'], markdown_v2=True)
+    assert messages == ['Итог: 1\\.\n```\nSRV\\-1 \\| db\\_1 \\| 01\\.01\\.2026\n```']
+
+
+def test_report_splits_on_row_boundaries():
+    rows = [f'row {number:04d} ' + '.' * 60 for number in range(300)]
+    messages = render_report('Заголовок', rows, markdown_v2=True)
+    assert len(messages) > 1
+    assert all(len(message) <= MESSAGE_LIMIT for message in messages)
+    assert all(message.count('```') == 2 for message in messages)
+    assert messages[0].startswith('Заголовок\n```\n')
+    body = ''.join(message.split('```\n', 1)[1][:-3] for message in messages)
+    assert body == ''.join(escape_markdown_v2(row) + '\n' for row in rows)
+
+
+def test_report_hard_splits_rows_longer_than_limit():
+    for markdown_v2, row in ((False, 'x' * 5000), (True, 'a.b' * 3000)):
+        messages = render_report('Заголовок', [row, 'ok'], markdown_v2=markdown_v2)
+        assert all(len(message) <= MESSAGE_LIMIT for message in messages)
+        fenced = [message for message in messages if '```' in message]
+        assert all(message.count('```') == 2 for message in fenced)
+        assert ''.join(message.split('```\n', 1)[1][:-3].replace('\n', '') for message in fenced) == \
+            (escape_markdown_v2(row) if markdown_v2 else row) + 'ok'
+        if markdown_v2:
+            # Экранирование не разрывается между сообщениями
+            assert not any(UNESCAPED.search(message) for message in messages)
+
+
+def test_report_splits_long_header():
+    messages = render_report('H' * 5000, ['row'], markdown_v2=True)
+    assert all(len(message) <= MESSAGE_LIMIT for message in messages)
+    assert messages[-1].endswith('```\nrow\n```')
@@ -0,0 +1,87 @@
+import types
+import threading
+import asyncio
+import logging
+from datetime import datetime, timedelta
+
+import notification_scheduler
+from notification_scheduler import NotificationScheduler
+
+
+class FakeScheduler:
+    def __init__(self):
+        self.jobs = {}
+
+    def add_job(self, func, id, replace_existing=False, **kwargs):
+        self.jobs[id] = types.SimpleNamespace(id=id, func=func, remove=lambda: self.jobs.pop(id), **kwargs)
+
+    def get_job(self, id):
+        return self.jobs.get(id)
+
+
+class RunStore:
+    def __init__(self):
+        self.runs = {}
+
+    def store_schedule_run(self, name, when):
+        self.runs[name] = when
+
+    def schedule_runs(self):
+        return dict(self.runs)
+
+
+# Догоняющая отправка после запуска не забирает отчёт, подготовленный к следующей отправке по расписанию
+def test_catch_up_keeps_report_prepared_for_later_run(monkeypatch):
+    prepared, sent = [], []
+    clock = [datetime.now().timestamp()]
+    monkeypatch.setattr(notification_scheduler, 'time', types.SimpleNamespace(time=lambda: clock[0]))
+
+    async def prepare(schedule):
+        prepared.append(clock[0])
+        return f'snapshot-{len(prepared)}'
+
+    async def send(schedule, snapshot, missed):
+        sent.append((snapshot, missed))
+
+    async def scenario():
+        scheduler = NotificationScheduler(FakeScheduler(), prepare, send, RunStore(), logging.getLogger('test'))
+        at = datetime.now() + timedelta(minutes=1)
+        scheduler.configure([{'name': 'daily', 'mode': 'EVERYDAY', 'time': f'{at:%H:%M:%S}', 'days': None,
+                              'servers': None, 'chat_id': None, 'lead_time': 300}])
+        fire_time = scheduler.scheduler.get_job('notify:prepare:daily').args[1]
+
+        await scheduler._prepare('daily', fire_time)
+        await asyncio.sleep(0)
+        await scheduler._run('daily', missed=2)
+        assert sent == [('snapshot-2', 2)]
+
+        clock[0] = fire_time.timestamp()
+        await scheduler._run('daily')
+        assert sent[-1] == ('snapshot-1', 0)
+        assert len(prepared) == 2
+
+    asyncio.run(scenario())
+
+
+# Расписания, применённые из другого потока, переставляются в цикле событий планировщика
+def test_configure_from_another_thread_runs_on_loop():
+    threads = []
+
+    class RecordingScheduler(FakeScheduler):
+        def add_job(self, func, id, replace_existing=False, **kwargs):
+            threads.append(threading.current_thread())
+            super().add_job(func, id, replace_existing, **kwargs)
+
+    async def noop(*args):
+        return None
+
+    async def scenario():
+        scheduler = NotificationScheduler(RecordingScheduler(), noop, noop, RunStore(), logging.getLogger('test'))
+        schedule = {'name': 'daily', 'mode': 'EVERYDAY', 'time': '07:00:00', 'days': None,
+                    'servers': None, 'chat_id': None, 'lead_time': 300}
+        await asyncio.to_thread(scheduler.configure, [schedule])
+        await asyncio.sleep(0)
+        assert 'notify:send:daily' in scheduler.scheduler.jobs
+
+    asyncio.run(scenario())
+    assert threads and all(thread is threading.main_thread() for thread in threads)
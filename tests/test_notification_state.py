@@ -0,0 +1,126 @@
+import os
+import types
+import asyncio
+import logging
+from datetime import datetime, timedelta
+
+import backup_manager
+from backup_catalog import BackupCatalog
+from notification_state import NotificationState, FAILED, STILL_FAILING, RECOVERED
+
+DAY = 86400
+OK = ('SRV1', 'db1')
+BAD = ('SRV1', 'db2')
+
+
+def kinds(transitions):
+    return sorted((transition.kind, transition.key) for transition in transitions)
+
+
+def test_diff_reports_only_transitions(workdir):
+    catalog = BackupCatalog(str(workdir / 'catalog.db'))
+    state = NotificationState(catalog, remind_days=3)
+    now = 1_000_000_000
+
+    first, transitions, changes = state.diff('daily', {OK: True, BAD: True}, now)
+    assert first and transitions == []
+    state.commit('daily', changes)
+
+    first, transitions, changes = state.diff('daily', {OK: True, BAD: True}, now + 60)
+    assert not first and transitions == []
+    state.commit('daily', changes)
+
+    first, transitions, changes = state.diff('daily', {OK: True, BAD: False}, now + 120)
+    assert kinds(transitions) == [(FAILED, BAD)]
+    state.commit('daily', changes)
+
+    # Ошибка держится меньше REMIND_DAYS - молчим, дольше - напоминаем, затем снова молчим
+    assert state.diff('daily', {OK: True, BAD: False}, now + 2 * DAY)[1] == []
+    first, transitions, changes = state.diff('daily', {OK: True, BAD: False}, now + 3 * DAY + 120)
+    assert kinds(transitions) == [(STILL_FAILING, BAD)]
+    assert transitions[0].since == now + 120
+    state.commit('daily', changes)
+    assert state.diff('daily', {OK: True, BAD: False}, now + 4 * DAY)[1] == []
+
+    first, transitions, changes = state.diff('daily', {OK: True, BAD: True}, now + 5 * DAY)
+    assert kinds(transitions) == [(RECOVERED, BAD)]
+    state.commit('daily', changes)
+    catalog.close()
+
+
+def test_diff_without_commit_keeps_state(workdir):
+    path = str(workdir / 'catalog.db')
+    catalog = BackupCatalog(path)
+    state = NotificationState(catalog)
+    state.commit('daily', state.diff('daily', {OK: True, BAD: True}, 0)[2])
+
+    # Отчёт не доставлен: переход не сохраняется и повторяется в следующем отчёте
+    assert kinds(state.diff('daily', {OK: True, BAD: False}, 60)[1]) == [(FAILED, BAD)]
+    first, transitions, changes = state.diff('daily', {OK: True, BAD: False}, 120)
+    assert kinds(transitions) == [(FAILED, BAD)]
+    state.commit('daily', changes)
+    catalog.close()
+
+    # Состояние хранится в каталоге и отдельно для каждого расписания
+    catalog = BackupCatalog(path)
+    state = NotificationState(catalog)
+    assert state.diff('daily', {OK: True, BAD: False}, 180)[:2] == (False, [])
+    assert state.diff('hourly', {OK: True, BAD: False}, 180)[0]
+    catalog.close()
+
+
+class FlakyBot:
+    def __init__(self):
+        self.fail = False
+        self.sent = []
+
+    async def send_message(self, chat_id, text, parse_mode=None):
+        from telegram.error import BadRequest
+        if self.fail:
+            raise BadRequest('chat not found')
+        self.sent.append((chat_id, text))
+
+
+async def notify(bot):
+    backup_manager.invalidate_snapshot_cache()
+    context = {'application': types.SimpleNamespace(bot=bot)}
+    await backup_manager.notify_backup_status(context, 'tree', [], [], '100', logging.getLogger('test'), routes={'100': None}, scope='daily')
+    await backup_manager.get_outbound_queue(bot).join()
+    await asyncio.gather(*backup_manager._state_commits)
+
+
+def test_state_is_saved_only_after_delivery(workdir, write_config, make_backup):
+    write_config({
+        'Paths': {'BACKUP_PATH_FILE': 'tree'},
+        'Notification': {'DELTA': 'yes'},
+        'Watch': {'ENABLED': 'no'},
+        'Cache': {'TTL': '0'},
+        'Verify': {'ENABLED': 'no'},
+    })
+    now = datetime.now().replace(microsecond=0)
+    make_backup(os.path.join('tree', 'SRV1'), 'SRV1', 'db1', now - timedelta(hours=1))
+    stale = make_backup(os.path.join('tree', 'SRV1'), 'SRV1', 'db2', now - timedelta(hours=2))
+    bot = FlakyBot()
+
+    async def scenario():
+        await notify(bot)
+        assert len(bot.sent) == 1 and 'SRV1' in bot.sent[0][1]
+
+        # Без изменений ничего не отправляется
+        await notify(bot)
+        assert len(bot.sent) == 1
+
+        os.utime(stale, (0, 0))
+        os.rename(stale, stale.replace(f'{now.year}', '2000'))
+        bot.fail = True
+        await notify(bot)
+        assert len(bot.sent) == 1
+
+        # Сообщение не было доставлено - новая ошибка отправляется снова
+        bot.fail = False
+        await notify(bot)
+        assert len(bot.sent) == 2 and 'новых ошибок 1' in bot.sent[1][1]
+        await notify(bot)
+        assert len(bot.sent) == 2
+
+    asyncio.run(scenario())
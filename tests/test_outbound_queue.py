@@ -0,0 +1,82 @@
+import time
+import asyncio
+
+from telegram import Bot
+
+from benchmarks.fake_bot_api import FakeBotApi
+from notification_sender import OutboundQueue
+
+
+# Функция для прогона сценария с очередью, отправляющей сообщения в заглушку Bot API
+def run_with_queue(scenario, **queue_options):
+    async def main():
+        api = await FakeBotApi().start()
+        try:
+            async with Bot('123:TEST', base_url=api.base_url) as bot:
+                queue = OutboundQueue(bot, **queue_options)
+                await scenario(api, queue)
+                await queue.join()
+        finally:
+            await api.stop()
+
+    asyncio.run(main())
+
+
+def sent_to(api, chat_id):
+    return [(sent_at, text) for sent_at, chat, text in api.sent if str(chat) == str(chat_id)]
+
+
+# Отправка не превышает общую скорость и скорость в чате: в любом окне длиной w уходит
+# не больше capacity + rate * w сообщений
+def test_throughput_stays_within_bucket_rate():
+    global_rate, chat_rate = 20, 5
+
+    async def scenario(api, queue):
+        started = time.perf_counter()
+        futures = [queue.send(chat_id, f'message {chat_id}') for chat_id in range(1, 41)]
+        futures += [queue.send(100, f'chat message {number}') for number in range(3)]
+        await asyncio.gather(*futures)
+
+        times = sorted(sent_at for sent_at, chat, text in api.sent)
+        assert len(times) == 43
+        assert times[-1] - started >= (43 - global_rate) / global_rate * 0.9
+        for first in range(len(times)):
+            for last in range(first, len(times)):
+                assert last - first + 1 <= global_rate + global_rate * (times[last] - times[first]) + 1
+
+        chat_times = [sent_at for sent_at, text in sent_to(api, 100)]
+        assert all(later - earlier >= 1 / chat_rate * 0.9 for earlier, later in zip(chat_times, chat_times[1:]))
+
+    run_with_queue(scenario, global_rate=global_rate, chat_rate=chat_rate)
+
+
+# Ответ 429: отправка в чат ждёт retry_after, и то же сообщение отправляется повторно ровно один раз
+def test_retry_after_delays_and_resends_once():
+    async def scenario(api, queue):
+        api.flood['7'] = 1
+        started = time.perf_counter()
+        first = queue.send(7, 'first')
+        second = queue.send(7, 'second')
+        assert (await first).text == 'first'
+        await second
+
+        sent = sent_to(api, 7)
+        assert [text for sent_at, text in sent] == ['first', 'second']
+        assert sent[0][0] - started >= 1
+        assert queue.retried == 1 and queue.sent == 2 and queue.failed == 0
+
+    run_with_queue(scenario, chat_rate=100)
+
+
+# Сообщения одного чата уходят в порядке постановки в очередь, в том числе после паузы на 429
+def test_messages_keep_order_per_chat():
+    chats = [1, 2, 3, -4]
+
+    async def scenario(api, queue):
+        api.flood['2'] = 1
+        futures = [queue.send(chat_id, f'{chat_id}:{number}') for number in range(5) for chat_id in chats]
+        await asyncio.gather(*futures)
+        for chat_id in chats:
+            assert [text for sent_at, text in sent_to(api, chat_id)] == [f'{chat_id}:{number}' for number in range(5)]
+
+    run_with_queue(scenario, chat_rate=100, group_rate_per_minute=6000)
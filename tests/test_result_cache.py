@@ -0,0 +1,95 @@
+import types
+import asyncio
+
+import pytest
+
+import result_cache
+from result_cache import ResultCache
+
+
+# Загрузчик, который считает вызовы и возвращает значение только после release
+class Loader:
+    def __init__(self):
+        self.calls = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.calls += 1
+        value = f'value-{self.calls}'
+        await self.release.wait()
+        return value
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(result_cache, 'time', types.SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+# Одновременные get с одним ключом ждут одну загрузку
+def test_concurrent_gets_share_one_load():
+    async def scenario():
+        cache, loader = ResultCache(ttl=60), Loader()
+        waiters = [asyncio.ensure_future(cache.get('root', loader)) for _ in range(10)]
+        await asyncio.sleep(0)
+        loader.release.set()
+        assert await asyncio.gather(*waiters) == ['value-1'] * 10
+        assert loader.calls == 1
+        assert cache.stats() == {'hits': 0, 'misses': 1, 'coalesced': 9, 'entries': 1, 'inflight': 0}
+
+        assert await cache.get('root', loader) == 'value-1'
+        assert cache.hits == 1 and loader.calls == 1
+
+    asyncio.run(scenario())
+
+
+def test_value_expires_after_ttl(clock):
+    async def scenario():
+        cache, loader = ResultCache(ttl=60), Loader()
+        loader.release.set()
+        assert await cache.get('root', loader) == 'value-1'
+
+        clock[0] += 59
+        assert await cache.get('root', loader) == 'value-1'
+        clock[0] += 1
+        assert await cache.get('root', loader) == 'value-2'
+        assert loader.calls == 2
+
+    asyncio.run(scenario())
+
+
+# Сброс во время загрузки: её результат не сохраняется, следующий get загружает заново
+def test_invalidate_during_load_does_not_cache_stale_value():
+    async def scenario():
+        cache, loader = ResultCache(ttl=60), Loader()
+        first = asyncio.ensure_future(cache.get('root', loader))
+        await asyncio.sleep(0)
+        cache.invalidate('root')
+        loader.release.set()
+        assert await first == 'value-1'
+
+        assert await cache.get('root', loader) == 'value-2'
+        assert await cache.get('root', loader) == 'value-2'
+        assert loader.calls == 2
+
+    asyncio.run(scenario())
+
+
+# Отмена одного из ожидающих не прерывает загрузку для остальных, результат сохраняется в кэше
+def test_cancelled_waiter_does_not_cancel_load():
+    async def scenario():
+        cache, loader = ResultCache(ttl=60), Loader()
+        cancelled = asyncio.ensure_future(cache.get('root', loader))
+        other = asyncio.ensure_future(cache.get('root', loader))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await asyncio.sleep(0)
+        assert cancelled.cancelled()
+
+        loader.release.set()
+        assert await other == 'value-1'
+        assert await cache.get('root', loader) == 'value-1'
+        assert loader.calls == 1
+
+    asyncio.run(scenario())
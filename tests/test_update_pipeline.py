@@ -0,0 +1,124 @@
+import json
+import types
+import random
+import asyncio
+import logging
+
+from update_pipeline import UpdatePipeline, start_webhook
+
+
+# Приложение, которое обрабатывает update со случайной задержкой и записывает порядок начала и конца обработки
+class RecordingApplication:
+    def __init__(self, seed=0, fail=()):
+        self.random = random.Random(seed)
+        self.fail = set(fail)
+        self.events = []
+        self.running = 0
+        self.max_running = 0
+
+    async def process_update(self, update):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        self.events.append(('start', update.effective_chat.id, update.update_id))
+        try:
+            await asyncio.sleep(self.random.uniform(0, 0.01))
+            if update.update_id in self.fail:
+                raise RuntimeError('ошибка обработчика')
+        finally:
+            self.running -= 1
+            self.events.append(('end', update.effective_chat.id, update.update_id))
+
+
+def make_update(update_id, chat_id):
+    return types.SimpleNamespace(update_id=update_id, effective_chat=types.SimpleNamespace(id=chat_id))
+
+
+def test_updates_of_one_chat_are_processed_in_order():
+    application = RecordingApplication(fail={3, 7})
+    updates = [make_update(update_id, chat_id=update_id % 4) for update_id in range(40)]
+
+    async def scenario():
+        pipeline = UpdatePipeline(application, max_concurrency=3)
+        for update in updates:
+            await pipeline.submit(update)
+        await pipeline.join()
+        return pipeline
+
+    pipeline = asyncio.run(scenario())
+    assert pipeline.processed == 38 and pipeline.failed == 2 and pipeline.pending == 0
+
+    for chat_id in range(4):
+        events = [(kind, update_id) for kind, chat, update_id in application.events if chat == chat_id]
+        expected = [update.update_id for update in updates if update.effective_chat.id == chat_id]
+        # Следующий update чата начинается только после окончания предыдущего, даже если тот завершился ошибкой
+        assert events == [(kind, update_id) for update_id in expected for kind in ('start', 'end')]
+
+    # Разные чаты обрабатываются параллельно, но не больше max_concurrency одновременно
+    assert 1 < application.max_running <= 3
+
+
+# Пока в обработке max_pending update, submit ждёт освобождения места
+def test_submit_waits_when_pipeline_is_full():
+    release = asyncio.Event()
+
+    class BlockingApplication:
+        async def process_update(self, update):
+            await release.wait()
+
+    async def scenario():
+        pipeline = UpdatePipeline(BlockingApplication(), max_concurrency=2, max_pending=2)
+        await pipeline.submit(make_update(1, 1))
+        await pipeline.submit(make_update(2, 2))
+        third = asyncio.ensure_future(pipeline.submit(make_update(3, 3)))
+        await asyncio.sleep(0.05)
+        assert not third.done()
+        release.set()
+        await third
+        await pipeline.join()
+        assert pipeline.processed == 3
+
+    asyncio.run(scenario())
+
+
+# Функция для отправки одного POST-запроса на локальный webhook; возвращает код ответа
+async def post(port, body, headers=None):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    head = f'POST /hook HTTP/1.1\r\nContent-Length: {len(body)}\r\nConnection: close\r\n'
+    head += ''.join(f'{name}: {value}\r\n' for name, value in (headers or {}).items())
+    writer.write(head.encode('latin-1') + b'\r\n' + body)
+    status = int((await reader.readline()).split()[1])
+    writer.close()
+    await writer.wait_closed()
+    return status
+
+
+# Webhook принимает только JSON-объект update с правильным секретным токеном
+def test_webhook_rejects_wrong_token_and_non_object_body():
+    submitted = []
+
+    async def set_webhook(**kwargs):
+        return True
+
+    async def submit(update):
+        submitted.append(update.update_id)
+
+    async def scenario():
+        application = types.SimpleNamespace(bot=types.SimpleNamespace(set_webhook=set_webhook))
+        pipeline = types.SimpleNamespace(submit=submit)
+        server = await start_webhook(application, pipeline, logging.getLogger('test'), [], 'https://example.org/hook',
+                                     '127.0.0.1', 0, '/hook', secret_token='secret')
+        port = server.sockets[0].getsockname()[1]
+        update = json.dumps({'update_id': 1}).encode()
+        try:
+            assert await post(port, update) == 403
+            assert await post(port, update, {'X-Telegram-Bot-Api-Secret-Token': 'secreT'}) == 403
+            assert await post(port, update, {'X-Telegram-Bot-Api-Secret-Token': 'secret\xe9'}) == 403
+            for body in (b'[1, 2]', b'42', b'null', b'{}', b'{not json'):
+                assert await post(port, body, {'X-Telegram-Bot-Api-Secret-Token': 'secret'}) == 400
+            assert await post(port, update, {'X-Telegram-Bot-Api-Secret-Token': 'secret'}) == 200
+        finally:
+            server.close()
+            await server.wait_closed()
+        assert submitted == [1]
+
+    asyncio.run(scenario())
@@ -0,0 +1,45 @@
+import os
+import time
+import zipfile
+
+import pytest
+
+from backup_catalog import BackupCatalog
+from backup_records import BackupRecord
+from zip_verifier import ZipVerifier, VERIFIED, UNVERIFIED, CORRUPT
+
+
+# Функция для ожидания, пока фоновая проверка не выдаст итоговый статус
+def wait_status(verifier, info, timeout=5):
+    deadline = time.monotonic() + timeout
+    while True:
+        status = verifier.status(info, stat_file=True)
+        if status != UNVERIFIED:
+            return status
+        if time.monotonic() > deadline:
+            pytest.fail(f'{info.path} не проверен за {timeout} с')
+        time.sleep(0.02)
+
+
+# Время из имени файла не совпадает с mtime: результат ищется по настоящим размеру и mtime,
+# поэтому архив, перезаписанный под тем же именем, проверяется заново
+def test_filename_timestamp_uses_real_stat_for_cache_key(workdir):
+    path = str(workdir / 'SRV1-db1_01-01-2026_10_00_00.zip')
+    with zipfile.ZipFile(path, 'w') as archive:
+        archive.writestr('db.bak', b'backup' * 1000)
+    info = BackupRecord(os.path.basename(path), '01-01-2026', 1767250800.0, None, path)
+
+    catalog = BackupCatalog(str(workdir / 'catalog.db'))
+    verifier = ZipVerifier(catalog)
+    try:
+        assert wait_status(verifier, info) == VERIFIED
+        stat = os.stat(path)
+
+        with open(path, 'r+b') as f:
+            f.seek(-10, os.SEEK_END)
+            f.write(b'\xff' * 10)
+        os.utime(path, (stat.st_mtime + 60, stat.st_mtime + 60))
+        assert wait_status(verifier, info) == CORRUPT
+    finally:
+        verifier.shutdown()
+        catalog.close()
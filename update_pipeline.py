@@ -0,0 +1,129 @@
+import hmac
+import json
+import random
+import asyncio
+
+from http_server import start_http_server
+
+# Очередь обработки входящих update от Telegram.
+# Update разных чатов обрабатываются параллельно (не больше max_concurrency одновременно),
+# update одного чата - строго по порядку поступления.
+
+
+class UpdatePipeline:
+    def __init__(self, application, max_concurrency=8, max_pending=1000, logger=None):
+        self.application = application
+        self.logger = logger
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._pending = asyncio.Semaphore(max_pending)
+        self._chat_tails = {}  # chat_id -> задача последнего update чата
+        self._tasks = set()
+        self.processed = 0
+        self.failed = 0
+
+    # Функция для постановки update в обработку
+    # Если в обработке уже max_pending update, ждёт освобождения места (обратное давление на получение update)
+    async def submit(self, update):
+        await self._pending.acquire()
+
+        chat = getattr(update, 'effective_chat', None)
+        chat_id = chat.id if chat else None
+        previous = self._chat_tails.get(chat_id)
+        task = asyncio.create_task(self._process(update, previous))
+        self._chat_tails[chat_id] = task
+        self._tasks.add(task)
+        task.add_done_callback(lambda done: self._finish(chat_id, done))
+        return task
+
+    async def _process(self, update, previous):
+        # Порядок внутри чата: ждём завершения предыдущего update этого чата
+        if previous is not None and not previous.done():
+            await asyncio.wait([previous])
+        async with self._semaphore:
+            try:
+                await self.application.process_update(update)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                if self.logger:
+                    self.logger.exception(f"Ошибка обработки update {getattr(update, 'update_id', None)}: {e}")
+
+    def _finish(self, chat_id, task):
+        self._tasks.discard(task)
+        if self._chat_tails.get(chat_id) is task:
+            del self._chat_tails[chat_id]
+        self._pending.release()
+
+    # Функция для ожидания завершения всех поставленных update
+    async def join(self):
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    @property
+    def pending(self):
+        return len(self._tasks)
+
+
+# Функция для вычисления задержки перед повторной попыткой (экспоненциальная, со случайным разбросом)
+def backoff_delay(attempt, base=1.0, maximum=60.0):
+    delay = min(maximum, base * (2 ** attempt))
+    return delay * random.uniform(0.5, 1.0)
+
+
+# Асинхронная функция для получения update методом long polling
+# При сетевых ошибках повторяет запрос с экспоненциальной задержкой, без блокировки цикла событий
+async def poll_updates(application, pipeline, logger, allowed_updates, stop_event=None, timeout=20, limit=100):
+    from telegram.error import NetworkError
+
+    offset = 0
+    attempt = 0
+    while stop_event is None or not stop_event.is_set():
+        try:
+            updates = await application.bot.get_updates(offset=offset, timeout=timeout, limit=limit, allowed_updates=allowed_updates)
+            attempt = 0
+            for update in updates:
+                offset = update.update_id + 1
+                await pipeline.submit(update)
+        except NetworkError as e:
+            delay = backoff_delay(attempt)
+            attempt += 1
+            logger.error(f"Произошла ошибка сети: {e}. Повтор через {delay:.1f} с.")
+            await asyncio.sleep(delay)
+        except Exception as e:
+            delay = backoff_delay(attempt)
+            attempt += 1
+            logger.exception(f"Unexpected error: {e}")
+            await asyncio.sleep(delay)
+
+
+# Асинхронная функция для запуска приёма update через webhook
+# Telegram отправляет update на webhook_url, локальный HTTP-сервер принимает их на listen:port/path
+async def start_webhook(application, pipeline, logger, allowed_updates, webhook_url, listen, port, path, secret_token=None):
+    from telegram import Update
+
+    async def handle(request):
+        if request.path != path:
+            return 404, b'', 'text/plain; charset=utf-8'
+        if request.method != 'POST':
+            return 405, b'', 'text/plain; charset=utf-8'
+        # Сравнение за постоянное время: по времени ответа нельзя подобрать токен посимвольно
+        # (заголовки прочитаны как latin-1, поэтому так же переводятся обратно в байты)
+        received = request.headers.get('x-telegram-bot-api-secret-token', '').encode('latin-1')
+        if secret_token and not hmac.compare_digest(received, secret_token.encode('utf-8')):
+            return 403, b'', 'text/plain; charset=utf-8'
+        try:
+            data = json.loads(request.body)
+        except ValueError:
+            return 400, b'', 'text/plain; charset=utf-8'
+        # Update - всегда непустой JSON-объект; список, число или null отклоняются до разбора
+        update = Update.de_json(data, application.bot) if isinstance(data, dict) else None
+        if update is None:
+            return 400, b'', 'text/plain; charset=utf-8'
+        # Ответ Telegram отправляется сразу, обработка идёт в очереди
+        await pipeline.submit(update)
+        return 200, b'', 'text/plain; charset=utf-8'
+
+    server = await start_http_server(handle, listen, port, logger)
+    await application.bot.set_webhook(url=webhook_url, allowed_updates=allowed_updates, secret_token=secret_token or None)
+    logger.info(f"Webhook {webhook_url} принимается на {listen}:{port}{path}")
+    return server
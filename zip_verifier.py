@@ -0,0 +1,173 @@
+import os
+import time
+import zipfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Фоновая проверка целостности ZIP-архивов бэкапов.
+# Проверяется центральный каталог архива и CRC каждого файла внутри (чтение потоком, без распаковки на диск).
+# Скорость чтения с диска ограничивается, чтобы проверка не мешала заданиям резервного копирования.
+# Результат запоминается по (путь, размер, mtime): каждый файл проверяется один раз.
+
+VERIFIED = 'verified'
+UNVERIFIED = 'unverified'
+CORRUPT = 'corrupt'
+
+CHUNK_SIZE = 1024 * 1024
+
+
+# Ограничение скорости чтения (байт в секунду), общее для всех потоков проверки
+class BandwidthLimiter:
+    def __init__(self, bytes_per_second):
+        self.bytes_per_second = bytes_per_second
+        self._lock = threading.Lock()
+        self._next_time = time.monotonic()
+
+    def consume(self, size):
+        if not self.bytes_per_second:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_time)
+            self._next_time = start + size / self.bytes_per_second
+        delay = start - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+# Файл, чтение из которого учитывается в ограничении скорости
+class ThrottledFile:
+    def __init__(self, fileobj, limiter):
+        self._file = fileobj
+        self._limiter = limiter
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = self._file.read(size)
+        self.bytes_read += len(data)
+        if self._limiter is not None:
+            self._limiter.consume(len(data))
+        return data
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        return self._file.seek(offset, whence)
+
+    def tell(self):
+        return self._file.tell()
+
+    def seekable(self):
+        return True
+
+    def close(self):
+        self._file.close()
+
+
+# Функция для проверки одного архива
+# Возвращает (статус, описание ошибки, прочитано байт)
+def verify_zip(path, limiter=None):
+    with open(path, 'rb') as raw:
+        fileobj = ThrottledFile(raw, limiter)
+        try:
+            with zipfile.ZipFile(fileobj) as archive:
+                for member in archive.infolist():
+                    if member.is_dir():
+                        continue
+                    # Зашифрованные файлы без пароля не прочитать: для них проверяется только запись в каталоге
+                    if member.flag_bits & 0x1:
+                        continue
+                    # ZipExtFile сверяет CRC после чтения последнего блока и выбрасывает BadZipFile при несовпадении
+                    with archive.open(member) as stream:
+                        while stream.read(CHUNK_SIZE):
+                            pass
+        except (zipfile.BadZipFile, zipfile.LargeZipFile, EOFError, NotImplementedError, ValueError) as e:
+            return CORRUPT, str(e) or e.__class__.__name__, fileobj.bytes_read
+        except Exception as e:
+            # zlib.error и подобные - повреждённые данные внутри архива
+            if e.__class__.__module__ == 'zlib':
+                return CORRUPT, str(e), fileobj.bytes_read
+            raise
+    return VERIFIED, None, fileobj.bytes_read
+
+
+class ZipVerifier:
+    # background=False - только сохранённые результаты, новые архивы не проверяются (отчёты без бота не ждут проверки)
+    def __init__(self, catalog, workers=1, bandwidth=None, logger=None, background=True):
+        self.catalog = catalog
+        self.logger = logger
+        self.limiter = BandwidthLimiter(bandwidth) if bandwidth else None
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='zip-verify') if background else None
+        self._lock = threading.Lock()
+        self._results = catalog.verifications()  # path -> (size, mtime, status, error)
+        self._pending = set()
+        self.verified = 0
+        self.corrupt = 0
+        self.bytes_read = 0
+
+    # Функция для получения статуса бэкапа; непроверенные файлы ставятся в очередь проверки
+    # stat_file - размер и mtime для ключа берутся из os.stat, а не из info
+    # (когда время бэкапа определяется по имени файла, в info нет настоящих значений)
+    def status(self, info, stat_file=False):
+        path = info.get('path')
+        if not path:
+            return None
+        if stat_file:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                return UNVERIFIED
+            key = (path, stat.st_size, stat.st_mtime)
+        else:
+            key = (path, info.get('size'), info.get('mtime'))
+        with self._lock:
+            result = self._results.get(path)
+            if result is not None and (result[0], result[1]) == key[1:]:
+                return result[2]
+            if self._executor is not None and key not in self._pending:
+                self._pending.add(key)
+                self._executor.submit(self._verify, key)
+        return UNVERIFIED
+
+    # Функция для отметки статуса у последних бэкапов снимка (info['verification'])
+    def annotate(self, backups, stat_files=False):
+        for info in backups.values():
+            status = self.status(info, stat_files)
+            if status is not None:
+                info['verification'] = status
+
+    def _verify(self, key):
+        path, size, mtime = key
+        try:
+            status, error, bytes_read = verify_zip(path, self.limiter)
+        except OSError as e:
+            # Файл недоступен или удалён - оставляем непроверенным, повторим при следующем запросе
+            if self.logger:
+                self.logger.warning(f"Не удалось проверить архив {path}: {e}")
+            with self._lock:
+                self._pending.discard(key)
+            return
+        except Exception as e:
+            if self.logger:
+                self.logger.exception(f"Ошибка проверки архива {path}: {e}")
+            with self._lock:
+                self._pending.discard(key)
+            return
+
+        if status == CORRUPT and self.logger:
+            self.logger.error(f"Архив {path} повреждён: {error}")
+        self.catalog.store_verification(path, size, mtime, status, error)
+        with self._lock:
+            self._results[path] = (size, mtime, status, error)
+            self._pending.discard(key)
+            self.bytes_read += bytes_read
+            if status == CORRUPT:
+                self.corrupt += 1
+            else:
+                self.verified += 1
+
+    @property
+    def pending(self):
+        return len(self._pending)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)